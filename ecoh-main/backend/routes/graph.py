@@ -1,50 +1,61 @@
-from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from typing import Optional, List
 import logging
 import json
 import asyncio
 
 from models.wp_models import WPRestResponse
+from services.graph_clustering import CLUSTER_MODES
+from services.graph_codec import GRAPH_BINARY_MEDIA_TYPE, encode_graph
+from services.spatial_index import box_planes, normalize_planes
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/graph", tags=["graph"])
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
-    
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
-    
-    async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients"""
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to WebSocket: {str(e)}")
-
-manager = ConnectionManager()
+def wp_envelope(data_json: bytes) -> bytes:
+    """Wrap already-serialized JSON data in the WPRestResponse envelope"""
+    return b'{"success":true,"data":' + data_json + b',"message":"","total":null,"page":null,"per_page":null}'
 
-def setup_routes(db, sync_engine, graph_builder):
+def setup_routes(db, sync_engine, graph_builder, graph_updates):
     """Setup routes with dependencies"""
     
     @router.get("/complete", response_model=WPRestResponse)
-    async def get_complete_graph():
-        """Get complete graph structure for 3D visualization"""
+    async def get_complete_graph(request: Request):
+        """
+        Get complete graph structure for 3D visualization
+        
+        The body is the pre-serialized canonical snapshot, so identical catalog
+        states produce byte-identical responses; clients and proxies can
+        revalidate with If-None-Match and receive 304 when nothing changed.
+        
+        Clients sending Accept: application/vnd.ecoh.graph+binary receive the
+        compact binary encoding instead (no WPRestResponse envelope, no node
+        metadata; fetch it from /graph/node/{id}).
+        """
         try:
-            graph = await graph_builder.build_complete_graph()
-            return WPRestResponse(
-                success=True,
-                data=graph
+            binary = GRAPH_BINARY_MEDIA_TYPE in request.headers.get("accept", "")
+            if binary:
+                payload, etag = await graph_builder.get_complete_binary()
+            else:
+                payload, etag = await graph_builder.get_complete_payload()
+            headers = {
+                "ETag": etag,
+                "Cache-Control": "no-cache",
+                "Vary": "Accept",
+                "X-Layout-Version": graph_builder.layout.version
+            }
+            
+            if etag in request.headers.get("if-none-match", ""):
+                return Response(status_code=304, headers=headers)
+            
+            if binary:
+                return Response(content=payload, media_type=GRAPH_BINARY_MEDIA_TYPE, headers=headers)
+            
+            return Response(
+                content=wp_envelope(payload),
+                media_type="application/json",
+                headers=headers
             )
         except Exception as e:
             logger.error(f"Error building graph: {str(e)}")
@@ -68,14 +79,86 @@ def setup_routes(db, sync_engine, graph_builder):
             logger.error(f"Error fetching node {node_id}: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
     
+    @router.get("/neighborhood/{node_id}", response_model=WPRestResponse)
+    async def get_neighborhood(
+        node_id: str,
+        depth: int = Query(1, ge=1, le=4, description="Number of hops"),
+        types: Optional[str] = Query(None, description="Comma-separated relationship types"),
+        limit: int = Query(200, ge=1, le=2000, description="Maximum number of nodes")
+    ):
+        """Get the laid-out k-hop neighbourhood of a node"""
+        try:
+            relationship_types = [t.strip() for t in types.split(',') if t.strip()] if types else None
+            subgraph = await graph_builder.get_neighborhood(node_id, depth, relationship_types, limit)
+            if subgraph is None:
+                raise HTTPException(status_code=404, detail="Node not found")
+            
+            return WPRestResponse(
+                success=True,
+                data=subgraph,
+                total=subgraph['stats']['total_nodes']
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching neighborhood of {node_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    @router.get("/viewport", response_model=WPRestResponse)
+    async def get_viewport(
+        request: Request,
+        bbox: Optional[str] = Query(None, description="min_x,min_y,min_z,max_x,max_y,max_z"),
+        frustum: Optional[str] = Query(None, description="Comma-separated a,b,c,d plane groups (THREE.Frustum planes)"),
+        limit: Optional[int] = Query(None, ge=1, le=100000, description="Keep only the most connected nodes"),
+        min_size: Optional[float] = Query(None, ge=0, description="Skip nodes smaller than this")
+    ):
+        """
+        Get the nodes inside a bounding box or view frustum and the edges between them
+        
+        Accepts the same binary transport as /complete.
+        """
+        try:
+            if (bbox is None) == (frustum is None):
+                raise HTTPException(status_code=400, detail="Provide exactly one of bbox or frustum")
+            
+            try:
+                if bbox is not None:
+                    values = [float(v) for v in bbox.split(',')]
+                    if len(values) != 6:
+                        raise ValueError("bbox needs six numbers")
+                    planes = box_planes(values[:3], values[3:])
+                else:
+                    planes = normalize_planes([float(v) for v in frustum.split(',')])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            subgraph = await graph_builder.get_viewport(planes, limit, min_size)
+            
+            if GRAPH_BINARY_MEDIA_TYPE in request.headers.get("accept", ""):
+                payload = await asyncio.to_thread(encode_graph, subgraph)
+                return Response(content=payload, media_type=GRAPH_BINARY_MEDIA_TYPE, headers={"Vary": "Accept"})
+            
+            return WPRestResponse(
+                success=True,
+                data=subgraph,
+                total=subgraph['stats']['matched_nodes']
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error querying viewport: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
     @router.get("/clusters", response_model=WPRestResponse)
-    async def get_clusters():
+    async def get_clusters(
+        mode: str = Query("type", pattern=f"^({'|'.join(CLUSTER_MODES)})$", description="Group by node type or graph community")
+    ):
         """Get graph clusters for filtering"""
         try:
-            graph = await graph_builder.build_complete_graph()
+            clusters = await graph_builder.get_clusters(mode)
             return WPRestResponse(
                 success=True,
-                data=graph['clusters']
+                data=clusters
             )
         except Exception as e:
             logger.error(f"Error fetching clusters: {str(e)}")
@@ -83,36 +166,29 @@ def setup_routes(db, sync_engine, graph_builder):
     
     @router.websocket("/ws")
     async def websocket_endpoint(websocket: WebSocket):
-        """WebSocket for real-time graph updates"""
-        await manager.connect(websocket)
+        """
+        WebSocket for real-time graph updates
+        
+        Outgoing messages (graph_update deltas and pongs) go through the
+        connection's bounded send queue; this loop only reads.
+        """
+        connection = await graph_updates.connect(websocket)
         try:
             while True:
                 # Wait for messages from client
                 data = await websocket.receive_text()
                 
                 # Echo back for now (in production, handle specific commands)
-                await websocket.send_json({
+                graph_updates.send(connection, {
                     "type": "pong",
                     "timestamp": datetime.now().isoformat()
                 })
         except WebSocketDisconnect:
-            manager.disconnect(websocket)
+            pass
         except Exception as e:
             logger.error(f"WebSocket error: {str(e)}")
-            manager.disconnect(websocket)
-    
-    # Helper function to broadcast graph updates
-    async def broadcast_graph_update(update_type: str, data: dict):
-        """Broadcast graph updates to all connected clients"""
-        await manager.broadcast({
-            "type": "graph_update",
-            "update_type": update_type,
-            "data": data,
-            "timestamp": datetime.now().isoformat()
-        })
-    
-    # Store broadcast function for use in webhooks
-    router.broadcast_graph_update = broadcast_graph_update
+        finally:
+            graph_updates.disconnect(connection)
     
     return router
 
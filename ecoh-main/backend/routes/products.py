@@ -15,7 +15,7 @@ def setup_routes(db, sync_engine, graph_builder):
     @router.get("", response_model=WPRestResponse)
     async def get_products(
         status: Optional[str] = Query(None, description="Filter by status"),
-        category: Optional[str] = Query(None, description="Filter by category"),
+        category: Optional[str] = Query(None, description="Filter by category and its subcategories"),
         search: Optional[str] = Query(None, description="Search in SKU or title"),
         page: int = Query(1, ge=1),
         per_page: int = Query(20, ge=1, le=100)
@@ -27,7 +27,8 @@ def setup_routes(db, sync_engine, graph_builder):
             if status:
                 query['status'] = status
             if category:
-                query['categories'] = category
+                # One indexed $in over the category's subtree
+                query['categories'] = {'$in': await sync_engine.categories.subtree(category)}
             if search:
                 query['$or'] = [
                     {'sku': {'$regex': search, '$options': 'i'}},
@@ -105,25 +106,26 @@ def setup_routes(db, sync_engine, graph_builder):
     
     @router.get("/categories/list", response_model=WPRestResponse)
     async def get_categories():
-        """Get all categories"""
+        """
+        Get the category tree
+        
+        Served from the category index: categories come parents first, with
+        their materialized path, the products listing them (count) and the
+        distinct products in their whole subtree (total_count).
+        """
         try:
-            # Get unique categories from products
-            pipeline = [
-                {"$unwind": "$categories"},
-                {"$group": {
-                    "_id": "$categories",
-                    "count": {"$sum": 1}
-                }}
-            ]
-            
-            categories = await db.hemera_products.aggregate(pipeline).to_list(100)
+            categories = await sync_engine.categories.tree()
             
             return WPRestResponse(
                 success=True,
                 data=[{
-                    "slug": cat['_id'],
-                    "name": cat['_id'].replace('_', ' ').title(),
-                    "count": cat['count']
+                    "slug": cat['code'],
+                    "name": cat['name'],
+                    "parent": cat['parent'],
+                    "path": cat['path'],
+                    "depth": cat['depth'],
+                    "count": cat['count'],
+                    "total_count": cat['total_count']
                 } for cat in categories]
             )
         except Exception as e:
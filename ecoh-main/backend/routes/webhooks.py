@@ -1,7 +1,11 @@
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import asyncio
 import logging
-from datetime import datetime
+import os
+import socket
+import time
+from datetime import datetime, timedelta
 
 from models.unopim_models import SyncEvent
 from models.wp_models import WPRestResponse
@@ -10,7 +14,19 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
-def setup_routes(db, sync_engine, graph_builder, unopim_connector):
+SYNC_MODES = ("full", "incremental")
+
+# Position of the Unopim change outbox in db.cdc_state
+CDC_STATE_ID = "products"
+
+# Recorded as claimed_by on the sync logs this worker runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Manual, scheduled and change-feed syncs run one at a time, and webhook
+# product writes never interleave with them
+_sync_lock = asyncio.Lock()
+
+def setup_routes(db, sync_engine, graph_builder, unopim_connector, graph_updates):
     """Setup routes with dependencies"""
     
     @router.post("/unopim", response_model=WPRestResponse)
@@ -34,7 +50,8 @@ def setup_routes(db, sync_engine, graph_builder, unopim_connector):
                 db,
                 sync_engine,
                 graph_builder,
-                unopim_connector
+                unopim_connector,
+                graph_updates
             )
             
             return WPRestResponse(
@@ -46,22 +63,33 @@ def setup_routes(db, sync_engine, graph_builder, unopim_connector):
             raise HTTPException(status_code=500, detail=str(e))
     
     @router.post("/trigger-sync", response_model=WPRestResponse)
-    async def trigger_manual_sync(background_tasks: BackgroundTasks):
-        """Manually trigger full sync from Unopim"""
+    async def trigger_manual_sync(background_tasks: BackgroundTasks, mode: str = "full"):
+        """
+        Manually trigger a sync from Unopim
+        
+        mode=full re-reads the whole catalog; mode=incremental only reads
+        products modified after the watermark of the last successful sync.
+        """
         try:
-            logger.info("Manual sync triggered")
+            if mode not in SYNC_MODES:
+                raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SYNC_MODES)}")
+            
+            logger.info(f"Manual {mode} sync triggered")
             
             background_tasks.add_task(
-                perform_full_sync,
+                perform_sync,
                 db,
                 sync_engine,
-                unopim_connector
+                unopim_connector,
+                mode == "incremental"
             )
             
             return WPRestResponse(
                 success=True,
-                message="Full sync initiated"
+                message=f"{mode.capitalize()} sync initiated"
             )
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error triggering sync: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
@@ -87,7 +115,8 @@ def setup_routes(db, sync_engine, graph_builder, unopim_connector):
                     "stats": {
                         "total_products": total_products,
                         "active_products": active_products
-                    }
+                    },
+                    "extraction": unopim_connector.extraction_progress()
                 }
             )
         except Exception as e:
@@ -96,35 +125,79 @@ def setup_routes(db, sync_engine, graph_builder, unopim_connector):
     
     return router
 
+def publish_graph_delta(graph_updates, update_type: str, sku: str, delta: Optional[Dict[str, Any]]):
+    """
+    Push a node/edge delta to WebSocket viewers without waiting on them
+    
+    When the cached graph could not be patched (no delta), viewers are told
+    to refetch /graph/complete instead.
+    """
+    if delta is None:
+        graph_updates.publish_graph_update("graph_invalidated", {"sku": sku})
+        return
+    
+    if any(delta.values()):
+        graph_updates.publish_graph_update(update_type, {"sku": sku, **delta})
+
 async def process_webhook_event(
     event: SyncEvent,
     db,
     sync_engine,
     graph_builder,
-    unopim_connector
+    unopim_connector,
+    graph_updates
 ):
     """Process webhook event in background"""
+    started = time.perf_counter()
     try:
         if event.entity_type == "product":
+            # The product changed in Unopim: drop it from the lookup cache
+            unopim_connector.forget_product(event.entity_id)
             if event.event_type in ["create", "update"]:
-                # Fetch product data from Unopim
+                # Fetch product data from Unopim unless the event carries it
                 product_data = event.data
+                if not product_data.get('values'):
+                    product_data = await unopim_connector.fetch_product_by_id(event.entity_id)
+                    if product_data is None:
+                        raise ValueError(f"Product {event.entity_id} not found in Unopim")
                 
-                # Sync product
-                result = await sync_engine.sync_product(product_data)
+                # Register new attribute codes in the shared schema registry
+                await sync_engine.detect_schema_changes(product_data)
                 
-                # Rebuild graph (could be optimized to only update affected nodes)
-                # For now, we'll just log it
-                logger.info(f"Product {product_data.get('sku')} synced")
-                
-                # In production, broadcast to WebSocket clients
-                # await graph_router.broadcast_graph_update("product_updated", result)
+                # Sync product; never interleaved with a pipeline run, whose
+                # prefetched checksums would otherwise go stale
+                async with _sync_lock:
+                    base_generation = await graph_builder.current_generation()
+                    result = await sync_engine.sync_product(product_data)
+                    await sync_engine.schema.flush()
+                    
+                    # Patch the cached graph around the changed product only
+                    delta = await graph_builder.apply_product_update(result, base_generation)
+                publish_graph_delta(graph_updates, "product_updated", result['sku'], delta)
+                logger.info(f"Product {product_data.get('sku')} synced, changed: {result.get('changed_fields')}")
                 
             elif event.event_type == "delete":
                 # Mark as discontinued
-                await sync_engine.handle_discontinued_product(event.entity_id)
+                async with _sync_lock:
+                    base_generation = await graph_builder.current_generation()
+                    result = await sync_engine.handle_discontinued_product(event.entity_id)
+                    delta = await graph_builder.apply_product_update(result, base_generation) if result else None
+                if result:
+                    publish_graph_delta(graph_updates, "product_discontinued", result['sku'], delta)
                 logger.info(f"Product {event.entity_id} marked discontinued")
         
+        elif event.entity_type == "attribute":
+            # Attribute definitions changed in Unopim: reload them on next use
+            sync_engine.schema.invalidate()
+            await load_attribute_metadata(sync_engine, unopim_connector)
+            logger.info(f"Attribute {event.entity_id} changed, schema registry invalidated")
+        
+        elif event.entity_type == "category":
+            # The category tree changed in Unopim: rebuild paths and counts
+            await refresh_category_index(sync_engine, unopim_connector)
+        
+        sync_engine.metrics.record_webhook(event.entity_type, "success", time.perf_counter() - started)
+        
         # Log event
         await db.webhook_events.insert_one({
             "event_type": event.event_type,
@@ -136,6 +209,7 @@ async def process_webhook_event(
         
     except Exception as e:
         logger.error(f"Error processing webhook event: {str(e)}")
+        sync_engine.metrics.record_webhook(event.entity_type, "error", time.perf_counter() - started)
         # Log error
         await db.webhook_events.insert_one({
             "event_type": event.event_type,
@@ -146,47 +220,223 @@ async def process_webhook_event(
             "error": str(e)
         })
 
-async def perform_full_sync(db, sync_engine, unopim_connector):
-    """Perform full sync from Unopim"""
+async def find_sync_watermark(db) -> Optional[Dict[str, Any]]:
+    """Highest watermark recorded by a completed sync"""
+    last = await db.sync_logs.find_one(
+        {"status": "completed", "watermark": {"$ne": None}},
+        {"_id": 0, "watermark": 1},
+        sort=[("watermark.updated_at", -1), ("watermark.id", -1)]
+    )
+    return last['watermark'] if last else None
+
+async def load_attribute_metadata(sync_engine, unopim_connector):
+    """Feed Unopim attribute definitions to the engine's transform plans"""
     try:
-        start_time = datetime.now()
-        logger.info("Starting full sync")
-        
-        # Log sync start
-        sync_log_id = await db.sync_logs.insert_one({
-            "started_at": start_time.isoformat(),
-            "status": "running"
-        })
+        sync_engine.transform_plans.set_attributes(await unopim_connector.fetch_attributes())
+    except Exception as e:
+        # Plans fall back to the schema registry and heuristics
+        logger.error(f"Error loading attribute metadata: {str(e)}")
+
+async def refresh_category_index(sync_engine, unopim_connector, missing_only: bool = False):
+    """
+    Rebuild the category index from the Unopim tree and recount its products
+    
+    With missing_only (startup), an index already stored is kept as is.
+    """
+    try:
+        if missing_only and await sync_engine.categories.load():
+            return
+        await sync_engine.categories.refresh(await unopim_connector.fetch_categories())
+    except Exception as e:
+        # Filters and listings keep the previous index until the next refresh
+        logger.error(f"Error refreshing category index: {str(e)}")
+
+async def apply_product_changes(db, sync_engine, unopim_connector, upserted: List[int], deleted: List[int]):
+    """
+    Apply a batch of Unopim outbox changes (see ChangeFeed)
+    
+    Changed products are fetched with one keyed lookup and synced as one
+    batch; products deleted in Unopim, or gone by the time they are
+    fetched, are marked discontinued. Category counts follow the writes.
+    Runs under the sync lock so it never interleaves with a full or
+    incremental sync.
+    
+    Raises when any product failed to sync, so the feed keeps its
+    position and reads the whole batch again; products already written
+    are then found unchanged.
+    """
+    async with _sync_lock:
+        for product_id in upserted + deleted:
+            unopim_connector.forget_product(product_id)
+        products = await unopim_connector.fetch_products_by_ids(upserted)
+        gone = [product_id for product_id in upserted if product_id not in products]
         
-        # Fetch all products from Unopim
-        products = await unopim_connector.fetch_products()
+        failed = []
+        if products:
+            results = await sync_engine.sync_all_products(list(products.values()))
+            breakdown = results.pop('metrics', None)
+            failed = results['failed']
+            sync_engine.metrics.record_run("cdc", "failed" if failed else "completed", breakdown)
         
-        # Sync all products
-        results = await sync_engine.sync_all_products(products)
+        for product_id in deleted + gone:
+            await sync_engine.handle_discontinued_product(product_id)
         
-        # Update sync log
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
+        if failed:
+            raise RuntimeError(f"{len(failed)} changed products failed to sync: {failed}")
         
-        await db.sync_logs.update_one(
-            {"_id": sync_log_id.inserted_id},
-            {"$set": {
-                "completed_at": end_time.isoformat(),
-                "duration_seconds": duration,
-                "status": "completed",
-                "results": results
-            }}
+        logger.info(f"Applied Unopim changes: {len(products)} synced, {len(deleted) + len(gone)} discontinued")
+
+async def find_cdc_position(db) -> Optional[int]:
+    """Last applied position of the Unopim change outbox"""
+    state = await db.cdc_state.find_one({"_id": CDC_STATE_ID})
+    return state['position'] if state else None
+
+async def save_cdc_position(db, position: int):
+    await db.cdc_state.update_one(
+        {"_id": CDC_STATE_ID},
+        {"$set": {"position": position, "updated_at": datetime.now().isoformat()}},
+        upsert=True
+    )
+
+async def resume_interrupted_sync(db, sync_engine, unopim_connector, lease_seconds: float = 600):
+    """
+    Continue a sync left "running" by a restart or crash
+    
+    Running syncs refresh heartbeat_at on every checkpoint; a log whose
+    heartbeat is older than lease_seconds belongs to a worker that is gone.
+    Every worker calls this on startup, so the most recent such log is
+    claimed atomically and only the worker that wins the claim resumes it
+    from its last checkpoint (or from its start if none was saved); older
+    ones are marked interrupted.
+    """
+    expired = (datetime.now() - timedelta(seconds=lease_seconds)).isoformat()
+    orphaned = {"status": "running", "$or": [{"heartbeat_at": None}, {"heartbeat_at": {"$lt": expired}}]}
+    running = await db.sync_logs.find(orphaned, {"_id": 1}).sort("started_at", -1).to_list(None)
+    if not running:
+        return
+    
+    latest = await db.sync_logs.find_one_and_update(
+        {"_id": running[0]['_id'], **orphaned},
+        {"$set": {"claimed_by": WORKER_ID, "heartbeat_at": datetime.now().isoformat()}}
+    )
+    if latest is None:
+        logger.info("Interrupted sync already claimed by another worker")
+        return
+    
+    stale = [log['_id'] for log in running[1:]]
+    if stale:
+        await db.sync_logs.update_many(
+            {"_id": {"$in": stale}, **orphaned},
+            {"$set": {"status": "interrupted"}, "$unset": {"checkpoint": ""}}
         )
-        
-        logger.info(f"Full sync completed in {duration}s: {results}")
-        
-    except Exception as e:
-        logger.error(f"Error during full sync: {str(e)}")
-        # Update sync log with error
-        await db.sync_logs.update_one(
-            {"_id": sync_log_id.inserted_id},
-            {"$set": {
-                "status": "failed",
-                "error": str(e)
-            }}
-        )
\ No newline at end of file
+    
+    logger.info(f"Resuming interrupted sync started at {latest.get('started_at')}")
+    await perform_sync(db, sync_engine, unopim_connector, latest.get('mode') == "incremental", resume_log=latest)
+
+async def perform_sync(db, sync_engine, unopim_connector, incremental: bool = False,
+                       resume_log: Optional[Dict[str, Any]] = None):
+    """
+    Perform a full or incremental sync from Unopim
+    
+    Every run that finishes without product errors stores the highest
+    (updated_at, id) it read as its watermark, in the same update that
+    marks the log completed. Incremental runs re-read from a safety margin
+    before the highest stored watermark (see UopimConnector.watermark_since),
+    so rows committed late or within the watermark's second are not
+    skipped; stored checksums make those re-reads cheap. Runs with errors
+    keep the previous watermark so failed products are read again.
+    
+    While running, the log holds a checkpoint (keyset cursor and counters
+    of the committed batches) and the heartbeat of the worker running it.
+    Passing that log as resume_log continues the run after the cursor
+    instead of starting over.
+    
+    With more than one extraction shard configured, products are read by
+    concurrent id ranges (iter_products_sharded). Those pages are not in
+    keyset order, so such runs keep only the heartbeat: an interrupted run
+    is restarted from where it began.
+    
+    Completed logs also keep the per-stage timings of the run in 'metrics'.
+    Full runs rebuild the category index once they complete; incremental
+    runs adjust its counts as products are written.
+    """
+    mode = "incremental" if incremental else "full"
+    sync_log_id = resume_log['_id'] if resume_log else None
+    async with _sync_lock:
+        try:
+            start_time = datetime.now()
+            if resume_log:
+                watermark = resume_log.get('since')
+                checkpoint = resume_log.get('checkpoint')
+            else:
+                watermark = await find_sync_watermark(db) if incremental else None
+                checkpoint = None
+                logger.info(f"Starting {mode} sync" + (f" after {watermark}" if watermark else ""))
+                
+                # Log sync start
+                inserted = await db.sync_logs.insert_one({
+                    "started_at": start_time.isoformat(),
+                    "status": "running",
+                    "mode": mode,
+                    "since": watermark,
+                    "claimed_by": WORKER_ID,
+                    "heartbeat_at": start_time.isoformat()
+                })
+                sync_log_id = inserted.inserted_id
+            
+            # Stream products from Unopim page by page into the sync pipeline
+            cursor = (checkpoint or {}).get('cursor')
+            after = (cursor['updated_at'], cursor['id']) if cursor else None
+            since = unopim_connector.watermark_since(watermark) if watermark and not cursor else None
+            sharded = unopim_connector.extract_shards > 1 and not checkpoint
+            
+            async def save_checkpoint(state: Dict[str, Any]):
+                update = {"heartbeat_at": datetime.now().isoformat()}
+                if not sharded:
+                    update["checkpoint"] = {**state, "saved_at": update["heartbeat_at"]}
+                await db.sync_logs.update_one({"_id": sync_log_id}, {"$set": update})
+            
+            if sharded:
+                products = unopim_connector.iter_products_sharded(sync_engine.batch_size, since=since, after=after)
+            else:
+                products = unopim_connector.iter_products(sync_engine.batch_size, since=since, after=after)
+            results = await sync_engine.sync_all_products(
+                products,
+                resume=checkpoint,
+                on_checkpoint=save_checkpoint
+            )
+            
+            # Update sync log
+            end_time = datetime.now()
+            duration = (end_time - start_time).total_seconds()
+            breakdown = results.pop('metrics', None)
+            sync_engine.metrics.record_run(mode, "completed", breakdown)
+            if not incremental:
+                await refresh_category_index(sync_engine, unopim_connector)
+            
+            await db.sync_logs.update_one(
+                {"_id": sync_log_id},
+                {
+                    "$set": {
+                        "completed_at": end_time.isoformat(),
+                        "duration_seconds": duration,
+                        "status": "completed",
+                        "results": results,
+                        "metrics": breakdown,
+                        "watermark": None if results['errors'] else results.get('watermark')
+                    },
+                    "$unset": {"checkpoint": ""}
+                }
+            )
+            
+            logger.info(f"{mode.capitalize()} sync completed in {duration}s: {results}")
+            
+        except Exception as e:
+            logger.error(f"Error during {mode} sync: {str(e)}")
+            sync_engine.metrics.record_run(mode, "failed")
+            # Update sync log with error
+            failure = {"status": "failed", "error": str(e)}
+            if sync_log_id is not None:
+                await db.sync_logs.update_one({"_id": sync_log_id}, {"$set": failure})
+            else:
+                await db.sync_logs.insert_one({"started_at": datetime.now().isoformat(), "mode": mode, **failure})
\ No newline at end of file
@@ -38,6 +38,9 @@ async def seed_database():
         await db.acf_schema.delete_many({})
         await db.webhook_events.delete_many({})
         await db.sync_logs.delete_many({})
+        await db.catalog_state.delete_many({})
+        await db.graph_snapshots.delete_many({})
+        await db.category_index.delete_many({})
         
         # Initialize services
         unopim_connector = UopimConnector()
@@ -2,6 +2,7 @@ from fastapi import FastAPI, APIRouter
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
 from pathlib import Path
@@ -11,12 +12,17 @@ import uuid
 from datetime import datetime, timezone
 
 # Import services
-from services.unopim_connector import UopimConnector
+from services.unopim_connector import UopimConnector, db_config_from_env
 from services.sync_engine import SyncEngine
+from services.schema_registry import SchemaRegistry
 from services.graph_builder import GraphBuilder
+from services.realtime import GraphUpdateHub
+from services.sync_scheduler import SyncScheduler
+from services.sync_metrics import SyncMetrics
+from services.change_feed import ChangeFeed
 
 # Import routes
-from routes import products, graph, webhooks, topicos
+from routes import products, graph, webhooks, topicos, metrics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -27,9 +33,50 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Initialize services
-unopim_connector = UopimConnector()
-sync_engine = SyncEngine(db)
-graph_builder = GraphBuilder(db)
+# Unopim database when UNOPIM_DB_TYPE is set, mock data otherwise
+unopim_connector = UopimConnector(db_config_from_env())
+schema_registry = SchemaRegistry(db)
+sync_metrics = SyncMetrics()
+sync_engine = SyncEngine(
+    db,
+    batch_size=int(os.environ.get('SYNC_BATCH_SIZE', 500)),
+    schema_registry=schema_registry,
+    checksum_workers=int(os.environ.get('SYNC_CHECKSUM_WORKERS', 2)),
+    transform_workers=int(os.environ.get('SYNC_TRANSFORM_WORKERS', 2)),
+    write_workers=int(os.environ.get('SYNC_WRITE_WORKERS', 2)),
+    db_concurrency=int(os.environ.get('SYNC_DB_CONCURRENCY', 4)),
+    metrics=sync_metrics
+)
+layout_seed = os.environ.get('GRAPH_LAYOUT_SEED', '0')
+graph_builder = GraphBuilder(
+    db,
+    layout_strategy=os.environ.get('GRAPH_LAYOUT_STRATEGY', 'auto'),
+    theta=float(os.environ.get('GRAPH_LAYOUT_THETA', 0.8)),
+    barnes_hut_threshold=int(os.environ.get('GRAPH_BARNES_HUT_THRESHOLD', 1500)),
+    layout_seed=int(layout_seed) if layout_seed else None
+)
+graph_updates = GraphUpdateHub(
+    queue_size=int(os.environ.get('GRAPH_WS_QUEUE_SIZE', 64)),
+    send_timeout=float(os.environ.get('GRAPH_WS_SEND_TIMEOUT', 5.0))
+)
+# A running sync whose heartbeat is older than this is resumed by another worker
+sync_lease_seconds = float(os.environ.get('SYNC_LEASE_SECONDS', 600))
+# Periodic reconciliation; an interval of 0 disables it
+sync_schedule_mode = os.environ.get('SYNC_SCHEDULE_MODE', 'incremental')
+sync_scheduler = SyncScheduler(
+    lambda: webhooks.perform_sync(db, sync_engine, unopim_connector, incremental=sync_schedule_mode == 'incremental'),
+    interval=float(os.environ.get('SYNC_SCHEDULE_INTERVAL', 0))
+)
+# Tails the Unopim change outbox; an interval of 0 disables it
+change_feed = ChangeFeed(
+    unopim_connector,
+    lambda upserted, deleted: webhooks.apply_product_changes(db, sync_engine, unopim_connector, upserted, deleted),
+    load_position=lambda: webhooks.find_cdc_position(db),
+    save_position=lambda position: webhooks.save_cdc_position(db, position),
+    batch_size=int(os.environ.get('UNOPIM_CDC_BATCH_SIZE', 500)),
+    poll_interval=float(os.environ.get('UNOPIM_CDC_INTERVAL', 0))
+)
+sync_resume_task = None
 
 # Create the main app without a prefix
 app = FastAPI(
@@ -62,7 +109,8 @@ async def root():
         "endpoints": {
             "products": "/api/products",
             "graph": "/api/graph",
-            "webhooks": "/api/webhooks"
+            "webhooks": "/api/webhooks",
+            "metrics": "/api/metrics"
         }
     }
 
@@ -92,15 +140,17 @@ async def get_status_checks():
 
 # Setup feature routes with dependencies
 products_router = products.setup_routes(db, sync_engine, graph_builder)
-graph_router = graph.setup_routes(db, sync_engine, graph_builder)
-webhooks_router = webhooks.setup_routes(db, sync_engine, graph_builder, unopim_connector)
+graph_router = graph.setup_routes(db, sync_engine, graph_builder, graph_updates)
+webhooks_router = webhooks.setup_routes(db, sync_engine, graph_builder, unopim_connector, graph_updates)
 topicos_router = topicos.setup_routes(db, sync_engine, graph_builder)
+metrics_router = metrics.setup_routes(sync_metrics)
 
 # Include all routers
 api_router.include_router(products_router)
 api_router.include_router(graph_router)
 api_router.include_router(webhooks_router)
 api_router.include_router(topicos_router)
+api_router.include_router(metrics_router)
 
 # Include the main router in the app
 app.include_router(api_router)
@@ -120,6 +170,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_background_syncs():
+    global sync_resume_task
+    await unopim_connector.connect()
+    await webhooks.load_attribute_metadata(sync_engine, unopim_connector)
+    # Build the category index on first start; syncs keep it current
+    await webhooks.refresh_category_index(sync_engine, unopim_connector, missing_only=True)
+    # A sync interrupted by a restart continues from its last checkpoint
+    sync_resume_task = asyncio.create_task(
+        webhooks.resume_interrupted_sync(db, sync_engine, unopim_connector, lease_seconds=sync_lease_seconds)
+    )
+    sync_scheduler.start()
+    change_feed.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await sync_scheduler.stop()
+    await change_feed.stop()
+    await graph_updates.close()
+    await unopim_connector.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,139 @@
+from typing import Dict, Any, List, Optional, Callable, Iterable, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+EdgeKey = Tuple[str, str, str]
+
+
+def edge_key(edge: Dict[str, Any]) -> EdgeKey:
+    return (edge['source'], edge['target'], edge['relationship_type'])
+
+
+class AdjacencyIndex:
+    """
+    In-memory adjacency of the product graph
+
+    Holds every active product's graph node and outgoing edges, plus a
+    reverse index of incoming edges, so a k-hop neighbourhood only touches
+    the nodes it returns. Relationship targets that are not products become
+    virtual nodes on demand. The index is tagged with the catalog generation
+    it reflects; GraphBuilder rebuilds it from one projected scan when the
+    generation moved and patches it in place after single product syncs.
+    """
+
+    def __init__(self, virtual_node: Callable[[str, str], Dict[str, Any]]):
+        self.virtual_node = virtual_node
+        self.generation: Optional[int] = None
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.out_edges: Dict[str, List[Dict[str, Any]]] = {}
+        self.in_edges: Dict[str, Dict[EdgeKey, Dict[str, Any]]] = {}
+        self._incident: Dict[str, List[Dict[str, Any]]] = {}
+
+    def rebuild(self, products: Iterable[Dict[str, Any]], generation: int):
+        """Replace the whole index with the given active products"""
+        self.nodes = {}
+        self.out_edges = {}
+        self.in_edges = {}
+        self._incident = {}
+        for product in products:
+            self._add_product(product)
+        self.generation = generation
+        logger.info(f"Adjacency index rebuilt: {len(self.nodes)} products, generation {generation}")
+
+    def update_product(self, product: Dict[str, Any]):
+        """Replace one product's node and outgoing edges after a sync"""
+        self._remove_product(product['sku'])
+        if product.get('status') == 'active':
+            self._add_product(product)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.nodes or bool(self.in_edges.get(node_id))
+
+    def node(self, node_id: str) -> Dict[str, Any]:
+        """Product node, or a virtual node typed by its first incoming edge"""
+        if node_id in self.nodes:
+            return self.nodes[node_id]
+        first = min(self.in_edges[node_id])
+        return self.virtual_node(node_id, first[2])
+
+    def incident_edges(self, node_id: str) -> List[Dict[str, Any]]:
+        """Outgoing and incoming edges of a node, in edge key order (memoized)"""
+        edges = self._incident.get(node_id)
+        if edges is None:
+            edges = list(self.out_edges.get(node_id, []))
+            edges += self.in_edges.get(node_id, {}).values()
+            edges.sort(key=edge_key)
+            self._incident[node_id] = edges
+        return edges
+
+    def neighborhood(self, node_id: str, depth: int = 1,
+                     relationship_types: Optional[Set[str]] = None,
+                     limit: int = 200) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], bool]:
+        """
+        Breadth-first ego network around node_id, ignoring edge direction
+
+        Returns (nodes, edges, truncated). Nodes are copies annotated with
+        their hop distance; edges are every indexed edge between two returned
+        nodes. At most limit nodes are returned, closest first.
+        """
+        def allowed(edge: Dict[str, Any]) -> bool:
+            return relationship_types is None or edge['relationship_type'] in relationship_types
+
+        hops = {node_id: 0}
+        frontier = [node_id]
+        truncated = False
+
+        for hop in range(1, depth + 1):
+            next_frontier = []
+            for current in frontier:
+                if truncated:
+                    break
+                for edge in self.incident_edges(current):
+                    if not allowed(edge):
+                        continue
+                    neighbour = edge['target'] if edge['source'] == current else edge['source']
+                    if neighbour in hops:
+                        continue
+                    if len(hops) >= limit:
+                        truncated = True
+                        break
+                    hops[neighbour] = hop
+                    next_frontier.append(neighbour)
+            frontier = next_frontier
+            if not frontier or truncated:
+                break
+
+        nodes = [{**self.node(n), "hops": h} for n, h in hops.items()]
+        # Every edge is an outgoing edge of its source product
+        edges = {
+            edge_key(edge): edge
+            for current in hops
+            for edge in self.out_edges.get(current, [])
+            if allowed(edge) and edge['target'] in hops
+        }
+        return nodes, [edges[key] for key in sorted(edges)], truncated
+
+    def _add_product(self, product: Dict[str, Any]):
+        node = product.get('graph_node')
+        if not node or not node.get('id'):
+            return
+
+        node_id = node['id']
+        self.nodes[node_id] = node
+        self.out_edges[node_id] = sorted(product.get('graph_edges') or [], key=edge_key)
+        self._incident.pop(node_id, None)
+        for edge in self.out_edges[node_id]:
+            self.in_edges.setdefault(edge['target'], {})[edge_key(edge)] = edge
+            self._incident.pop(edge['target'], None)
+
+    def _remove_product(self, node_id: str):
+        self.nodes.pop(node_id, None)
+        self._incident.pop(node_id, None)
+        for edge in self.out_edges.pop(node_id, []):
+            self._incident.pop(edge['target'], None)
+            incoming = self.in_edges.get(edge['target'])
+            if incoming is not None:
+                incoming.pop(edge_key(edge), None)
+                if not incoming:
+                    del self.in_edges[edge['target']]
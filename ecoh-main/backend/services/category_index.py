@@ -0,0 +1,237 @@
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+import asyncio
+import logging
+
+from pymongo import ReplaceOne, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+def category_node(code: str, name: Optional[str], path: List[str]) -> Dict[str, Any]:
+    """Index node of a category at a path of codes from the root"""
+    return {
+        "code": code,
+        # Codes missing from the Unopim tree get a name derived from the slug
+        "name": name or code.replace('_', ' ').title(),
+        "parent": path[-2] if len(path) > 1 else None,
+        "path": "/".join(path),
+        "depth": len(path) - 1,
+        "count": 0,
+        "total_count": 0
+    }
+
+
+def build_tree(categories: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Index nodes by code from Unopim categories (id, code, parent_id, name)
+
+    Each node keeps its materialized path of codes from the root
+    ("software/mdc") and its depth. A parent that is missing or part of a
+    cycle makes the node a root.
+    """
+    by_id = {category['id']: category for category in categories}
+    paths: Dict[Any, List[str]] = {}
+
+    def path_of(category: Dict[str, Any], visiting: set) -> List[str]:
+        if category['id'] in paths:
+            return paths[category['id']]
+        parent = by_id.get(category.get('parent_id'))
+        if parent is None or parent['id'] in visiting:
+            path = [category['code']]
+        else:
+            visiting.add(category['id'])
+            path = path_of(parent, visiting) + [category['code']]
+        paths[category['id']] = path
+        return path
+
+    return {
+        category['code']: category_node(category['code'], category.get('name'), path_of(category, {category['id']}))
+        for category in by_id.values()
+    }
+
+
+class CategoryIndex:
+    """
+    Materialized-path index of the Unopim category tree with product counts
+
+    Every node stores its path, so the subtree of a category is the set of
+    codes whose path starts with its own; product filters then need a
+    single $in on the indexed categories array. Per-node counts (products
+    listing the category) and rolled-up counts (distinct products anywhere
+    in the subtree) are computed when the index is refreshed after a sync
+    and served from memory, never by scanning products on request. Product
+    writes between syncs adjust the counts of the categories they touch.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._nodes: Optional[Dict[str, Dict[str, Any]]] = None
+        self._subtrees: Dict[str, List[str]] = {}
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> Dict[str, Dict[str, Any]]:
+        """Return nodes by code, reading the stored index only once"""
+        if self._nodes is not None:
+            return self._nodes
+
+        async with self._lock:
+            if self._nodes is None:
+                # Multikey index answering subtree filters
+                await self.db.hemera_products.create_index("categories")
+                nodes = await self.db.category_index.find({}, {"_id": 0}).to_list(None)
+                self._set_nodes({node['code']: node for node in nodes})
+                logger.info(f"Category index loaded {len(nodes)} categories")
+        return self._nodes
+
+    async def refresh(self, categories: Optional[List[Dict[str, Any]]] = None) -> int:
+        """
+        Recount products per category and store the index
+
+        With categories (as returned by UopimConnector.fetch_categories) the
+        tree is rebuilt first; otherwise the current tree is recounted.
+        Returns the number of indexed categories.
+        """
+        current = await self.load() if categories is None else {}
+        async with self._lock:
+            if categories is not None:
+                nodes = build_tree(categories)
+            else:
+                nodes = {code: dict(node) for code, node in current.items()}
+            self._count(nodes, await self._category_sets())
+            updated_at = datetime.now(timezone.utc).isoformat()
+
+            if nodes:
+                await self.db.category_index.bulk_write(
+                    [
+                        ReplaceOne({"_id": code}, {"_id": code, **node, "updated_at": updated_at}, upsert=True)
+                        for code, node in nodes.items()
+                    ],
+                    ordered=False
+                )
+            await self.db.category_index.delete_many({"_id": {"$nin": list(nodes)}})
+            self._set_nodes(nodes)
+
+        logger.info(f"Category index refreshed: {len(nodes)} categories")
+        return len(nodes)
+
+    async def apply(self, previous: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]):
+        """Move a product's counts from its previous categories to its current ones"""
+        await self.apply_many([(previous, current)])
+
+    async def apply_many(self, changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+        """
+        Adjust counts for the (previous, current) versions of written products
+
+        Only the categories a product entered or left, and their ancestors,
+        move by one; full syncs and tree changes recount through refresh.
+        """
+        try:
+            await self.load()
+            async with self._lock:
+                # Work on a copy so a failed write leaves the loaded index as stored
+                nodes = dict(self._nodes)
+                deltas = self._deltas(nodes, changes)
+                if not deltas:
+                    return
+                await self._store_deltas(nodes, deltas)
+                for code, (count, total_count) in deltas.items():
+                    node = nodes[code]
+                    nodes[code] = dict(node, count=node['count'] + count, total_count=node['total_count'] + total_count)
+                self._set_nodes(nodes)
+        except Exception as e:
+            # The written products stand; the next full sync recounts
+            logger.error(f"Error adjusting category counts: {str(e)}")
+
+    def _deltas(self, nodes: Dict[str, Dict[str, Any]],
+                changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> Dict[str, List[int]]:
+        """[count, total_count] change per code; codes new to the tree are added to nodes as roots"""
+        deltas: Dict[str, List[int]] = {}
+
+        def shift(codes: set, field: int, step: int):
+            for code in codes:
+                deltas.setdefault(code, [0, 0])[field] += step
+
+        def subtree_of(codes: set) -> set:
+            return {ancestor for code in codes for ancestor in nodes[code]['path'].split('/') if ancestor in nodes}
+
+        for previous, current in changes:
+            before = set((previous or {}).get('categories') or [])
+            after = set((current or {}).get('categories') or [])
+            if before == after:
+                continue
+            for code in after - set(nodes):
+                # Listed by products but unknown to Unopim: a root of its own
+                nodes[code] = category_node(code, None, [code])
+            before &= set(nodes)
+            shift(before - after, 0, -1)
+            shift(after - before, 0, 1)
+            # Each product counts once per ancestor, however many of its categories share it
+            before, after = subtree_of(before), subtree_of(after)
+            shift(before - after, 1, -1)
+            shift(after - before, 1, 1)
+        return {code: delta for code, delta in deltas.items() if delta != [0, 0]}
+
+    async def _store_deltas(self, nodes: Dict[str, Dict[str, Any]], deltas: Dict[str, List[int]]):
+        updated_at = datetime.now(timezone.utc).isoformat()
+        await self.db.category_index.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": code},
+                    {
+                        "$inc": {"count": count, "total_count": total_count},
+                        "$set": {"updated_at": updated_at},
+                        # Codes first seen here are stored with the rest of their node
+                        "$setOnInsert": {
+                            key: value for key, value in nodes[code].items()
+                            if key not in ("count", "total_count", "updated_at")
+                        }
+                    },
+                    upsert=True
+                )
+                for code, (count, total_count) in deltas.items()
+            ],
+            ordered=False
+        )
+
+    async def _category_sets(self) -> List[Tuple[List[str], int]]:
+        """Products grouped by their categories array, as (codes, product count)"""
+        pipeline = [{"$group": {"_id": "$categories", "count": {"$sum": 1}}}]
+        groups = await self.db.hemera_products.aggregate(pipeline).to_list(None)
+        return [(group['_id'], group['count']) for group in groups if group['_id']]
+
+    def _count(self, nodes: Dict[str, Dict[str, Any]], category_sets: List[Tuple[List[str], int]]):
+        for node in nodes.values():
+            node['count'] = node['total_count'] = 0
+        for codes, count in category_sets:
+            subtree_of = set()
+            for code in set(codes):
+                if code not in nodes:
+                    # Listed by products but unknown to Unopim: a root of its own
+                    nodes[code] = category_node(code, None, [code])
+                node = nodes[code]
+                node['count'] += count
+                subtree_of.update(node['path'].split('/'))
+            # Each product counts once per ancestor, however many of its categories share it
+            for code in subtree_of:
+                if code in nodes:
+                    nodes[code]['total_count'] += count
+
+    def _set_nodes(self, nodes: Dict[str, Dict[str, Any]]):
+        subtrees: Dict[str, List[str]] = {code: [] for code in nodes}
+        for code, node in nodes.items():
+            for ancestor in node['path'].split('/'):
+                if ancestor in subtrees:
+                    subtrees[ancestor].append(code)
+        self._subtrees = subtrees
+        self._nodes = nodes
+
+    async def subtree(self, code: str) -> List[str]:
+        """The category and all its descendants (just the code when unknown)"""
+        await self.load()
+        return self._subtrees.get(code) or [code]
+
+    async def tree(self) -> List[Dict[str, Any]]:
+        """Every node with its counts, parents before children"""
+        nodes = await self.load()
+        return sorted(nodes.values(), key=lambda node: node['path'])
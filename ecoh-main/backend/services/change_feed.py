@@ -0,0 +1,85 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeFeed:
+    """
+    Tails the Unopim product outbox and applies its changes in batches
+
+    Each poll reads the changes after the stored position, collapses them
+    to the last operation per product and hands the product ids to apply
+    as (upserted, deleted). The position only moves once apply succeeded,
+    so a failed batch is read again on the next poll. Without a stored
+    position the feed starts at the newest change: earlier ones are
+    covered by full syncs.
+
+    Full batches are followed immediately by the next poll to catch up;
+    otherwise the feed sleeps poll_interval seconds (0 disables it).
+    """
+
+    def __init__(self, connector,
+                 apply: Callable[[List[int], List[int]], Awaitable[None]],
+                 load_position: Callable[[], Awaitable[Optional[int]]],
+                 save_position: Callable[[int], Awaitable[None]],
+                 batch_size: int = 500, poll_interval: float = 1.0):
+        self.connector = connector
+        self.apply = apply
+        self.load_position = load_position
+        self.save_position = save_position
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.position: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and self.poll_interval > 0:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Tailing Unopim product changes every {self.poll_interval}s")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def poll_once(self) -> int:
+        """Apply the next batch of changes; returns how many were read"""
+        if self.position is None:
+            position = await self.load_position()
+            if position is None:
+                position = await self.connector.latest_change_id()
+                await self.save_position(position)
+            self.position = position
+
+        changes = await self.connector.fetch_changes(self.position, self.batch_size)
+        if not changes:
+            return 0
+
+        # Last operation per product wins
+        operations: Dict[int, str] = {}
+        for change in changes:
+            operations[change['product_id']] = change['operation']
+        upserted = [product_id for product_id, operation in operations.items() if operation != 'delete']
+        deleted = [product_id for product_id, operation in operations.items() if operation == 'delete']
+
+        await self.apply(upserted, deleted)
+        self.position = changes[-1]['id']
+        await self.save_position(self.position)
+        logger.info(f"Applied {len(changes)} Unopim changes up to {self.position}")
+        return len(changes)
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.poll_once() >= self.batch_size:
+                    continue
+            except Exception as e:
+                logger.error(f"Change feed poll failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
@@ -1,14 +1,172 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter
+import asyncio
 import logging
-import math
+
+import numpy as np
+
+from services.adjacency_index import AdjacencyIndex
+from services.graph_cache import CatalogGeneration, GraphSnapshotCache
+from services.graph_clustering import build_csr, label_propagation, group_centroids
+from services.graph_codec import encode_graph
+from services.graph_layout import ForceLayout, POSITION_DECIMALS
+from services.spatial_index import SpatialIndex
 
 logger = logging.getLogger(__name__)
 
+GRAPH_DELTA_KEYS = ("nodes_added", "nodes_updated", "nodes_removed", "edges_added", "edges_removed")
+
 class GraphBuilder:
     """Builds unified graph structure for 3D visualization"""
     
-    def __init__(self, db):
+    def __init__(self, db, layout_strategy: str = "auto", theta: float = 0.8,
+                 barnes_hut_threshold: int = 1500, layout_seed: Optional[int] = 0):
+        """
+        layout_strategy selects the repulsion model: "exact" (all pairs),
+        "barnes_hut" (octree approximation controlled by theta) or "auto",
+        which switches to Barnes-Hut above barnes_hut_threshold nodes.
+        layout_seed makes the layout deterministic; None uses random seeding.
+        """
         self.db = db
+        self.layout = ForceLayout(
+            strategy=layout_strategy,
+            theta=theta,
+            barnes_hut_threshold=barnes_hut_threshold,
+            seed=layout_seed
+        )
+        # Snapshots of different layout versions never overwrite each other
+        self.cache = GraphSnapshotCache(db, CatalogGeneration(db), name=f"complete:{self.layout.version}")
+        self._communities: Optional[Tuple[str, List[Dict]]] = None
+        self._binary: Optional[Tuple[str, bytes]] = None
+        self._spatial: Optional[Tuple[str, SpatialIndex]] = None
+        self.adjacency = AdjacencyIndex(self._create_virtual_node)
+        self._adjacency_lock = asyncio.Lock()
+    
+    async def get_complete_graph(self) -> Dict[str, Any]:
+        """Return the cached graph, rebuilding only when the catalog generation changed"""
+        return await self.cache.get_graph(self.build_complete_graph)
+    
+    async def get_complete_payload(self) -> Tuple[bytes, str]:
+        """Return the canonical JSON bytes of the cached graph and their ETag"""
+        snapshot = await self.cache.get_snapshot(self.build_complete_graph)
+        return snapshot.payload, snapshot.etag
+    
+    async def get_complete_binary(self) -> Tuple[bytes, str]:
+        """
+        Return the cached graph in the compact binary transport and its ETag
+        
+        Encoded once per snapshot; the ETag is derived from the JSON one so
+        both representations revalidate together.
+        """
+        snapshot = await self.cache.get_snapshot(self.build_complete_graph)
+        if self._binary is None or self._binary[0] != snapshot.etag:
+            self._binary = (snapshot.etag, await asyncio.to_thread(encode_graph, snapshot.graph))
+        return self._binary[1], snapshot.etag[:-1] + '-bin"'
+    
+    async def get_clusters(self, mode: str = "type") -> List[Dict]:
+        """
+        Return clusters without rebuilding the layout
+        
+        Type clusters are stored with the snapshot; community clusters are
+        computed from the cached graph once per snapshot and memoized.
+        """
+        if mode != "community":
+            return await self.cache.get_clusters(self.build_complete_graph)
+        
+        snapshot = await self.cache.get_snapshot(self.build_complete_graph)
+        if self._communities is None or self._communities[0] != snapshot.etag:
+            clusters = await asyncio.to_thread(
+                self._identify_clusters, snapshot.graph['nodes'], snapshot.graph['edges'], "community"
+            )
+            self._communities = (snapshot.etag, clusters)
+        return self._communities[1]
+    
+    async def get_viewport(self, planes: np.ndarray, limit: Optional[int] = None,
+                           min_size: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Nodes of the cached layout inside a convex region and the edges between them
+        
+        planes are (a, b, c, d) rows, e.g. from a bounding box or a camera
+        frustum. The KD-tree over node positions is built once per snapshot,
+        so a query only visits the tree cells that intersect the region.
+        """
+        snapshot = await self.cache.get_snapshot(self.build_complete_graph)
+        if self._spatial is None or self._spatial[0] != snapshot.etag:
+            self._spatial = (snapshot.etag, await asyncio.to_thread(SpatialIndex, snapshot.graph))
+        spatial = self._spatial[1]
+        
+        node_ids, edge_ids, matched = spatial.query(planes, limit, min_size)
+        nodes = [snapshot.graph['nodes'][i] for i in node_ids.tolist()]
+        edges = [snapshot.graph['edges'][i] for i in edge_ids.tolist()]
+        
+        return {
+            "nodes": nodes,
+            "edges": edges,
+            "truncated": matched > len(nodes),
+            "stats": {
+                "total_nodes": len(nodes),
+                "total_edges": len(edges),
+                "matched_nodes": matched,
+                "graph_nodes": len(snapshot.graph['nodes'])
+            }
+        }
+    
+    async def get_adjacency(self) -> AdjacencyIndex:
+        """Return the adjacency index, rebuilding it if the catalog generation moved"""
+        generation = await self.current_generation()
+        if self.adjacency.generation == generation:
+            return self.adjacency
+        
+        async with self._adjacency_lock:
+            if self.adjacency.generation != generation:
+                products = await self.db.hemera_products.find(
+                    {"status": "active"},
+                    {"_id": 0, "graph_node": 1, "graph_edges": 1}
+                ).to_list(None)
+                self.adjacency.rebuild(products, generation)
+        return self.adjacency
+    
+    async def get_neighborhood(self, node_id: str, depth: int = 1,
+                               relationship_types: Optional[List[str]] = None,
+                               limit: int = 200) -> Optional[Dict[str, Any]]:
+        """
+        Laid-out k-hop ego network around a node
+        
+        Served from the in-memory adjacency index, so the cost depends on the
+        size of the neighbourhood rather than the catalog. The center node is
+        placed at the origin. Returns None for unknown nodes.
+        """
+        index = await self.get_adjacency()
+        if node_id not in index:
+            return None
+        
+        types = set(relationship_types) if relationship_types else None
+        nodes, edges, truncated = index.neighborhood(node_id, depth, types, limit)
+        await asyncio.to_thread(self._layout_ego_network, node_id, nodes, edges)
+        
+        return {
+            "center": node_id,
+            "depth": depth,
+            "nodes": nodes,
+            "edges": edges,
+            "truncated": truncated,
+            "stats": {
+                "total_nodes": len(nodes),
+                "total_edges": len(edges)
+            }
+        }
+    
+    def _layout_ego_network(self, center: str, nodes: List[Dict], edges: List[Dict], iterations: int = 50):
+        """Force layout of a small subgraph, translated so the center sits at the origin"""
+        self.layout.apply(nodes, edges, iterations)
+        origin = next(n for n in nodes if n['id'] == center)
+        ox, oy, oz = origin['x'], origin['y'], origin['z']
+        for node in nodes:
+            node.update(
+                x=round(node['x'] - ox, POSITION_DECIMALS),
+                y=round(node['y'] - oy, POSITION_DECIMALS),
+                z=round(node['z'] - oz, POSITION_DECIMALS)
+            )
     
     async def build_complete_graph(self) -> Dict[str, Any]:
         """
@@ -17,8 +175,11 @@ class GraphBuilder:
         """
         logger.info("Building complete graph structure")
         
-        # Get all active products
-        products = await self.db.hemera_products.find({"status": "active"}).to_list(1000)
+        # Get all active products (the same set as the adjacency index)
+        products = await self.db.hemera_products.find(
+            {"status": "active"},
+            {"_id": 0, "graph_node": 1, "graph_edges": 1}
+        ).to_list(None)
         
         # Collect all unique nodes
         nodes_dict = {}
@@ -34,6 +195,9 @@ class GraphBuilder:
                 for edge in product.get('graph_edges', []):
                     edges_list.append(edge)
         
+        # Stable ordering so the layout does not depend on database scan order
+        edges_list.sort(key=self._edge_key)
+        
         # Create nodes for all relationship targets (even if not products)
         for edge in edges_list:
             target_id = edge['target']
@@ -44,26 +208,170 @@ class GraphBuilder:
                     edge['relationship_type']
                 )
         
-        # Calculate force-directed positions
-        nodes_list = list(nodes_dict.values())
-        self._calculate_3d_positions(nodes_list, edges_list)
+        nodes_list = sorted(nodes_dict.values(), key=lambda n: n['id'])
         
-        # Build graph clusters
+        # Calculate force-directed positions off the event loop
+        await asyncio.to_thread(self._calculate_3d_positions, nodes_list, edges_list)
+        
+        graph = self._assemble_graph(nodes_list, edges_list)
+        
+        logger.info(f"Graph built: {len(nodes_list)} nodes, {len(edges_list)} edges")
+        return graph
+    
+    def _assemble_graph(self, nodes_list: List[Dict], edges_list: List[Dict]) -> Dict[str, Any]:
+        """Attach clusters and stats to laid-out nodes and edges"""
         clusters = self._identify_clusters(nodes_list, edges_list)
         
-        graph = {
+        return {
             "nodes": nodes_list,
             "edges": edges_list,
             "clusters": clusters,
+            "layout": self.layout.describe(len(nodes_list)),
             "stats": {
                 "total_nodes": len(nodes_list),
                 "total_edges": len(edges_list),
                 "total_clusters": len(clusters)
             }
         }
+    
+    async def current_generation(self) -> int:
+        """Current catalog generation (changes whenever a sync writes product data)"""
+        return await self.cache.catalog.current()
+    
+    async def apply_product_update(self, product: Dict[str, Any], base_generation: int) -> Optional[Dict[str, Any]]:
+        """
+        Warm-start update of the cached graph after a single product sync
         
-        logger.info(f"Graph built: {len(nodes_list)} nodes, {len(edges_list)} edges")
-        return graph
+        base_generation is the catalog generation read before the sync. The
+        cached snapshot is patched only when it was built for exactly that
+        generation; otherwise it is left for the next read to rebuild.
+        Returns the node/edge delta (empty when the sync changed nothing), or
+        None when the snapshot could not be patched.
+        """
+        generation = await self.current_generation()
+        if generation == base_generation:
+            return {key: [] for key in GRAPH_DELTA_KEYS}
+        
+        # The adjacency index is patched independently of the snapshot
+        if self.adjacency.generation == base_generation:
+            self.adjacency.update_product(product)
+            self.adjacency.generation = generation
+        
+        snapshot_generation, graph = await self.cache.latest()
+        if graph is None or snapshot_generation != base_generation:
+            logger.info("Graph snapshot is not at the base generation, skipping incremental layout")
+            return None
+        
+        new_graph, delta = await asyncio.to_thread(self._patch_graph, graph, product)
+        await self.cache.store(generation, new_graph)
+        
+        logger.info(
+            f"Incremental layout for {product.get('sku')}: "
+            f"{len(delta['nodes_added'])} added, {len(delta['nodes_updated'])} moved, "
+            f"{len(delta['nodes_removed'])} removed"
+        )
+        return delta
+    
+    def _patch_graph(self, graph: Dict[str, Any], product: Dict[str, Any],
+                     iterations: int = 25) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Replace one product's node and outgoing edges in a laid-out graph
+        
+        Existing nodes keep their coordinates. New nodes are seeded next to
+        their neighbours and only the product and new nodes are relaxed, using
+        forces from their direct neighbourhood.
+        """
+        sku = product['sku']
+        is_active = product.get('status') == 'active' and bool(product.get('graph_node'))
+        
+        nodes = {node['id']: node for node in graph['nodes']}
+        removed_edges = [e for e in graph['edges'] if e['source'] == sku]
+        new_edges = list(product.get('graph_edges', [])) if is_active else []
+        edges = sorted([e for e in graph['edges'] if e['source'] != sku] + new_edges, key=self._edge_key)
+        
+        added_ids = []
+        updated_ids = []
+        removed_ids = []
+        targets = {e['target'] for e in edges}
+        
+        # The product node itself
+        previous = nodes.get(sku)
+        if is_active:
+            node = dict(product['graph_node'])
+            if previous:
+                node.update(x=previous['x'], y=previous['y'], z=previous['z'])
+            else:
+                added_ids.append(sku)
+            nodes[sku] = node
+        elif previous:
+            if sku in targets:
+                relationship_type = next(e['relationship_type'] for e in edges if e['target'] == sku)
+                node = self._create_virtual_node(sku, relationship_type)
+                node.update(x=previous['x'], y=previous['y'], z=previous['z'])
+                nodes[sku] = node
+                updated_ids.append(sku)
+            else:
+                del nodes[sku]
+                removed_ids.append(sku)
+        
+        # Virtual nodes for new targets, dropping ones nothing points to anymore
+        for edge in new_edges:
+            if edge['target'] not in nodes:
+                nodes[edge['target']] = self._create_virtual_node(edge['target'], edge['relationship_type'])
+                added_ids.append(edge['target'])
+        for edge in removed_edges:
+            target = nodes.get(edge['target'])
+            if target and target.get('is_virtual') and edge['target'] not in targets:
+                del nodes[edge['target']]
+                removed_ids.append(edge['target'])
+        
+        # Seed new nodes near already positioned neighbours
+        if sku in added_ids:
+            neighbours = [nodes[e['target']] for e in new_edges if e['target'] not in added_ids]
+            neighbours += [nodes[e['source']] for e in edges if e['target'] == sku]
+            self._seed_position(nodes[sku], neighbours)
+        for node_id in added_ids:
+            if node_id != sku:
+                self._seed_position(nodes[node_id], [nodes[sku]], spread=2.0)
+        
+        # Same node and edge order as a full build, so a patched snapshot matches a rebuild
+        nodes_list = sorted(nodes.values(), key=lambda n: n['id'])
+        node_indices = {node['id']: i for i, node in enumerate(nodes_list)}
+        movable_ids = set(added_ids) | ({sku} if is_active else set())
+        
+        if movable_ids:
+            positions = np.array([[n['x'], n['y'], n['z']] for n in nodes_list], dtype=np.float64)
+            edge_index = self.layout.build_edge_index(node_indices, edges)
+            movable = np.array([node_indices[node_id] for node_id in movable_ids], dtype=np.int64)
+            positions = self.layout.relax(positions, edge_index, movable, iterations)
+            for node_id in movable_ids:
+                x, y, z = positions[node_indices[node_id]].round(POSITION_DECIMALS).tolist()
+                nodes[node_id].update(x=x, y=y, z=z)
+        
+        old_keys = {self._edge_key(e) for e in removed_edges}
+        new_keys = {self._edge_key(e) for e in new_edges}
+        delta = {
+            "nodes_added": [nodes[node_id] for node_id in added_ids],
+            "nodes_updated": [nodes[node_id] for node_id in updated_ids]
+                             + [nodes[node_id] for node_id in movable_ids if node_id not in added_ids],
+            "nodes_removed": removed_ids,
+            "edges_added": [e for e in new_edges if self._edge_key(e) not in old_keys],
+            "edges_removed": [e for e in removed_edges if self._edge_key(e) not in new_keys]
+        }
+        return self._assemble_graph(nodes_list, edges), delta
+    
+    @staticmethod
+    def _edge_key(edge: Dict) -> Tuple[str, str, str]:
+        return (edge['source'], edge['target'], edge['relationship_type'])
+    
+    def _seed_position(self, node: Dict, neighbours: List[Dict], spread: float = 1.0):
+        """Place a node at the centroid of its neighbours plus a small jitter"""
+        if neighbours:
+            center = np.mean([[n['x'], n['y'], n['z']] for n in neighbours], axis=0)
+        else:
+            center = np.zeros(3)
+        x, y, z = (center + self.layout.jitter(node['id'], spread)).tolist()
+        node.update(x=x, y=y, z=z)
     
     def _create_virtual_node(self, node_id: str, relationship_type: str) -> Dict:
         """Create virtual node for non-product entities"""
@@ -108,109 +416,61 @@ class GraphBuilder:
         Force-directed graph layout in 3D space
         Modifies nodes in-place
         """
-        # Initialize random positions
-        import random
-        for node in nodes:
-            node['x'] = random.uniform(-10, 10)
-            node['y'] = random.uniform(-10, 10)
-            node['z'] = random.uniform(-10, 10)
+        self.layout.apply(nodes, edges, iterations=iterations)
+        logger.info("3D positions calculated")
+    
+    def _identify_clusters(self, nodes: List[Dict], edges: List[Dict], mode: str = "type") -> List[Dict]:
+        """
+        Identify node clusters
         
-        # Build adjacency for faster lookup
-        node_indices = {node['id']: i for i, node in enumerate(nodes)}
+        mode="type" groups nodes by their type; mode="community" runs label
+        propagation over a CSR adjacency of the edges. Centroids are computed
+        for all clusters in one vectorized pass.
+        """
+        if not nodes:
+            return []
         
-        # Force-directed algorithm parameters
-        repulsion = 15.0
-        attraction = 0.1
-        damping = 0.85
+        if mode == "community":
+            node_indices = {node['id']: i for i, node in enumerate(nodes)}
+            edge_index = self.layout.build_edge_index(node_indices, edges)
+            indptr, indices = build_csr(len(nodes), edge_index)
+            labels = label_propagation(indptr, indices)
+        else:
+            type_codes: Dict[str, int] = {}
+            labels = np.array(
+                [type_codes.setdefault(node.get('type', 'other'), len(type_codes)) for node in nodes],
+                dtype=np.int64
+            )
         
-        for iteration in range(iterations):
-            # Calculate forces
-            forces = [[0, 0, 0] for _ in nodes]
-            
-            # Repulsion between all nodes
-            for i, node1 in enumerate(nodes):
-                for j, node2 in enumerate(nodes):
-                    if i >= j:
-                        continue
-                    
-                    dx = node2['x'] - node1['x']
-                    dy = node2['y'] - node1['y']
-                    dz = node2['z'] - node1['z']
-                    
-                    dist = math.sqrt(dx*dx + dy*dy + dz*dz) + 0.01
-                    force = repulsion / (dist * dist)
-                    
-                    fx = (dx / dist) * force
-                    fy = (dy / dist) * force
-                    fz = (dz / dist) * force
-                    
-                    forces[i][0] -= fx
-                    forces[i][1] -= fy
-                    forces[i][2] -= fz
-                    forces[j][0] += fx
-                    forces[j][1] += fy
-                    forces[j][2] += fz
-            
-            # Attraction along edges
-            for edge in edges:
-                if edge['source'] not in node_indices or edge['target'] not in node_indices:
-                    continue
-                
-                i = node_indices[edge['source']]
-                j = node_indices[edge['target']]
-                
-                dx = nodes[j]['x'] - nodes[i]['x']
-                dy = nodes[j]['y'] - nodes[i]['y']
-                dz = nodes[j]['z'] - nodes[i]['z']
-                
-                dist = math.sqrt(dx*dx + dy*dy + dz*dz) + 0.01
-                force = attraction * dist
-                
-                fx = (dx / dist) * force
-                fy = (dy / dist) * force
-                fz = (dz / dist) * force
-                
-                forces[i][0] += fx
-                forces[i][1] += fy
-                forces[i][2] += fz
-                forces[j][0] -= fx
-                forces[j][1] -= fy
-                forces[j][2] -= fz
-            
-            # Apply forces with damping
-            for i, node in enumerate(nodes):
-                node['x'] += forces[i][0] * damping
-                node['y'] += forces[i][1] * damping
-                node['z'] += forces[i][2] * damping
+        group_count = int(labels.max()) + 1
+        positions = np.array([[n['x'], n['y'], n['z']] for n in nodes], dtype=np.float64)
+        centroids = group_centroids(positions, labels, group_count).round(POSITION_DECIMALS)
         
-        logger.info("3D positions calculated")
-    
-    def _identify_clusters(self, nodes: List[Dict], edges: List[Dict]) -> List[Dict]:
-        """Identify node clusters by type and connections"""
-        clusters_by_type = {}
-        
-        for node in nodes:
-            node_type = node.get('type', 'other')
-            if node_type not in clusters_by_type:
-                clusters_by_type[node_type] = []
-            clusters_by_type[node_type].append(node['id'])
+        members: List[List[Dict]] = [[] for _ in range(group_count)]
+        for node, label in zip(nodes, labels.tolist()):
+            members[label].append(node)
         
         clusters = []
-        for cluster_type, node_ids in clusters_by_type.items():
-            if node_ids:
-                # Calculate cluster centroid
-                cx = sum(n['x'] for n in nodes if n['id'] in node_ids) / len(node_ids)
-                cy = sum(n['y'] for n in nodes if n['id'] in node_ids) / len(node_ids)
-                cz = sum(n['z'] for n in nodes if n['id'] in node_ids) / len(node_ids)
-                
-                clusters.append({
-                    "type": cluster_type,
-                    "nodes": node_ids,
-                    "count": len(node_ids),
-                    "centroid": {"x": cx, "y": cy, "z": cz},
-                    "color": nodes[0]['color'] if nodes else '#95a5a6'
-                })
+        for label, cluster_nodes in enumerate(members):
+            type_counts = Counter(n.get('type', 'other') for n in cluster_nodes)
+            cluster_type = type_counts.most_common(1)[0][0]
+            color = next(n['color'] for n in cluster_nodes if n.get('type', 'other') == cluster_type)
+            cx, cy, cz = centroids[label].tolist()
+            
+            cluster = {
+                "type": cluster_type,
+                "nodes": [n['id'] for n in cluster_nodes],
+                "count": len(cluster_nodes),
+                "centroid": {"x": cx, "y": cy, "z": cz},
+                "color": color
+            }
+            if mode == "community":
+                cluster["id"] = f"community_{label}"
+                cluster["types"] = dict(type_counts)
+            clusters.append(cluster)
         
+        if mode == "community":
+            clusters.sort(key=lambda c: (-c['count'], c['id']))
         return clusters
     
     async def get_node_details(self, node_id: str) -> Optional[Dict]:
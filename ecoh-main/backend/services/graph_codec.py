@@ -0,0 +1,192 @@
+from typing import Dict, Any, List, Tuple
+import json
+import logging
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GRAPH_BINARY_MEDIA_TYPE = "application/vnd.ecoh.graph+binary"
+GRAPH_BINARY_MAGIC = b"ECG1"
+GRAPH_BINARY_VERSION = 1
+
+# magic, version, flags, node_count, edge_count, string_count, code_count, meta_bytes
+HEADER = struct.Struct('<4sHHIIIII')
+
+NODE_VIRTUAL = 0x01
+
+
+def _pad(length: int) -> int:
+    return -length % 4
+
+
+def _string_table(strings: List[str]) -> bytes:
+    """uint32 offsets[count + 1] followed by the UTF-8 blob, padded to 4 bytes"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    blob = b''.join(encoded)
+    return offsets.tobytes() + blob + b'\0' * _pad(len(blob))
+
+
+def _read_string_table(buffer: memoryview, offset: int, count: int) -> Tuple[List[str], int]:
+    offsets = np.frombuffer(buffer, dtype='<u4', count=count + 1, offset=offset)
+    start = offset + offsets.nbytes
+    blob = bytes(buffer[start:start + int(offsets[-1])])
+    strings = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(count)]
+    end = start + int(offsets[-1])
+    return strings, end + _pad(end)
+
+
+class _Interner:
+    """Assign dense codes to strings in first-seen order"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+
+    def __call__(self, value: Any) -> int:
+        return self.codes.setdefault(str(value), len(self.codes))
+
+    @property
+    def strings(self) -> List[str]:
+        return list(self.codes)
+
+
+def encode_graph(graph: Dict[str, Any]) -> bytes:
+    """
+    Encode a laid-out graph into the compact binary transport
+
+    Layout (little-endian, every section 4-byte aligned):
+      header                      HEADER
+      string table                node ids and labels
+      code table                  node types, colors and relationship types
+      meta                        UTF-8 JSON: stats, layout, clusters without
+                                  member lists (members share a type code)
+      node id / label             uint32[n] string indices
+      node positions              float32[n * 3] (x, y, z interleaved)
+      node size                   float32[n]
+      node type / color           uint16[n] codes
+      node flags                  uint8[n] (bit 0: virtual)
+      edge source / target        uint32[m] node indices
+      edge strength               float32[m]
+      edge relationship type      uint16[m] codes
+
+    Node metadata is not included; clients fetch it from /graph/node/{id}.
+    """
+    nodes = graph['nodes']
+    edges = graph['edges']
+    strings = _Interner()
+    codes = _Interner()
+
+    node_ids = np.array([strings(node['id']) for node in nodes], dtype='<u4')
+    labels = np.array([strings(node.get('label', node['id'])) for node in nodes], dtype='<u4')
+    positions = np.array(
+        [[node.get('x', 0), node.get('y', 0), node.get('z', 0)] for node in nodes], dtype='<f4'
+    ).reshape(-1, 3)
+    sizes = np.array([node.get('size', 1.0) for node in nodes], dtype='<f4')
+    types = np.array([codes(node.get('type', 'other')) for node in nodes], dtype='<u2')
+    colors = np.array([codes(node.get('color', '')) for node in nodes], dtype='<u2')
+    flags = np.array([NODE_VIRTUAL if node.get('is_virtual') else 0 for node in nodes], dtype='u1')
+
+    # Edges whose endpoints are not nodes of the graph cannot be drawn
+    node_index = {node['id']: i for i, node in enumerate(nodes)}
+    edges = [e for e in edges if e['source'] in node_index and e['target'] in node_index]
+    sources = np.array([node_index[e['source']] for e in edges], dtype='<u4')
+    targets = np.array([node_index[e['target']] for e in edges], dtype='<u4')
+    strengths = np.array([e.get('strength', 1.0) for e in edges], dtype='<f4')
+    relationships = np.array([codes(e.get('relationship_type', '')) for e in edges], dtype='<u2')
+
+    if len(codes.codes) > 0xFFFF:
+        raise ValueError(f"Too many distinct type codes for binary transport: {len(codes.codes)}")
+
+    meta = json.dumps({
+        # Counts describe what was encoded, not the edges dropped above
+        "stats": {**graph.get('stats', {}), "total_nodes": len(nodes), "total_edges": len(edges)},
+        "layout": graph.get('layout', {}),
+        "clusters": [
+            {key: value for key, value in cluster.items() if key != 'nodes'}
+            for cluster in graph.get('clusters', [])
+        ]
+    }, sort_keys=True, separators=(',', ':'), default=str).encode()
+
+    sections = [
+        HEADER.pack(
+            GRAPH_BINARY_MAGIC, GRAPH_BINARY_VERSION, 0,
+            len(nodes), len(edges), len(strings.codes), len(codes.codes), len(meta)
+        ),
+        _string_table(strings.strings),
+        _string_table(codes.strings),
+        meta + b'\0' * _pad(len(meta)),
+        node_ids.tobytes(),
+        labels.tobytes(),
+        positions.tobytes(),
+        sizes.tobytes(),
+        types.tobytes(),
+        colors.tobytes(),
+        flags.tobytes(),
+    ]
+    node_bytes = (types.nbytes + colors.nbytes + flags.nbytes)
+    sections.append(b'\0' * _pad(node_bytes))
+    sections += [sources.tobytes(), targets.tobytes(), strengths.tobytes(), relationships.tobytes()]
+    sections.append(b'\0' * _pad(relationships.nbytes))
+    return b''.join(sections)
+
+
+def decode_graph(data: bytes) -> Dict[str, Any]:
+    """Decode the binary transport back into node/edge dictionaries (without metadata)"""
+    buffer = memoryview(data)
+    magic, version, _, node_count, edge_count, string_count, code_count, meta_bytes = \
+        HEADER.unpack_from(buffer, 0)
+    if magic != GRAPH_BINARY_MAGIC or version != GRAPH_BINARY_VERSION:
+        raise ValueError("Not an ECG1 graph payload")
+
+    offset = HEADER.size
+    strings, offset = _read_string_table(buffer, offset, string_count)
+    codes, offset = _read_string_table(buffer, offset, code_count)
+    meta = json.loads(bytes(buffer[offset:offset + meta_bytes]))
+    offset += meta_bytes + _pad(meta_bytes)
+
+    def take(dtype: str, count: int) -> np.ndarray:
+        nonlocal offset
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array
+
+    node_ids = take('<u4', node_count)
+    labels = take('<u4', node_count)
+    positions = take('<f4', node_count * 3).reshape(-1, 3)
+    sizes = take('<f4', node_count)
+    types = take('<u2', node_count)
+    colors = take('<u2', node_count)
+    flags = take('u1', node_count)
+    offset += _pad(types.nbytes + colors.nbytes + flags.nbytes)
+    sources = take('<u4', edge_count)
+    targets = take('<u4', edge_count)
+    strengths = take('<f4', edge_count)
+    relationships = take('<u2', edge_count)
+
+    nodes = [
+        {
+            "id": strings[node_ids[i]],
+            "label": strings[labels[i]],
+            "type": codes[types[i]],
+            "x": float(positions[i, 0]),
+            "y": float(positions[i, 1]),
+            "z": float(positions[i, 2]),
+            "size": float(sizes[i]),
+            "color": codes[colors[i]],
+            "is_virtual": bool(flags[i] & NODE_VIRTUAL)
+        }
+        for i in range(node_count)
+    ]
+    edges = [
+        {
+            "source": nodes[sources[i]]['id'],
+            "target": nodes[targets[i]]['id'],
+            "relationship_type": codes[relationships[i]],
+            "strength": float(strengths[i])
+        }
+        for i in range(edge_count)
+    ]
+    return {"nodes": nodes, "edges": edges, **meta}
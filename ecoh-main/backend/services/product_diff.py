@@ -0,0 +1,79 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timezone
+import json
+
+# Rewritten on every write but never reported as a change
+ALWAYS_WRITTEN = ("synced_at",)
+
+# Dict fields compared key by key and reported as "field.key" paths
+NESTED_FIELDS = ("attributes", "relationships")
+
+
+def _comparable(value: Any) -> str:
+    """Canonical form, so stored and freshly transformed values compare equal"""
+    def normalize(v):
+        if isinstance(v, datetime):
+            if v.tzinfo is not None:
+                v = v.astimezone(timezone.utc).replace(tzinfo=None)
+            return v.isoformat()
+        if isinstance(v, dict):
+            return {str(k): normalize(item) for k, item in v.items()}
+        if isinstance(v, (list, tuple)):
+            return [normalize(item) for item in v]
+        return v
+    return json.dumps(normalize(value), sort_keys=True, default=str)
+
+
+def _nestable(value: Any) -> bool:
+    """A dict whose keys can be used as "field.key" update paths"""
+    return isinstance(value, dict) and all(
+        isinstance(key, str) and key and '.' not in key and not key.startswith('$') for key in value
+    )
+
+
+class ProductDiff:
+    """
+    Changed paths between a stored product and its new transformed version
+
+    set holds {path: new value} and unset the nested paths that disappeared;
+    paths are top-level fields, or "field.key" inside NESTED_FIELDS so a
+    document store can update single attributes. Column stores write the
+    whole top-level fields listed by columns().
+    """
+
+    def __init__(self, stored: Dict[str, Any], current: Dict[str, Any]):
+        self.set: Dict[str, Any] = {}
+        self.unset: List[str] = []
+
+        for field, value in current.items():
+            if field in ALWAYS_WRITTEN:
+                continue
+            old = stored.get(field)
+            if field in NESTED_FIELDS and _nestable(old) and _nestable(value):
+                for key, item in value.items():
+                    if key not in old or _comparable(old[key]) != _comparable(item):
+                        self.set[f"{field}.{key}"] = item
+                self.unset.extend(f"{field}.{key}" for key in old if key not in value)
+            elif field not in stored or _comparable(old) != _comparable(value):
+                self.set[field] = value
+
+        for field in ALWAYS_WRITTEN:
+            if field in current:
+                self.set[field] = current[field]
+
+    @property
+    def changed_fields(self) -> List[str]:
+        changed = [path for path in self.set if path not in ALWAYS_WRITTEN]
+        return sorted(changed + self.unset)
+
+    def columns(self, current: Dict[str, Any]) -> Dict[str, Any]:
+        """Whole new values of every top-level field touched by the diff"""
+        fields = {path.split('.', 1)[0] for path in list(self.set) + self.unset}
+        return {field: current[field] for field in current if field in fields}
+
+
+def diff_product(stored: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Optional[ProductDiff]:
+    """Diff against the stored product, or None when there is nothing stored yet"""
+    if not stored:
+        return None
+    return ProductDiff(stored, current)
@@ -0,0 +1,141 @@
+from typing import Dict, Any, Optional, Set
+from datetime import datetime
+import asyncio
+import json
+import logging
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close code 1013: "try again later", used for evicted slow consumers
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """
+    One WebSocket with its own bounded send queue and writer task
+
+    Producers never await the socket: messages are enqueued without blocking
+    and the writer task drains the queue. A full queue or a send that takes
+    longer than send_timeout marks the client as a slow consumer.
+    """
+
+    def __init__(self, websocket: WebSocket, queue_size: int, send_timeout: float):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.send_timeout = send_timeout
+        self.writer: Optional[asyncio.Task] = None
+
+    def offer(self, message: str) -> bool:
+        """Enqueue a serialized message; False when the queue is full"""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def run_writer(self):
+        """Send queued messages until the socket fails or the task is cancelled"""
+        while True:
+            message = await self.queue.get()
+            await asyncio.wait_for(self.websocket.send_text(message), timeout=self.send_timeout)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), timeout=self.send_timeout)
+        except Exception:
+            # Already closed or unresponsive, nothing left to do
+            pass
+
+
+class GraphUpdateHub:
+    """
+    Fan-out of graph updates to connected WebSocket viewers
+
+    broadcast() serializes a message once and enqueues it on every
+    connection in O(1) each, so the caller (e.g. the webhook worker) never
+    waits for network I/O. Every connection has a writer task, so sends run
+    concurrently. Clients whose queue overflows or whose send times out are
+    evicted instead of delaying everybody else; failed sockets are removed.
+    """
+
+    def __init__(self, queue_size: int = 64, send_timeout: float = 5.0):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.connections: Set[ClientConnection] = set()
+        self._closing: Set[asyncio.Task] = set()
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, self.queue_size, self.send_timeout)
+        connection.writer = asyncio.create_task(self._write(connection))
+        self.connections.add(connection)
+        logger.info(f"WebSocket connected. Total connections: {len(self.connections)}")
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        """Forget a connection and stop its writer"""
+        if connection not in self.connections:
+            return
+        self.connections.discard(connection)
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        logger.info(f"WebSocket disconnected. Total connections: {len(self.connections)}")
+
+    def send(self, connection: ClientConnection, message: Dict[str, Any]):
+        """Queue a message for a single client"""
+        if not connection.offer(self._serialize(message)):
+            self._evict(connection)
+
+    def broadcast(self, message: Dict[str, Any]) -> int:
+        """Queue a message for every client; returns how many accepted it"""
+        payload = self._serialize(message)
+        delivered = 0
+        for connection in list(self.connections):
+            if connection.offer(payload):
+                delivered += 1
+            else:
+                self._evict(connection)
+        return delivered
+
+    def publish_graph_update(self, update_type: str, data: Dict[str, Any]) -> int:
+        """Broadcast a graph_update message"""
+        return self.broadcast({
+            "type": "graph_update",
+            "update_type": update_type,
+            "data": data,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    async def close(self):
+        """Close every connection (application shutdown)"""
+        connections = list(self.connections)
+        for connection in connections:
+            self.disconnect(connection)
+        await asyncio.gather(*(c.close(1001, "server shutdown") for c in connections))
+
+    async def _write(self, connection: ClientConnection):
+        try:
+            await connection.run_writer()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning("WebSocket send timed out, evicting slow consumer")
+            self.disconnect(connection)
+            await connection.close(SLOW_CONSUMER_CLOSE_CODE, "slow consumer")
+        except Exception as e:
+            logger.error(f"Error sending to WebSocket: {str(e)}")
+            self.disconnect(connection)
+            await connection.close()
+
+    def _evict(self, connection: ClientConnection):
+        logger.warning("WebSocket send queue full, evicting slow consumer")
+        self.disconnect(connection)
+        task = asyncio.create_task(connection.close(SLOW_CONSUMER_CLOSE_CODE, "slow consumer"))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    def _serialize(message: Dict[str, Any]) -> str:
+        return json.dumps(message, default=str)
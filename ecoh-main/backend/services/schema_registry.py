@@ -0,0 +1,71 @@
+from typing import Dict, Any, Optional
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaRegistry:
+    """
+    In-memory registry of ACF field definitions
+
+    The acf_schema collection is read once; fields detected afterwards are
+    added to memory immediately and queued, and flush() persists the queue
+    with a single bulk write. One instance is shared by the sync engine
+    and the webhooks.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._fields: Optional[Dict[str, Dict[str, Any]]] = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+        # Bumped on every invalidate() so derived caches know to rebuild
+        self.version = 0
+
+    async def load(self) -> Dict[str, Dict[str, Any]]:
+        """Return all field definitions by code, reading the database only once"""
+        if self._fields is not None:
+            return self._fields
+
+        async with self._lock:
+            if self._fields is None:
+                fields = await self.db.acf_schema.find({}, {"_id": 0}).to_list(None)
+                # Fields registered before the first load are still pending
+                self._fields = {**{f['code']: f for f in fields}, **self._pending}
+                logger.info(f"Schema registry loaded {len(fields)} fields")
+        return self._fields
+
+    async def register(self, fields: Dict[str, Dict[str, Any]]):
+        """Add newly detected fields to memory and queue them for the next flush"""
+        known = await self.load()
+        for code, field in fields.items():
+            known[code] = field
+            self._pending[code] = field
+
+    async def flush(self) -> int:
+        """Persist queued fields with one bulk write; returns how many were written"""
+        if not self._pending:
+            return 0
+
+        pending = self._pending
+        self._pending = {}
+        try:
+            await self.db.acf_schema.bulk_write(
+                [UpdateOne({"code": code}, {"$set": field}, upsert=True) for code, field in pending.items()],
+                ordered=False
+            )
+        except Exception:
+            # Keep them queued for the next flush
+            self._pending = {**pending, **self._pending}
+            raise
+
+        logger.info(f"Schema registry stored {len(pending)} new fields")
+        return len(pending)
+
+    def invalidate(self):
+        """Reload definitions on next use (e.g. after an attribute change in Unopim)"""
+        self._fields = None
+        self.version += 1
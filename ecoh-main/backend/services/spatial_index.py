@@ -0,0 +1,162 @@
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEAF_SIZE = 32
+
+
+def box_planes(lo: Sequence[float], hi: Sequence[float]) -> np.ndarray:
+    """Six inward-facing planes (a, b, c, d) of an axis-aligned box"""
+    planes = np.zeros((6, 4))
+    for axis in range(3):
+        planes[2 * axis, axis] = 1.0
+        planes[2 * axis, 3] = -float(lo[axis])
+        planes[2 * axis + 1, axis] = -1.0
+        planes[2 * axis + 1, 3] = float(hi[axis])
+    return planes
+
+
+def normalize_planes(planes: Sequence[float]) -> np.ndarray:
+    """
+    Planes given as flat (a, b, c, d) groups, e.g. THREE.Frustum planes
+    (normal, constant). A point p is inside when a*x + b*y + c*z + d >= 0
+    for every plane.
+    """
+    planes = np.asarray(planes, dtype=np.float64)
+    if planes.size == 0 or planes.size % 4:
+        raise ValueError("Planes must be groups of four numbers (a, b, c, d)")
+    return planes.reshape(-1, 4)
+
+
+class KDTree:
+    """
+    Static KD-tree over 3D points, stored in flat arrays
+
+    Points are permuted so every tree node covers a contiguous range of
+    ``order``; each node keeps its bounding box. Splits are at the median of
+    the widest axis and leaves hold at most LEAF_SIZE points. Queries are
+    convex regions given as planes: subtrees entirely inside are taken as a
+    whole range, subtrees entirely outside are pruned and only boundary
+    leaves are tested point by point.
+    """
+
+    def __init__(self, positions: np.ndarray, leaf_size: int = LEAF_SIZE):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        n = len(self.positions)
+        self.order = np.arange(n)
+
+        start, end, lo, hi, left, right = [], [], [], [], [], []
+        stack = [(0, n, -1, False)]
+        while stack:
+            s, e, parent, is_right = stack.pop()
+            node = len(start)
+            points = self.positions[self.order[s:e]]
+            start.append(s)
+            end.append(e)
+            lo.append(points.min(axis=0) if e > s else np.zeros(3))
+            hi.append(points.max(axis=0) if e > s else np.zeros(3))
+            left.append(-1)
+            right.append(-1)
+            if parent >= 0:
+                (right if is_right else left)[parent] = node
+
+            if e - s > leaf_size:
+                axis = int(np.argmax(hi[node] - lo[node]))
+                mid = (e - s) // 2
+                partition = np.argpartition(points[:, axis], mid)
+                self.order[s:e] = self.order[s:e][partition]
+                stack.append((s + mid, e, node, True))
+                stack.append((s, s + mid, node, False))
+
+        self.start = np.array(start, dtype=np.int64)
+        self.end = np.array(end, dtype=np.int64)
+        self.lo = np.array(lo).reshape(-1, 3)
+        self.hi = np.array(hi).reshape(-1, 3)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+
+    def query(self, planes: np.ndarray) -> np.ndarray:
+        """Indices of the points inside every plane, in ascending order"""
+        if len(self.positions) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        normals = planes[:, :3]
+        offsets = planes[:, 3]
+        positive = normals >= 0
+        ranges: List[np.ndarray] = []
+        stack = [0]
+
+        while stack:
+            node = stack.pop()
+            lo, hi = self.lo[node], self.hi[node]
+            # Box corner furthest along / against each plane normal
+            farthest = np.where(positive, hi, lo)
+            if np.any(np.einsum('ij,ij->i', normals, farthest) + offsets < 0):
+                continue
+            nearest = np.where(positive, lo, hi)
+            members = self.order[self.start[node]:self.end[node]]
+            if np.all(np.einsum('ij,ij->i', normals, nearest) + offsets >= 0):
+                ranges.append(members)
+            elif self.left[node] < 0:
+                inside = np.all(self.positions[members] @ normals.T + offsets >= 0, axis=1)
+                ranges.append(members[inside])
+            else:
+                stack.append(self.right[node])
+                stack.append(self.left[node])
+
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(ranges))
+
+
+class SpatialIndex:
+    """
+    Viewport queries over a laid-out graph snapshot
+
+    Wraps a KDTree over node positions together with the per-node data used
+    to cap results (size and degree as importance) and the edge endpoint
+    arrays used to select the edges between visible nodes.
+    """
+
+    def __init__(self, graph: Dict[str, Any]):
+        nodes = graph['nodes']
+        node_indices = {node['id']: i for i, node in enumerate(nodes)}
+        edge_ids, pairs = [], []
+        for i, edge in enumerate(graph['edges']):
+            if edge['source'] in node_indices and edge['target'] in node_indices:
+                edge_ids.append(i)
+                pairs.append((node_indices[edge['source']], node_indices[edge['target']]))
+        self.edge_ids = np.array(edge_ids, dtype=np.int64)
+        self.edge_index = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+
+        positions = np.array([[n['x'], n['y'], n['z']] for n in nodes], dtype=np.float64)
+        self.tree = KDTree(positions)
+        self.sizes = np.array([n.get('size', 1.0) for n in nodes], dtype=np.float64)
+        self.degree = np.bincount(self.edge_index.ravel(), minlength=len(nodes))
+
+    def query(self, planes: np.ndarray, limit: Optional[int] = None,
+              min_size: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Nodes inside the planes and the edges between them
+
+        Nodes smaller than min_size are skipped; when more than limit remain,
+        the most important ones (highest degree, then size) are kept.
+        Returns (node indices, edge indices into graph['edges'], match count).
+        """
+        selected = self.tree.query(planes)
+        if min_size is not None:
+            selected = selected[self.sizes[selected] >= min_size]
+        matched = len(selected)
+
+        if limit is not None and matched > limit:
+            # lexsort: last key is primary; ties keep index order
+            rank = np.lexsort((selected, -self.sizes[selected], -self.degree[selected]))
+            selected = np.sort(selected[rank[:limit]])
+
+        visible = np.zeros(len(self.sizes), dtype=bool)
+        visible[selected] = True
+        edge_mask = visible[self.edge_index[:, 0]] & visible[self.edge_index[:, 1]]
+        return selected, self.edge_ids[edge_mask], matched
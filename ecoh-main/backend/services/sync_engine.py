@@ -1,27 +1,58 @@
 import json
 import hashlib
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterable, Awaitable, Callable, Tuple, Union
 from datetime import datetime, timezone
 import logging
 import re
 
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.category_index import CategoryIndex
+from services.graph_cache import CatalogGeneration
+from services.product_diff import ProductDiff, diff_product
+from services.schema_registry import SchemaRegistry
+from services.sync_metrics import SyncMetrics
+from services.sync_pipeline import SyncPipeline
+from services.transform_plan import TransformPlanner
+
 logger = logging.getLogger(__name__)
 
 class SyncEngine:
     """Transforms Unopim data into WordPress-compatible structure"""
     
-    def __init__(self, db):
+    def __init__(self, db, batch_size: int = 500, schema_registry: Optional[SchemaRegistry] = None,
+                 checksum_workers: int = 2, transform_workers: int = 2, write_workers: int = 2,
+                 db_concurrency: int = 4, metrics: Optional[SyncMetrics] = None):
         self.db = db
+        self.batch_size = batch_size
+        self.schema = schema_registry or SchemaRegistry(db)
+        self.metrics = metrics or SyncMetrics()
+        self.catalog = CatalogGeneration(db)
+        self.categories = CategoryIndex(db)
+        self.pipeline = SyncPipeline(
+            self,
+            checksum_workers=checksum_workers,
+            transform_workers=transform_workers,
+            write_workers=write_workers,
+            db_concurrency=db_concurrency
+        )
         self.relationship_fields = [
             'mdcs', 'nics', 'Remotas', 'protocolo', 'comunicacao',
             'tipo_integracao', 'modulos_hemera', 'compativel_medidores',
             'compativel_remotas', 'compativel_mdc'
         ]
+        self.transform_plans = TransformPlanner(
+            self.schema,
+            code_rule=self._is_relationship_code,
+            value_rule=self._is_relationship_value
+        )
     
     async def sync_product(self, unopim_product: Dict[str, Any]) -> Dict[str, Any]:
         """
         Transform Unopim product to WordPress structure
-        Returns transformed product data
+        Returns transformed product data, with the paths it changed in
+        'changed_fields' (empty when unchanged, every field when new)
         """
         logger.info(f"Syncing product: {unopim_product['sku']}")
         
@@ -32,20 +63,24 @@ class SyncEngine:
         existing = await self.db.hemera_products.find_one({"unopim_id": unopim_product['id']})
         if existing and existing.get('checksum') == checksum:
             logger.info(f"Product {unopim_product['sku']} unchanged, skipping")
-            return existing
+            return {**existing, "changed_fields": []}
         
         # Transform data
         transformed = await self._transform_product(unopim_product, checksum)
         
-        # Upsert to database
+        # Write only the paths that differ from the stored document
+        changes = diff_product(existing, transformed)
         await self.db.hemera_products.update_one(
             {"unopim_id": unopim_product['id']},
-            {"$set": transformed},
+            self._update_document(transformed, changes),
             upsert=True
         )
+        await self.catalog.apply(existing, transformed)
+        await self.categories.apply(existing, transformed)
         
-        logger.info(f"Product {unopim_product['sku']} synced successfully")
-        return transformed
+        changed_fields = changes.changed_fields if changes else sorted(transformed)
+        logger.info(f"Product {unopim_product['sku']} synced successfully ({len(changed_fields)} fields changed)")
+        return {**transformed, "changed_fields": changed_fields}
     
     async def _transform_product(self, product: Dict[str, Any], checksum: str) -> Dict[str, Any]:
         """Transform Unopim product structure"""
@@ -53,12 +88,17 @@ class SyncEngine:
         common = values.get('common', {})
         categories = values.get('categories', [])
         
-        # Extract relationships dynamically
+        # Extract relationships with the family's compiled plan
         relationships = {}
         attributes = {}
+        plan = await self.transform_plans.plan(product.get('attribute_family_id'))
+        classify = self.transform_plans.classify
         
         for key, value in common.items():
-            if self._is_relationship_field(key, value):
+            is_relationship = plan.get(key)
+            if is_relationship is None:
+                is_relationship = classify(plan, key, value)
+            if is_relationship:
                 # Parse comma-separated values or arrays
                 relationships[key] = self._parse_relationship_value(value)
             else:
@@ -94,19 +134,15 @@ class SyncEngine:
     
     def _is_relationship_field(self, key: str, value: Any) -> bool:
         """Detect if a field represents relationships"""
-        # Known relationship fields
-        if key in self.relationship_fields:
-            return True
-        
-        # Detect by pattern: comma-separated, array, or 'compativel_' prefix
-        if isinstance(value, str) and ',' in value:
-            return True
-        if isinstance(value, list):
-            return True
-        if key.startswith('compativel_'):
-            return True
-        
-        return False
+        return self._is_relationship_code(key) or self._is_relationship_value(value)
+    
+    def _is_relationship_code(self, key: str) -> bool:
+        """Known relationship fields or the 'compativel_' prefix"""
+        return key in self.relationship_fields or key.startswith('compativel_')
+    
+    def _is_relationship_value(self, value: Any) -> bool:
+        """Value heuristic: comma-separated string or array"""
+        return isinstance(value, list) or (isinstance(value, str) and ',' in value)
     
     def _parse_relationship_value(self, value: Any) -> List[str]:
         """Parse relationship value into list"""
@@ -179,16 +215,17 @@ class SyncEngine:
         """
         Detect new fields in product JSON that don't match existing schema
         Returns dict of new fields with inferred types
+        
+        Checked against the in-memory schema registry; new fields are
+        registered right away so each one is reported once per run.
         """
         values = new_product.get('values', {}).get('common', {})
         
-        # Get existing schema
-        existing_fields = await self.db.acf_schema.find({}).to_list(1000)
-        existing_codes = {f['code'] for f in existing_fields}
+        known_fields = await self.schema.load()
         
         new_fields = {}
         for key, value in values.items():
-            if key not in existing_codes:
+            if key not in known_fields:
                 field_type = self._infer_field_type(value)
                 new_fields[key] = {
                     "code": key,
@@ -197,6 +234,10 @@ class SyncEngine:
                     "detected_at": datetime.now(timezone.utc).isoformat()
                 }
         
+        # Known from now on; persisted by the next schema.flush()
+        if new_fields:
+            await self.schema.register(new_fields)
+        
         return new_fields
     
     def _infer_field_type(self, value: Any) -> str:
@@ -211,8 +252,15 @@ class SyncEngine:
             return 'number'
         return 'text'
     
-    async def handle_discontinued_product(self, unopim_id: int):
-        """Mark product as discontinued when removed from Unopim"""
+    async def handle_discontinued_product(self, unopim_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Mark product as discontinued when removed from Unopim
+        Returns the product state after the change, or None if it was unknown
+        """
+        existing = await self.db.hemera_products.find_one(
+            {"unopim_id": unopim_id},
+            {"_id": 0, "unopim_id": 1, "sku": 1, "checksum": 1, "status": 1}
+        )
         await self.db.hemera_products.update_one(
             {"unopim_id": unopim_id},
             {"$set": {
@@ -221,38 +269,95 @@ class SyncEngine:
             }}
         )
         logger.info(f"Product {unopim_id} marked as discontinued")
+        if not existing:
+            return None
+        
+        discontinued = {**existing, "status": "discontinued"}
+        await self.catalog.apply(existing, discontinued)
+        return discontinued
     
-    async def sync_all_products(self, unopim_products: List[Dict]) -> Dict[str, Any]:
-        """Bulk sync all products"""
-        results = {
-            "synced": 0,
-            "unchanged": 0,
-            "errors": 0,
-            "new_fields": {}
-        }
+    async def sync_all_products(self, unopim_products: Union[List[Dict], AsyncIterable[List[Dict]]],
+                                batch_size: Optional[int] = None,
+                                resume: Optional[Dict[str, Any]] = None,
+                                on_checkpoint: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """
+        Bulk sync all products
+        
+        Products are a list or an async iterable of batches and flow through
+        the staged SyncPipeline in chunks of batch_size: stored checksums are
+        prefetched once, unchanged products are skipped in memory, changed
+        products are transformed and each chunk is written with a single
+        bulk upsert.
+        Products that fail are counted in 'errors' and listed in 'failed'.
+        The run's per-stage timings are returned in 'metrics'.
+        
+        For keyset-ordered streams, on_checkpoint receives the cursor and
+        counters of the committed batches; passing such a checkpoint back
+        as resume (with a stream starting after its cursor) continues the run.
+        """
+        async def flush_then_checkpoint(state: Dict[str, Any]):
+            # Fields detected before the cursor are not seen again on resume
+            await self.schema.flush()
+            await on_checkpoint(state)
+        
+        results = await self.pipeline.run(
+            unopim_products,
+            batch_size or self.batch_size,
+            resume=resume,
+            on_checkpoint=flush_then_checkpoint if on_checkpoint else None
+        )
         
-        for product in unopim_products:
-            try:
-                # Check for schema changes
-                new_fields = await self.detect_schema_changes(product)
-                if new_fields:
-                    results['new_fields'].update(new_fields)
-                    # Store new field definitions
-                    for field_data in new_fields.values():
-                        await self.db.acf_schema.update_one(
-                            {"code": field_data['code']},
-                            {"$set": field_data},
-                            upsert=True
-                        )
-                
-                # Sync product
-                result = await self.sync_product(product)
-                if result:
-                    results['synced'] += 1
-                else:
-                    results['unchanged'] += 1
-            except Exception as e:
-                logger.error(f"Error syncing product {product.get('sku')}: {str(e)}")
-                results['errors'] += 1
+        # New schema fields of the whole run in one write
+        try:
+            await self.schema.flush()
+        except Exception as e:
+            logger.error(f"Error storing {len(results['new_fields'])} new schema fields: {str(e)}")
         
-        return results
\ No newline at end of file
+        return results
+    
+    def _record_failure(self, results: Dict[str, Any], product: Dict, error: Any):
+        logger.error(f"Error syncing product {product.get('sku')}: {str(error)}")
+        results['errors'] += 1
+        results['failed'].append({
+            "unopim_id": product.get('id'),
+            "sku": product.get('sku'),
+            "error": str(error)
+        })
+    
+    async def prefetch_checksums(self) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        """(checksum, status) of every stored product by unopim_id, from one projected query"""
+        cursor = self.db.hemera_products.find({}, {"_id": 0, "unopim_id": 1, "checksum": 1, "status": 1})
+        stored = {product['unopim_id']: (product.get('checksum'), product.get('status')) async for product in cursor}
+        logger.info(f"Prefetched {len(stored)} product checksums")
+        return stored
+    
+    async def _find_stored_products(self, unopim_ids: List[int]) -> Dict[int, Dict]:
+        """Stored documents of the given products, to diff new versions against"""
+        if not unopim_ids:
+            return {}
+        cursor = self.db.hemera_products.find({"unopim_id": {"$in": unopim_ids}}, {"_id": 0})
+        return {product['unopim_id']: product async for product in cursor}
+    
+    def _update_document(self, product: Dict, changes: Optional[ProductDiff]) -> Dict:
+        """$set of the changed paths ($unset of removed ones), or of the whole product when new"""
+        if changes is None:
+            return {"$set": product}
+        update = {"$set": changes.set}
+        if changes.unset:
+            update["$unset"] = {path: "" for path in changes.unset}
+        return update
+    
+    async def _bulk_write(self, writes: List[Tuple[Dict, Optional[ProductDiff]]]) -> Dict[int, str]:
+        """Unordered bulk write of (product, diff) pairs; returns {index: error} for rejected products"""
+        requests = [
+            UpdateOne({"unopim_id": product['unopim_id']}, self._update_document(product, changes), upsert=True)
+            for product, changes in writes
+        ]
+        try:
+            await self.db.hemera_products.bulk_write(requests, ordered=False)
+            return {}
+        except BulkWriteError as e:
+            return {
+                error['index']: error.get('errmsg', 'write error')
+                for error in e.details.get('writeErrors', [])
+            }
@@ -0,0 +1,228 @@
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+import bisect
+import time
+
+# Seconds spent by one stage on one batch
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds of a whole sync run
+RUN_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+# Seconds to process one webhook event
+EVENT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SYNC_STAGES = ("fetch", "checksum", "schema", "transform", "write")
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """A named metric with one series per label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple, Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key in sorted(self._series):
+            lines.extend(self._render_series(key, self._series[key]))
+        return lines
+
+    def _render_series(self, key: Tuple, value: Any) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._series[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Cumulative buckets plus _sum and _count, as Prometheus expects"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # Per-bucket (non-cumulative) counts with a trailing +Inf slot, sum
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _render_series(self, key: Tuple, series: Any) -> List[str]:
+        counts, total = series
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append(
+                f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(bound)))} {cumulative}"
+            )
+        labels = _labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics of the process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+class RunMetrics:
+    """Per-stage breakdown of one sync run, stored with its sync log"""
+
+    def __init__(self, metrics: "SyncMetrics"):
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        # Products finished by this run (not those carried over from a checkpoint)
+        self.processed = 0
+        self.stages: Dict[str, Dict[str, float]] = {
+            stage: {"seconds": 0.0, "batches": 0, "products": 0} for stage in SYNC_STAGES
+        }
+
+    def observe(self, stage: str, seconds: float, products: int):
+        """Record the time one stage spent on one batch"""
+        totals = self.stages[stage]
+        totals['seconds'] += seconds
+        totals['batches'] += 1
+        totals['products'] += products
+        self.metrics.stage_seconds.observe(seconds, stage=stage)
+
+    @contextmanager
+    def time(self, stage: str, products: int):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, products)
+
+    def count(self, results: Dict[str, Any]):
+        """Count the outcomes of one finished batch"""
+        for outcome in ("synced", "unchanged", "errors"):
+            if results.get(outcome):
+                self.metrics.products.inc(results[outcome], outcome=outcome)
+                self.processed += results[outcome]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Wall time, throughput and per-stage busy seconds of the run
+
+        Stage seconds add up the time of every worker of the stage, so with
+        several workers they can exceed the wall time of the run.
+        """
+        duration = time.perf_counter() - self.started
+        return {
+            "duration_seconds": round(duration, 4),
+            "products": self.processed,
+            "products_per_second": round(self.processed / duration, 2) if duration > 0 else None,
+            "stages": {
+                stage: {**totals, "seconds": round(totals['seconds'], 4)}
+                for stage, totals in self.stages.items()
+            }
+        }
+
+
+class SyncMetrics:
+    """
+    Instrumentation of SyncEngine and the webhook worker
+
+    Stage histograms observe the seconds each pipeline stage spends per
+    batch; product counters split outcomes into synced, unchanged and
+    errors; run metrics record duration and throughput per sync mode.
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        self.stage_seconds = self.registry.register(Histogram(
+            "ecoh_sync_stage_seconds", "Seconds spent by a sync stage on one batch",
+            ("stage",), STAGE_BUCKETS
+        ))
+        self.products = self.registry.register(Counter(
+            "ecoh_sync_products_total", "Products processed by syncs by outcome", ("outcome",)
+        ))
+        self.runs = self.registry.register(Counter(
+            "ecoh_sync_runs_total", "Finished sync runs by mode and status", ("mode", "status")
+        ))
+        self.run_seconds = self.registry.register(Histogram(
+            "ecoh_sync_run_seconds", "Duration of sync runs", ("mode",), RUN_BUCKETS
+        ))
+        self.throughput = self.registry.register(Gauge(
+            "ecoh_sync_last_run_products_per_second", "Throughput of the last completed sync run", ("mode",)
+        ))
+        self.webhook_events = self.registry.register(Counter(
+            "ecoh_webhook_events_total", "Processed webhook events", ("entity_type", "status")
+        ))
+        self.webhook_seconds = self.registry.register(Histogram(
+            "ecoh_webhook_event_seconds", "Seconds to process one webhook event", ("entity_type",), EVENT_BUCKETS
+        ))
+
+    def run(self) -> RunMetrics:
+        return RunMetrics(self)
+
+    def record_run(self, mode: str, status: str, breakdown: Optional[Dict[str, Any]] = None):
+        self.runs.inc(mode=mode, status=status)
+        if breakdown:
+            self.run_seconds.observe(breakdown['duration_seconds'], mode=mode)
+            if breakdown.get('products_per_second') is not None:
+                self.throughput.set(breakdown['products_per_second'], mode=mode)
+
+    def record_webhook(self, entity_type: str, status: str, seconds: float):
+        self.webhook_events.inc(entity_type=entity_type, status=status)
+        self.webhook_seconds.observe(seconds, entity_type=entity_type)
+
+    def render(self) -> str:
+        return self.registry.render()
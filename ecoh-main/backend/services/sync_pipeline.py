@@ -0,0 +1,336 @@
+from typing import Dict, Any, List, Optional, AsyncIterable, Awaitable, Callable, Set, Tuple, Union
+import asyncio
+import logging
+import time
+
+from services.product_diff import diff_product
+from services.sync_metrics import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+# End-of-stream marker passed between stages
+_DONE = object()
+
+Keyset = Tuple[Any, Any]
+
+
+def new_results() -> Dict[str, Any]:
+    return {
+        "synced": 0,
+        "unchanged": 0,
+        "errors": 0,
+        "new_fields": {},
+        # Updated products per changed field path
+        "changed_fields": {},
+        "failed": []
+    }
+
+
+def merge_results(total: Dict[str, Any], part: Dict[str, Any]):
+    for key in ("synced", "unchanged", "errors"):
+        total[key] += part.get(key, 0)
+    total['new_fields'].update(part.get('new_fields') or {})
+    for path, count in (part.get('changed_fields') or {}).items():
+        total['changed_fields'][path] = total['changed_fields'].get(path, 0) + count
+    total['failed'].extend(part.get('failed') or [])
+
+
+def product_keyset(product: Dict[str, Any]) -> Optional[Keyset]:
+    """(updated_at, id) position of a product in the connector's keyset order"""
+    if product.get('updated_at') is None:
+        return None
+    return (product['updated_at'], product['id'])
+
+
+class Chunk:
+    """A batch of products moving through the stages with its own counters"""
+
+    def __init__(self, seq: int, products: List[Dict], cursor: Optional[Keyset]):
+        self.seq = seq
+        # Replaced stage by stage with the items still pending
+        self.items: List[Any] = products
+        # Keyset of the chunk's last product
+        self.cursor = cursor
+        self.results = new_results()
+
+
+class SyncRun:
+    """Mutable state of one pipeline run"""
+
+    def __init__(self, stored: Dict[Any, Tuple[Optional[str], Optional[str]]], metrics: RunMetrics,
+                 resume: Optional[Dict[str, Any]] = None):
+        # Prefetched (checksum, status) of every stored product by unopim_id
+        self.stored = stored
+        self.metrics = metrics
+        # Counters of committed chunks only
+        self.results = new_results()
+        self.seen: Set[Any] = set()
+        # Highest (updated_at, id) keyset read by the run
+        self.watermark: Optional[Keyset] = None
+        # Set when per-product generation deltas cannot be trusted
+        self.recompute_generation = False
+
+        # Chunks are numbered as fetched; [0, committed) are fully processed
+        self.fetched = 0
+        self.committed = 0
+        self.cursor: Optional[Keyset] = None
+        self._finished: Dict[int, Chunk] = {}
+        self._saved = 0
+        self._checkpoint_lock = asyncio.Lock()
+
+        if resume:
+            merge_results(self.results, resume.get('results') or {})
+            cursor = resume.get('cursor')
+            if cursor:
+                self.cursor = self.watermark = (cursor['updated_at'], cursor['id'])
+            # Batches written after the checkpoint may lack their generation delta
+            self.recompute_generation = True
+
+    def finish(self, chunk: Chunk) -> bool:
+        """Mark a chunk done; returns True when the committed prefix moved"""
+        self._finished[chunk.seq] = chunk
+        advanced = False
+        while self.committed in self._finished:
+            done = self._finished.pop(self.committed)
+            merge_results(self.results, done.results)
+            self.metrics.count(done.results)
+            if done.cursor is not None:
+                self.cursor = done.cursor
+            self.committed += 1
+            advanced = True
+        return advanced
+
+    def checkpoint(self) -> Dict[str, Any]:
+        cursor = {"updated_at": self.cursor[0], "id": self.cursor[1]} if self.cursor else None
+        return {"cursor": cursor, "results": self.results}
+
+
+class SyncPipeline:
+    """
+    Staged full-sync pipeline: fetch -> checksum/skip -> transform -> write
+
+    Stages are connected by bounded asyncio.Queues carrying chunks of
+    products, and each stage runs its own pool of workers, so fetching,
+    hashing, transforming and writing overlap and a run is limited by the
+    slowest stage instead of the sum of all latencies. A semaphore caps the
+    number of concurrent database operations across all stages so the
+    connection pool is never exhausted. Writes stay chunked bulk writes:
+    new products are inserted whole, stored ones only get the fields that
+    differ from their stored version.
+
+    Stored checksums are prefetched once per run with a single projected
+    query, so unchanged products are discarded in memory without any
+    database round-trip.
+
+    Every stage reports its time per chunk to the engine's SyncMetrics; the
+    per-stage breakdown of the run is returned in results['metrics'].
+
+    Chunks finish out of order; a chunk only counts as committed once every
+    chunk fetched before it is done too. Whenever that committed prefix
+    grows, on_checkpoint receives the keyset cursor of its last product and
+    the counters of the committed chunks, so a keyset-ordered source can be
+    resumed after the cursor without skipping or double counting anything.
+    """
+
+    def __init__(self, engine, checksum_workers: int = 2, transform_workers: int = 2,
+                 write_workers: int = 2, db_concurrency: int = 4, queue_size: int = 4):
+        self.engine = engine
+        self.checksum_workers = max(1, checksum_workers)
+        self.transform_workers = max(1, transform_workers)
+        self.write_workers = max(1, write_workers)
+        self.db_concurrency = max(1, db_concurrency)
+        self.queue_size = max(1, queue_size)
+
+    async def run(self, source: Union[List[Dict], AsyncIterable[List[Dict]]], batch_size: int,
+                  resume: Optional[Dict[str, Any]] = None,
+                  on_checkpoint: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """
+        Sync every product from source, a list of products or an async
+        iterable of product batches, and return the aggregated results
+
+        resume is a checkpoint of an interrupted run whose counters are
+        carried over; source must then start after its cursor.
+        """
+        db_slots = asyncio.Semaphore(self.db_concurrency)
+        metrics = self.engine.metrics.run()
+        async with db_slots:
+            run = SyncRun(await self.engine.prefetch_checksums(), metrics, resume)
+        to_check = asyncio.Queue(maxsize=self.queue_size)
+        to_transform = asyncio.Queue(maxsize=self.queue_size)
+        to_write = asyncio.Queue(maxsize=self.queue_size)
+
+        async def finish(chunk: Chunk):
+            if run.finish(chunk) and on_checkpoint is not None:
+                await self._checkpoint(run, on_checkpoint, db_slots)
+
+        async def fetch():
+            started = time.perf_counter()
+            async for products in self._chunks(source, batch_size):
+                metrics.observe("fetch", time.perf_counter() - started, len(products))
+                chunk = Chunk(run.fetched, products, product_keyset(products[-1]))
+                run.fetched += 1
+                await to_check.put(chunk)
+                started = time.perf_counter()
+            for _ in range(self.checksum_workers):
+                await to_check.put(_DONE)
+
+        async def check(chunk: Chunk):
+            await self._check(run, chunk)
+            await (to_transform.put(chunk) if chunk.items else finish(chunk))
+
+        async def transform(chunk: Chunk):
+            with metrics.time("transform", len(chunk.items)):
+                await self._transform(chunk)
+            await (to_write.put(chunk) if chunk.items else finish(chunk))
+
+        async def write(chunk: Chunk):
+            with metrics.time("write", len(chunk.items)):
+                await self._write(run, chunk, db_slots)
+            await finish(chunk)
+
+        tasks = [
+            asyncio.create_task(fetch()),
+            asyncio.create_task(self._stage(check, to_check, self.checksum_workers,
+                                            to_transform, self.transform_workers)),
+            asyncio.create_task(self._stage(transform, to_transform, self.transform_workers,
+                                            to_write, self.write_workers)),
+            asyncio.create_task(self._stage(write, to_write, self.write_workers))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        if run.recompute_generation:
+            await self.engine.catalog.recompute()
+        results = run.results
+        if run.watermark is not None:
+            results['watermark'] = {"updated_at": run.watermark[0], "id": run.watermark[1]}
+        results['metrics'] = metrics.summary()
+        return results
+
+    async def _stage(self, handler: Callable[[Any], Awaitable[None]], inbox: asyncio.Queue, workers: int,
+                     outbox: Optional[asyncio.Queue] = None, downstream_workers: int = 0):
+        """Run handler on inbox items with several workers, then close the outbox"""
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    return
+                await handler(item)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        if outbox is not None:
+            for _ in range(downstream_workers):
+                await outbox.put(_DONE)
+
+    async def _chunks(self, source: Union[List[Dict], AsyncIterable[List[Dict]]], batch_size: int):
+        if isinstance(source, list):
+            for start in range(0, len(source), batch_size):
+                yield source[start:start + batch_size]
+        else:
+            async for batch in source:
+                if batch:
+                    yield batch
+
+    async def _checkpoint(self, run: SyncRun, on_checkpoint: Callable[[Dict[str, Any]], Awaitable[None]],
+                          db_slots: asyncio.Semaphore):
+        """Save the committed prefix; serialized so checkpoints never go backwards"""
+        async with run._checkpoint_lock:
+            if run.committed == run._saved:
+                return
+            committed = run.committed
+            try:
+                async with db_slots:
+                    await on_checkpoint(run.checkpoint())
+                run._saved = committed
+            except Exception as e:
+                # A missed checkpoint only means more work is redone on resume
+                logger.error(f"Error saving sync checkpoint: {str(e)}")
+
+    async def _check(self, run: SyncRun, chunk: Chunk):
+        """Drop unchanged products; keeps (product, previous, checksum) for the rest"""
+        engine = self.engine
+        pending = []
+        schema_seconds = checksum_seconds = 0.0
+        for product in chunk.items:
+            try:
+                keyset = product_keyset(product)
+                if keyset is not None and (run.watermark is None or keyset > run.watermark):
+                    run.watermark = keyset
+
+                # Check for schema changes
+                started = time.perf_counter()
+                chunk.results['new_fields'].update(await engine.detect_schema_changes(product))
+                detected = time.perf_counter()
+                schema_seconds += detected - started
+
+                # Sharded extraction computes it in its decode workers
+                checksum = product.get('checksum') or engine._calculate_checksum(product['values'])
+                checksum_seconds += time.perf_counter() - detected
+                stored = run.stored.get(product['id'])
+                if stored and stored[0] == checksum:
+                    chunk.results['unchanged'] += 1
+                    continue
+
+                # The same product twice in one run: writes may land in any order
+                if product['id'] in run.seen:
+                    run.recompute_generation = True
+                run.seen.add(product['id'])
+                # Just what the catalog fingerprint of the old version needs
+                previous = {"unopim_id": product['id'], "checksum": stored[0], "status": stored[1]} if stored else None
+                pending.append((product, previous, checksum))
+            except Exception as e:
+                engine._record_failure(chunk.results, product, e)
+        run.metrics.observe("schema", schema_seconds, len(chunk.items))
+        run.metrics.observe("checksum", checksum_seconds, len(chunk.items))
+        chunk.items = pending
+
+    async def _transform(self, chunk: Chunk):
+        pending = []
+        for product, previous, checksum in chunk.items:
+            try:
+                transformed = await self.engine._transform_product(product, checksum)
+                pending.append((product, previous, transformed))
+            except Exception as e:
+                self.engine._record_failure(chunk.results, product, e)
+        chunk.items = pending
+
+    async def _write(self, run: SyncRun, chunk: Chunk, db_slots: asyncio.Semaphore):
+        """Diff one chunk against storage, bulk write it and apply its catalog and category count deltas"""
+        engine = self.engine
+        items = chunk.items
+        async with db_slots:
+            stored = await engine._find_stored_products(
+                [transformed['unopim_id'] for _, previous, transformed in items if previous]
+            )
+            writes = [
+                (transformed, diff_product(stored.get(transformed['unopim_id']), transformed))
+                for _, _, transformed in items
+            ]
+            write_errors = await engine._bulk_write(writes)
+
+        changed_fields = chunk.results['changed_fields']
+        for index, (product, _, _) in enumerate(items):
+            if index in write_errors:
+                engine._record_failure(chunk.results, product, write_errors[index])
+                continue
+            chunk.results['synced'] += 1
+            changes = writes[index][1]
+            for path in (changes.changed_fields if changes else []):
+                changed_fields[path] = changed_fields.get(path, 0) + 1
+
+        if write_errors:
+            # Partially written chunk: derive the generation from storage once the run ends
+            run.recompute_generation = True
+        elif not run.recompute_generation:
+            async with db_slots:
+                await engine.catalog.apply_many((previous, transformed) for _, previous, transformed in items)
+        await engine.categories.apply_many(
+            (stored.get(transformed['unopim_id']), transformed)
+            for index, (_, _, transformed) in enumerate(items) if index not in write_errors
+        )
+
+        logger.info(f"Wrote batch of {len(items)}: {len(items) - len(write_errors)} written, {len(write_errors)} failed")
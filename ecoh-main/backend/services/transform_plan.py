@@ -0,0 +1,59 @@
+from typing import Dict, Any, List, Optional, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TransformPlanner:
+    """
+    Compiles per-family transformation plans
+
+    A plan maps every attribute code seen in one attribute family to its
+    handling: relationship (parsed into a list of targets) or plain
+    attribute. Each code is classified once per family, by the first source
+    that knows it: the Unopim attribute metadata, the ACF schema registry,
+    the engine's code rules, and the value heuristic only for codes none of
+    them knows. Plans are dropped whenever the registry is invalidated or
+    new attribute metadata is loaded.
+    """
+
+    def __init__(self, schema_registry,
+                 code_rule: Callable[[str], bool],
+                 value_rule: Callable[[Any], bool]):
+        self.schema = schema_registry
+        self.code_rule = code_rule
+        self.value_rule = value_rule
+        self._attributes: Dict[str, bool] = {}
+        self._fields: Dict[str, Dict[str, Any]] = {}
+        self._plans: Dict[Any, Dict[str, bool]] = {}
+        self._schema_version: Optional[int] = None
+
+    def set_attributes(self, attributes: List[Dict[str, Any]]):
+        """Use Unopim attribute definitions (fetch_attributes) as metadata"""
+        self._attributes = {
+            attribute['code']: bool(attribute['is_relationship'])
+            for attribute in attributes
+            if attribute.get('is_relationship') is not None
+        }
+        self._plans = {}
+        logger.info(f"Transform plans reset with {len(self._attributes)} attribute definitions")
+
+    async def plan(self, family_id: Any) -> Dict[str, bool]:
+        """{code: is_relationship} of a family, extended by classify()"""
+        if self._schema_version != self.schema.version:
+            self._fields = await self.schema.load()
+            self._schema_version = self.schema.version
+            self._plans = {}
+        return self._plans.setdefault(family_id, {})
+
+    def classify(self, plan: Dict[str, bool], code: str, value: Any) -> bool:
+        """Classify a code the plan has not seen yet and remember it"""
+        field = self._fields.get(code)
+        if code in self._attributes:
+            is_relationship = self._attributes[code]
+        elif field is not None and field.get('is_relationship') is not None:
+            is_relationship = bool(field['is_relationship'])
+        else:
+            is_relationship = self.code_rule(code) or self.value_rule(value)
+        plan[code] = is_relationship
+        return is_relationship
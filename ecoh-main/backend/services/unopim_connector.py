@@ -1,55 +1,520 @@
+import asyncio
 import hashlib
 import json
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timezone
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, AsyncIterator, Set, Tuple
+from datetime import datetime, timedelta, timezone
 import logging
 
+from services.ttl_cache import TTLCache
+from services.unopim_source import SOURCES, parse_timestamp
+
 logger = logging.getLogger(__name__)
 
+# Outbox filled by triggers on products (see seed_unopim.py)
+CHANGES_TABLE = "product_changes"
+
+# Ids per keyed product query
+LOOKUP_BATCH_SIZE = 500
+
+# Seconds before the first retry of a failed extraction shard, doubled per attempt
+SHARD_RETRY_DELAY = 1.0
+
+# Sharded extraction queue marker of a finished shard
+_SHARD_DONE = object()
+
+# Product columns the sync engine reads; `values` is pruned to these keys
+PRODUCT_COLUMNS = """
+    SELECT id, sku, status, type, attribute_family_id,
+           JSON_EXTRACT(`values`, '$.common') AS common_values,
+           JSON_EXTRACT(`values`, '$.categories') AS category_codes,
+           avg_completeness_score, created_at, updated_at
+    FROM products
+"""
+
+
+def db_config_from_env() -> Optional[Dict[str, Any]]:
+    """Connector db_config from UNOPIM_DB_* variables; None (mock mode) when no driver is set"""
+    driver = os.environ.get('UNOPIM_DB_TYPE', '').strip().lower()
+    if not driver:
+        return None
+    return {
+        "driver": driver,
+        "host": os.environ.get('UNOPIM_DB_HOST', 'localhost'),
+        "port": int(os.environ.get('UNOPIM_DB_PORT', 3306)),
+        "user": os.environ.get('UNOPIM_DB_USER', 'root'),
+        "password": os.environ.get('UNOPIM_DB_PASSWORD', ''),
+        "database": os.environ.get('UNOPIM_DB_NAME', 'unopim'),
+        "path": os.environ.get('UNOPIM_DB_PATH', 'unopim.sqlite3'),
+        "pool_size": int(os.environ.get('UNOPIM_DB_POOL_SIZE', 5)),
+        "stream_window": int(os.environ.get('UNOPIM_STREAM_WINDOW', 5000)),
+        "cache_size": int(os.environ.get('UNOPIM_CACHE_SIZE', 1024)),
+        "cache_ttl": float(os.environ.get('UNOPIM_CACHE_TTL', 30)),
+        "watermark_margin": float(os.environ.get('UNOPIM_WATERMARK_MARGIN', 300)),
+        "extract_shards": int(os.environ.get('UNOPIM_EXTRACT_SHARDS', 1)),
+        "shard_retries": int(os.environ.get('UNOPIM_SHARD_RETRIES', 3)),
+        "decode_workers": int(os.environ.get('UNOPIM_DECODE_WORKERS', 0))
+    }
+
+
+def _json(value: Any, default: Any) -> Any:
+    if value is None:
+        return default
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode()
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _timestamp(value: Any) -> Optional[str]:
+    """Database timestamp in the connector's "2025-11-05T23:18:58Z" form"""
+    timestamp = parse_timestamp(value)
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%SZ') if timestamp else None
+
+
+def values_checksum(values: Dict[str, Any]) -> str:
+    """MD5 of the product values, as SyncEngine computes it for change detection"""
+    return hashlib.md5(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+def decode_product(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Product dict in the shape of the mock data from a pruned row"""
+    return {
+        "id": row['id'],
+        "sku": row['sku'],
+        "status": int(row['status'] or 0),
+        "type": row['type'],
+        "attribute_family_id": row['attribute_family_id'],
+        "values": {
+            "common": _json(row['common_values'], {}),
+            "categories": _json(row['category_codes'], [])
+        },
+        "avg_completeness_score": row['avg_completeness_score'],
+        "created_at": _timestamp(row['created_at']),
+        "updated_at": _timestamp(row['updated_at'])
+    }
+
+
+def decode_products(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Decoded products carrying the checksum of their values; runs off the event loop"""
+    products = []
+    for row in rows:
+        product = decode_product(row)
+        product['checksum'] = values_checksum(product['values'])
+        products.append(product)
+    return products
+
+
+class ExtractionShard:
+    """Id range (after_id, high] of a sharded extraction and its progress"""
+
+    def __init__(self, index: int, after_id: int, high: int):
+        self.index = index
+        # Last id read; a retried shard restarts after it
+        self.after_id = after_id
+        self.high = high
+        self.products = 0
+        self.failures = 0
+        self.done = False
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "shard": self.index,
+            "last_id": self.after_id,
+            "high": self.high,
+            "products": self.products,
+            "failures": self.failures,
+            "done": self.done
+        }
+
 class UopimConnector:
     """Handles connection and data retrieval from Unopim database"""
     
-    def __init__(self, db_config: Optional[Dict[str, str]] = None):
+    def __init__(self, db_config: Optional[Dict[str, Any]] = None):
         """
         Initialize connector
         
-        For production, db_config should contain:
-        - host, port, database, user, password for MySQL/PostgreSQL
-        
-        For now, we'll work with mock data
+        Without db_config the connector serves mock data. For production,
+        db_config (see db_config_from_env) holds a driver, "mysql" for the
+        Unopim database through an aiomysql pool or "sqlite" for a local
+        stand-in seeded by seed_unopim.py, and its connection settings.
         """
         self.db_config = db_config
         self.connected = False
+        self.source = None
+        # Rows per keyset window (one buffered query); longer runs restart after the last keyset
+        self.stream_window = int((db_config or {}).get('stream_window', 5000))
+        # Hot products by id; entries expire so lookups never serve old data for long
+        self.product_cache = TTLCache(
+            maxsize=int((db_config or {}).get('cache_size', 1024)),
+            ttl=float((db_config or {}).get('cache_ttl', 30))
+        )
+        # Ids requested in the current loop iteration, resolved by one batch query
+        self._pending_ids: Dict[int, asyncio.Future] = {}
+        self._lookups: Set[asyncio.Task] = set()
+        self._mock_index: Optional[Dict[int, Dict[str, Any]]] = None
+        # Seconds re-read before an incremental watermark (see watermark_since)
+        self.watermark_margin = float((db_config or {}).get('watermark_margin', 300))
+        # Concurrent id ranges of iter_products_sharded, each retried up to shard_retries times
+        self.extract_shards = int((db_config or {}).get('extract_shards', 1))
+        self.shard_retries = int((db_config or {}).get('shard_retries', 3))
+        # Processes decoding sharded rows; 0 decodes them in a thread instead
+        self.decode_workers = int((db_config or {}).get('decode_workers', 0))
+        self._decode_pool: Optional[ProcessPoolExecutor] = None
+        self.shards: List[ExtractionShard] = []
         
     async def connect(self):
         """Establish database connection"""
         if self.db_config:
-            # In production, connect to actual Unopim database
-            # import aiomysql or asyncpg
-            pass
+            driver = self.db_config.get('driver', 'mysql')
+            if driver not in SOURCES:
+                raise ValueError(f"Unknown Unopim database driver: {driver}")
+            self.source = SOURCES[driver](self.db_config)
+            await self.source.connect()
+            if self.decode_workers > 0:
+                self._decode_pool = ProcessPoolExecutor(max_workers=self.decode_workers)
+            logger.info(f"Unopim connector initialized ({driver} mode)")
+        else:
+            logger.info("Unopim connector initialized (mock mode)")
         self.connected = True
-        logger.info("Unopim connector initialized (mock mode)")
+    
+    async def close(self):
+        """Release database connections"""
+        if self.source:
+            await self.source.close()
+            self.source = None
+        if self._decode_pool:
+            self._decode_pool.shutdown(cancel_futures=True)
+            self._decode_pool = None
+        self.connected = False
         
     async def fetch_products(self, filters: Optional[Dict] = None) -> List[Dict[str, Any]]:
         """
         Fetch products from Unopim
         
-        In production, this would query:
-        SELECT id, sku, status, type, parent_id, attribute_family_id, 
-               values, additional, created_at, updated_at
+        In database mode, this streams every product through iter_products.
+        """
+        if self.source is None:
+            # Mock implementation returns sample data
+            return self._get_mock_products()
+        products = []
+        async for page in self.iter_products():
+            products.extend(page)
+        return products
+    
+    async def iter_products(self, batch_size: int = 500, since: Optional[str] = None,
+                            after: Optional[Tuple[str, int]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream products in pages of at most batch_size
+        
+        Pages follow the (updated_at, id) keyset, so each page is an index
+        range scan that starts where the previous one ended and only one
+        page is held in memory. When since is given, only products updated
+        at or after that timestamp are returned; when after is given (a
+        sync checkpoint cursor), only products past that keyset.
+        
+        In database mode the keyset range is read in windows of up to
+        stream_window rows, one buffered query each; pages are cut from
+        the current window as the caller consumes them.
+        """
+        if self.source is not None:
+            async for page in self._stream_products(batch_size, after, since):
+                yield page
+            return
+        
+        while True:
+            page = await self._fetch_page(batch_size, after, since)
+            if not page:
+                return
+            yield page
+            if len(page) < batch_size:
+                return
+            last = page[-1]
+            after = (last['updated_at'], last['id'])
+    
+    async def _stream_products(self, batch_size: int, after: Optional[Tuple[str, int]],
+                               since: Optional[str]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream the keyset range from the database
+        
+        Each window is one query:
+        SELECT <PRODUCT_COLUMNS>
+        FROM products
+        WHERE updated_at >= %s
+          AND (updated_at > %s OR (updated_at = %s AND id > %s))
+        ORDER BY updated_at, id
+        LIMIT <stream_window>
+        """
+        while True:
+            conditions, params = self._keyset_filter(since, after)
+            query = PRODUCT_COLUMNS
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += " ORDER BY updated_at, id LIMIT %s"
+            params.append(self.stream_window)
+            
+            streamed = 0
+            async for rows in self.source.stream(query, params, batch_size):
+                page = [decode_product(row) for row in rows]
+                streamed += len(page)
+                yield page
+                after = (page[-1]['updated_at'], page[-1]['id'])
+            if streamed < self.stream_window:
+                return
+    
+    def watermark_since(self, watermark: Dict[str, Any]) -> str:
+        """
+        `since` timestamp of an incremental run after a stored watermark
+        
+        Unopim timestamps have one-second precision and rows become visible
+        at commit, so a strict keyset after the watermark would skip rows
+        updated within its second with a lower id, or committed with an
+        earlier updated_at than rows already read. The run re-reads
+        watermark_margin seconds before the watermark instead.
+        """
+        since = parse_timestamp(watermark['updated_at']) - timedelta(seconds=self.watermark_margin)
+        return since.strftime('%Y-%m-%dT%H:%M:%SZ')
+    
+    def _keyset_filter(self, since: Optional[str], after: Optional[Tuple[str, int]]) -> Tuple[List[str], List[Any]]:
+        """WHERE conditions and params for the since / after arguments of iter_products"""
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("updated_at >= %s")
+            params.append(self.source.time_param(since))
+        if after is not None:
+            after_time = self.source.time_param(after[0])
+            conditions.append("(updated_at > %s OR (updated_at = %s AND id > %s))")
+            params.extend([after_time, after_time, after[1]])
+        return conditions, params
+    
+    async def iter_products_sharded(self, batch_size: int = 500, since: Optional[str] = None,
+                                    after: Optional[Tuple[str, int]] = None,
+                                    shards: Optional[int] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream the products of iter_products from concurrent id ranges
+        
+        The id space is split into `shards` (default extract_shards) equal
+        ranges, each streamed on its own pooled connection; their pages are
+        merged into one stream as they arrive, so pages are NOT in keyset
+        order and cannot be checkpointed by cursor. Rows are decoded, and
+        the checksum of their values computed (as product['checksum']), off
+        the event loop: in a thread, or in a pool of decode_workers
+        processes. Pickling rows to the processes and decoded products back
+        costs about two thirds of the decode itself, so the pool only pays
+        off with several idle cores.
+        
+        A failed range is retried from its last id up to shard_retries
+        times with a growing delay; progress of every range is kept in
+        self.shards (see extraction_progress). Without a database, or with
+        a single shard, this is iter_products.
+        """
+        shards = shards or self.extract_shards
+        if self.source is None or shards <= 1:
+            async for page in self.iter_products(batch_size, since=since, after=after):
+                yield page
+            return
+        
+        bounds = await self.source.fetch_all("SELECT MIN(id) AS low, MAX(id) AS high FROM products")
+        low, high = (bounds[0]['low'], bounds[0]['high']) if bounds else (None, None)
+        if low is None:
+            self.shards = []
+            return
+        span = -(-(high - low + 1) // shards)
+        self.shards = [
+            ExtractionShard(index, low - 1 + start, min(low - 1 + start + span, high))
+            for index, start in enumerate(range(0, high - low + 1, span))
+        ]
+        logger.info(f"Extracting products {low}-{high} in {len(self.shards)} shards")
+        
+        pages: asyncio.Queue = asyncio.Queue(maxsize=2 * len(self.shards))
+        
+        async def read(shard: ExtractionShard):
+            try:
+                await self._read_shard(shard, batch_size, since, after, pages)
+            except Exception as e:
+                await pages.put(e)
+                return
+            await pages.put(_SHARD_DONE)
+        
+        tasks = [asyncio.create_task(read(shard)) for shard in self.shards]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                page = await pages.get()
+                if page is _SHARD_DONE:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _read_shard(self, shard: ExtractionShard, batch_size: int, since: Optional[str],
+                          after: Optional[Tuple[str, int]], pages: asyncio.Queue):
+        while True:
+            try:
+                async for page in self._stream_shard(shard, batch_size, since, after):
+                    await pages.put(page)
+                shard.done = True
+                logger.info(f"Shard {shard.index} extracted {shard.products} products")
+                return
+            except Exception as e:
+                shard.failures += 1
+                if shard.failures > self.shard_retries:
+                    logger.error(f"Shard {shard.index} failed after id {shard.after_id}: {str(e)}")
+                    raise
+                delay = SHARD_RETRY_DELAY * 2 ** (shard.failures - 1)
+                logger.warning(
+                    f"Shard {shard.index} failed after id {shard.after_id}, "
+                    f"retry {shard.failures}/{self.shard_retries} in {delay}s: {str(e)}"
+                )
+                await asyncio.sleep(delay)
+    
+    async def _stream_shard(self, shard: ExtractionShard, batch_size: int, since: Optional[str],
+                            after: Optional[Tuple[str, int]]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream one id range in windows, decoding each batch off the event loop
+        
+        SELECT <PRODUCT_COLUMNS>
         FROM products
-        WHERE status = 1
+        WHERE id > %s AND id <= %s [AND <since / after filters>]
+        ORDER BY id
+        LIMIT <stream_window>
         """
-        # Mock implementation returns sample data
-        return self._get_mock_products()
+        loop = asyncio.get_running_loop()
+        while True:
+            conditions, params = self._keyset_filter(since, after)
+            conditions = ["id > %s", "id <= %s"] + conditions
+            params = [shard.after_id, shard.high] + params + [self.stream_window]
+            query = PRODUCT_COLUMNS + " WHERE " + " AND ".join(conditions) + " ORDER BY id LIMIT %s"
+            
+            streamed = 0
+            async for rows in self.source.stream(query, params, batch_size):
+                if self._decode_pool:
+                    page = await loop.run_in_executor(self._decode_pool, decode_products, rows)
+                else:
+                    page = await asyncio.to_thread(decode_products, rows)
+                streamed += len(rows)
+                shard.after_id = page[-1]['id']
+                shard.products += len(page)
+                yield page
+            if streamed < self.stream_window:
+                return
+    
+    def extraction_progress(self) -> List[Dict[str, Any]]:
+        """Per-shard progress of the current or last sharded extraction"""
+        return [shard.progress() for shard in self.shards]
+    
+    async def _fetch_page(self, batch_size: int, after: Optional[Tuple[str, int]],
+                          since: Optional[str]) -> List[Dict[str, Any]]:
+        """Fetch one keyset page of the mock data"""
+        products = sorted(self._get_mock_products(), key=lambda p: (p['updated_at'], p['id']))
+        if since is not None:
+            products = [p for p in products if p['updated_at'] >= since]
+        if after is not None:
+            products = [p for p in products if (p['updated_at'], p['id']) > after]
+        return products[:batch_size]
     
     async def fetch_product_by_id(self, product_id: int) -> Optional[Dict[str, Any]]:
-        """Fetch single product by ID"""
-        products = await self.fetch_products()
-        for p in products:
-            if p['id'] == product_id:
-                return p
-        return None
+        """
+        Fetch single product by ID
+        
+        Served from the TTL cache when hot. Otherwise concurrent lookups
+        (e.g. a burst of webhooks) are coalesced: every id requested in the
+        same event loop iteration is resolved by one fetch_products_by_ids.
+        """
+        cached = self.product_cache.get(product_id)
+        if cached is not None:
+            return cached
+        
+        future = self._pending_ids.get(product_id)
+        if future is None:
+            if not self._pending_ids:
+                lookup = asyncio.create_task(self._resolve_pending())
+                self._lookups.add(lookup)
+                lookup.add_done_callback(self._lookups.discard)
+            future = self._pending_ids[product_id] = asyncio.get_running_loop().create_future()
+        return await asyncio.shield(future)
+    
+    async def _resolve_pending(self):
+        # Runs after the current loop iteration, once every concurrent caller registered its id
+        await asyncio.sleep(0)
+        pending, self._pending_ids = self._pending_ids, {}
+        try:
+            products = await self.fetch_products_by_ids(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for product_id, future in pending.items():
+            if not future.done():
+                future.set_result(products.get(product_id))
+    
+    async def fetch_products_by_ids(self, product_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Fetch many products by ID, returned as {id: product} (missing ids omitted)
+        
+        Cached products are reused; the rest are read with keyed queries of
+        up to LOOKUP_BATCH_SIZE ids:
+        SELECT <PRODUCT_COLUMNS> FROM products WHERE id IN (%s, ...)
+        """
+        products = {}
+        missing = []
+        for product_id in dict.fromkeys(product_ids):
+            cached = self.product_cache.get(product_id)
+            if cached is not None:
+                products[product_id] = cached
+            else:
+                missing.append(product_id)
+        
+        for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            for product in await self._load_products(missing[start:start + LOOKUP_BATCH_SIZE]):
+                self.product_cache.set(product['id'], product)
+                products[product['id']] = product
+        return products
+    
+    async def _load_products(self, product_ids: List[int]) -> List[Dict[str, Any]]:
+        if self.source is None:
+            if self._mock_index is None:
+                self._mock_index = {p['id']: p for p in self._get_mock_products()}
+            return [self._mock_index[i] for i in product_ids if i in self._mock_index]
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        rows = await self.source.fetch_all(PRODUCT_COLUMNS + f" WHERE id IN ({placeholders})", product_ids)
+        return [decode_product(row) for row in rows]
+    
+    async def fetch_changes(self, after: int, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Product changes recorded after the outbox position `after`, oldest first
+        
+        SELECT id, product_id, operation
+        FROM product_changes
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s
+        
+        Mock mode has no outbox and never reports changes.
+        """
+        if self.source is None:
+            return []
+        return await self.source.fetch_all(
+            f"SELECT id, product_id, operation FROM {CHANGES_TABLE} WHERE id > %s ORDER BY id LIMIT %s",
+            (after, limit)
+        )
+    
+    async def latest_change_id(self) -> int:
+        """Newest outbox position (0 when empty or in mock mode)"""
+        if self.source is None:
+            return 0
+        rows = await self.source.fetch_all(f"SELECT MAX(id) AS id FROM {CHANGES_TABLE}")
+        return (rows[0]['id'] if rows else None) or 0
+    
+    def forget_product(self, product_id: int):
+        """Drop a cached product (it changed in Unopim)"""
+        self.product_cache.pop(product_id)
     
     async def fetch_attributes(self) -> List[Dict[str, Any]]:
         """
@@ -57,8 +522,28 @@ class UopimConnector:
         
         SELECT code, type, is_required, is_unique, is_filterable, position
         FROM attributes
+        
+        Unopim has no relationship flag, so database rows carry
+        is_relationship None and the sync engine classifies those codes.
         """
-        return self._get_mock_attributes()
+        if self.source is None:
+            return self._get_mock_attributes()
+        rows = await self.source.fetch_all(
+            "SELECT code, type, is_required, is_unique, is_filterable, position "
+            "FROM attributes ORDER BY position, id"
+        )
+        return [
+            {
+                "code": row['code'],
+                "type": row['type'],
+                "is_required": bool(row['is_required']),
+                "is_unique": bool(row['is_unique']),
+                "is_filterable": bool(row['is_filterable']),
+                "position": row['position'],
+                "is_relationship": None
+            }
+            for row in rows
+        ]
     
     async def fetch_categories(self) -> List[Dict[str, Any]]:
         """
@@ -67,12 +552,31 @@ class UopimConnector:
         SELECT id, code, parent_id, additional_data
         FROM categories
         """
-        return self._get_mock_categories()
+        if self.source is None:
+            return self._get_mock_categories()
+        rows = await self.source.fetch_all(
+            "SELECT id, code, parent_id, additional_data FROM categories ORDER BY id"
+        )
+        return [
+            {
+                "id": row['id'],
+                "code": row['code'],
+                "parent_id": row['parent_id'],
+                "name": self._category_name(_json(row['additional_data'], {})) or row['code']
+            }
+            for row in rows
+        ]
+    
+    def _category_name(self, additional_data: Dict[str, Any]) -> Optional[str]:
+        """First translated name in Unopim's additional_data.locale_specific"""
+        for values in (additional_data.get('locale_specific') or {}).values():
+            if isinstance(values, dict) and values.get('name'):
+                return values['name']
+        return additional_data.get('name')
     
     def calculate_checksum(self, data: Dict[str, Any]) -> str:
         """Calculate MD5 checksum of JSON data for change detection"""
-        json_str = json.dumps(data, sort_keys=True)
-        return hashlib.md5(json_str.encode()).hexdigest()
+        return values_checksum(data)
     
     def _get_mock_products(self) -> List[Dict[str, Any]]:
         """Mock product data based on Unopim schema"""
@@ -0,0 +1,151 @@
+import asyncio
+from collections import Counter
+
+from services.category_index import CategoryIndex, build_tree
+
+# software > mdc > mdc_pro, software > hemera, and a separate hardware root
+CATEGORIES = [
+    {"id": 1, "code": "software", "parent_id": None, "name": "Software"},
+    {"id": 2, "code": "mdc", "parent_id": 1, "name": "MDC"},
+    {"id": 3, "code": "mdc_pro", "parent_id": 2, "name": "MDC Pro"},
+    {"id": 4, "code": "hemera", "parent_id": 1, "name": "Hemera"},
+    {"id": 5, "code": "hardware", "parent_id": None, "name": "Hardware"}
+]
+
+
+class Result:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents
+
+
+class Products:
+    def __init__(self, categories):
+        self.categories = categories
+
+    async def create_index(self, keys):
+        pass
+
+    def aggregate(self, pipeline):
+        groups = Counter(tuple(codes) for codes in self.categories)
+        return Result([{"_id": list(codes), "count": count} for codes, count in groups.items()])
+
+
+class StoredIndex:
+    def __init__(self):
+        self.writes = 0
+        self.failing = False
+
+    def find(self, query, projection):
+        return Result([])
+
+    async def bulk_write(self, requests, ordered=True):
+        if self.failing:
+            raise ConnectionError("category_index unavailable")
+        self.writes += 1
+
+    async def delete_many(self, query):
+        pass
+
+
+class FakeDB:
+    def __init__(self, categories):
+        self.hemera_products = Products(categories)
+        self.category_index = StoredIndex()
+
+
+def counts(nodes):
+    return {node['code']: (node['count'], node['total_count']) for node in nodes}
+
+
+def test_build_tree_paths_and_cycles():
+    nodes = build_tree(CATEGORIES + [
+        {"id": 6, "code": "loop_a", "parent_id": 7},
+        {"id": 7, "code": "loop_b", "parent_id": 6}
+    ])
+
+    assert nodes['mdc_pro']['path'] == "software/mdc/mdc_pro"
+    assert nodes['mdc_pro']['parent'] == "mdc"
+    assert nodes['mdc_pro']['depth'] == 2
+    assert nodes['hardware']['parent'] is None
+    # A cycle never loops forever: one of its members becomes a root
+    assert {nodes['loop_a']['depth'], nodes['loop_b']['depth']} == {0, 1}
+    assert nodes['loop_a']['name'] == "Loop A"
+
+
+def test_subtree_and_rolled_up_counts():
+    db = FakeDB([
+        ["mdc_pro"],
+        ["mdc", "mdc_pro"],
+        ["hemera"],
+        ["hemera", "hardware"],
+        ["legacy"],
+        []
+    ])
+    index = CategoryIndex(db)
+
+    async def scenario():
+        assert await index.refresh(CATEGORIES) == 6
+        return await index.subtree("software"), await index.subtree("unknown"), await index.tree()
+
+    software, unknown, tree = asyncio.run(scenario())
+
+    assert sorted(software) == ["hemera", "mdc", "mdc_pro", "software"]
+    assert unknown == ["unknown"]
+    assert [node['code'] for node in tree][:3] == ["hardware", "legacy", "software"]
+    assert counts(tree) == {
+        "software": (0, 4),
+        # Listing both mdc and mdc_pro counts once in the mdc subtree
+        "mdc": (1, 2),
+        "mdc_pro": (2, 2),
+        "hemera": (2, 2),
+        "hardware": (1, 1),
+        # Listed by a product but unknown to Unopim: a root of its own
+        "legacy": (1, 1)
+    }
+
+
+def test_product_writes_adjust_counts_like_a_refresh():
+    before = [["mdc_pro"], ["hemera"], ["hardware"]]
+    after = [["mdc"], ["hemera", "mdc_pro"], ["hardware"], ["new_line"]]
+    index = CategoryIndex(FakeDB(before))
+    recounted = CategoryIndex(FakeDB(after))
+
+    async def scenario():
+        await index.refresh(CATEGORIES)
+        await index.apply_many([
+            ({"categories": ["mdc_pro"]}, {"categories": ["mdc"]}),
+            ({"categories": ["hemera"]}, {"categories": ["hemera", "mdc_pro"]}),
+            # Unchanged categories write nothing
+            ({"categories": ["hardware"]}, {"categories": ["hardware"]}),
+            (None, {"categories": ["new_line"]})
+        ])
+        await recounted.refresh(CATEGORIES)
+        return await index.tree(), await recounted.tree(), await index.subtree("new_line")
+
+    adjusted, expected, new_line = asyncio.run(scenario())
+
+    assert counts(adjusted) == counts(expected)
+    assert counts(adjusted)['software'] == (0, 2)
+    assert new_line == ["new_line"]
+    # One refresh and one batch of adjustments
+    assert index.db.category_index.writes == 2
+
+
+def test_failed_count_write_leaves_the_loaded_index_unchanged():
+    index = CategoryIndex(FakeDB([["mdc"]]))
+
+    async def scenario():
+        await index.refresh(CATEGORIES)
+        before = counts(await index.tree())
+        index.db.category_index.failing = True
+        await index.apply(None, {"categories": ["mdc_pro", "new_line"]})
+        return before, await index.tree(), await index.subtree("software")
+
+    before, after, software = asyncio.run(scenario())
+
+    assert counts(after) == before
+    assert "new_line" not in counts(after)
+    assert sorted(software) == ["hemera", "mdc", "mdc_pro", "software"]
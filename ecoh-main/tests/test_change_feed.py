@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from routes import webhooks
+from services.change_feed import ChangeFeed
+from services.sync_metrics import SyncMetrics
+
+
+class Connector:
+    """Unopim outbox of (id, product_id, operation) rows"""
+
+    def __init__(self, changes):
+        self.changes = changes
+
+    async def latest_change_id(self):
+        return 0
+
+    async def fetch_changes(self, after, limit=500):
+        return [change for change in self.changes if change['id'] > after][:limit]
+
+    async def fetch_products_by_ids(self, product_ids):
+        return {product_id: {"id": product_id, "sku": f"SKU-{product_id}"} for product_id in product_ids}
+
+    def forget_product(self, product_id):
+        pass
+
+
+class Engine:
+    def __init__(self, failing):
+        self.metrics = SyncMetrics()
+        self.failing = set(failing)
+        self.synced = []
+        self.discontinued = []
+
+    async def sync_all_products(self, products):
+        failed = [{"unopim_id": p['id'], "sku": p['sku'], "error": "boom"} for p in products if p['id'] in self.failing]
+        self.synced.extend(p['id'] for p in products if p['id'] not in self.failing)
+        return {"synced": len(products) - len(failed), "unchanged": 0, "errors": len(failed), "failed": failed}
+
+    async def handle_discontinued_product(self, product_id):
+        self.discontinued.append(product_id)
+
+
+def feed_for(connector, engine, saved):
+    async def save_position(position):
+        saved.append(position)
+
+    async def load_position():
+        return saved[-1] if saved else None
+
+    return ChangeFeed(
+        connector,
+        lambda upserted, deleted: webhooks.apply_product_changes(None, engine, connector, upserted, deleted),
+        load_position=load_position,
+        save_position=save_position
+    )
+
+
+def test_failed_products_hold_the_position_until_they_sync():
+    connector = Connector([
+        {"id": 1, "product_id": 10, "operation": "update"},
+        {"id": 2, "product_id": 11, "operation": "update"},
+        {"id": 3, "product_id": 12, "operation": "delete"}
+    ])
+    engine = Engine(failing=[11])
+    saved = [0]
+    feed = feed_for(connector, engine, saved)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(feed.poll_once())
+    assert saved == [0]
+    assert feed.position == 0
+    assert 'ecoh_sync_runs_total{mode="cdc",status="failed"} 1' in engine.metrics.render()
+
+    # The next poll reads the same batch again
+    engine.failing.clear()
+    assert asyncio.run(feed.poll_once()) == 3
+    assert saved == [0, 3]
+    assert engine.synced == [10, 10, 11]
+    assert engine.discontinued == [12, 12]
+    assert 'ecoh_sync_runs_total{mode="cdc",status="completed"} 1' in engine.metrics.render()
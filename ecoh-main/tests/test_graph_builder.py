@@ -0,0 +1,101 @@
+import asyncio
+
+from services.graph_builder import GraphBuilder
+from services.graph_cache import GraphSnapshot
+
+
+class Result:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents
+
+
+class Products:
+    def __init__(self, products):
+        self.products = products
+
+    def find(self, query, projection):
+        return Result([p for p in self.products if p['status'] == query['status']])
+
+
+class FakeDB:
+    def __init__(self, products):
+        self.hemera_products = Products(products)
+
+
+def product(sku, targets, status="active"):
+    return {
+        "sku": sku,
+        "status": status,
+        "graph_node": {"id": sku, "label": sku, "type": "medidor", "x": 0, "y": 0, "z": 0,
+                       "size": 1.0, "color": "#ff6b6b"},
+        "graph_edges": [
+            {"source": sku, "target": target, "relationship_type": "compativel_mdc", "strength": 1.0}
+            for target in targets
+        ]
+    }
+
+
+def structure(graph):
+    return (
+        [node['id'] for node in graph['nodes']],
+        [(e['source'], e['target'], e['relationship_type']) for e in graph['edges']],
+        [cluster['nodes'] for cluster in graph['clusters']],
+        graph['stats']
+    )
+
+
+def build(products, **options):
+    # The build lays out the stored node dicts in place, so each build gets its own copies
+    products = [dict(p, graph_node=dict(p['graph_node'])) for p in products]
+    return asyncio.run(GraphBuilder(FakeDB(products), **options).build_complete_graph())
+
+
+def test_patched_graph_matches_a_full_rebuild():
+    before = [product("rs300", ["mdc_a"]), product("rs500", ["mdc_a", "nic_b"])]
+    # rs100 sorts before every existing node and brings a new target
+    changed = product("rs100", ["mdc_0", "rs300"])
+    builder = GraphBuilder(FakeDB(before))
+
+    graph = build(before)
+    positions = {node['id']: (node['x'], node['y'], node['z']) for node in graph['nodes']}
+    patched, delta = builder._patch_graph(graph, changed)
+    rebuilt = build(before + [changed])
+
+    assert structure(patched) == structure(rebuilt)
+    assert [node['id'] for node in delta['nodes_added']] == ["rs100", "mdc_0"]
+    # Warm start: nodes already laid out keep their coordinates
+    for node in patched['nodes']:
+        if node['id'] in positions:
+            assert (node['x'], node['y'], node['z']) == positions[node['id']]
+
+
+def test_discontinued_product_patch_matches_a_full_rebuild():
+    products = [product("rs300", ["mdc_a"]), product("rs500", ["nic_b", "rs300"])]
+    graph = build(products)
+
+    # rs300 is still a relationship target, so it stays as a virtual node
+    patched, delta = GraphBuilder(FakeDB(products))._patch_graph(graph, dict(products[0], status="inactive"))
+    rebuilt = build(products[1:])
+
+    assert structure(patched) == structure(rebuilt)
+    assert delta['nodes_removed'] == ["mdc_a"]
+    assert [node['id'] for node in delta['nodes_updated']] == ["rs300"]
+    assert next(n for n in patched['nodes'] if n['id'] == "rs300")['is_virtual']
+
+
+def test_seeded_builds_are_identical_whatever_the_scan_order():
+    products = [product("rs300", ["mdc_a"]), product("rs500", ["mdc_a", "nic_b"]), product("rs100", ["rs300"])]
+
+    first = build(products)
+    second = build(list(reversed(products)))
+    reseeded = build(products, layout_seed=1)
+
+    assert first == second
+    assert GraphSnapshot.from_graph(1, first).etag == GraphSnapshot.from_graph(2, second).etag
+    assert first['layout']['deterministic'] is True
+    # Another seed is another layout version, cached under its own name
+    assert reseeded['layout']['version'] != first['layout']['version']
+    assert [n['x'] for n in reseeded['nodes']] != [n['x'] for n in first['nodes']]
@@ -0,0 +1,166 @@
+import asyncio
+import zlib
+
+from services.graph_cache import (
+    CATALOG_STATE_ID, CatalogGeneration, GraphSnapshot, GraphSnapshotCache, catalog_fingerprint
+)
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+class Collection:
+    """The few motor collection calls the cache makes, over a dict of documents"""
+
+    def __init__(self):
+        self.documents = {}
+        self.reads = 0
+
+    def find(self, query, projection):
+        return Cursor([dict(document) for document in self.documents.values()])
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        document = self.documents.get(query['_id'])
+        if document is None or any(document.get(key) != value for key, value in query.items()):
+            return None
+        return dict(document)
+
+    async def update_one(self, query, update, upsert=False):
+        document = self.documents.get(query['_id'])
+        if document is None:
+            if not upsert:
+                return
+            document = self.documents[query['_id']] = {"_id": query['_id']}
+        document.update(update.get('$set', {}))
+        for field, operation in update.get('$bit', {}).items():
+            document[field] = document.get(field, 0) ^ operation['xor']
+
+
+class FakeDB:
+    def __init__(self, products=()):
+        self.hemera_products = Collection()
+        self.hemera_products.documents = {product['unopim_id']: product for product in products}
+        self.catalog_state = Collection()
+        self.graph_snapshots = Collection()
+
+
+def product(unopim_id, checksum, status="active"):
+    return {"unopim_id": unopim_id, "checksum": checksum, "status": status}
+
+
+def graph(label):
+    return {
+        "nodes": [{"id": "1", "label": label, "x": 0.5, "y": 1.0, "z": -2.0}],
+        "edges": [],
+        "clusters": [{"id": "medidor", "nodes": ["1"]}]
+    }
+
+
+def test_generation_is_the_xor_of_product_fingerprints():
+    products = [product(1, "a"), product(2, "b"), product(3, "c")]
+    db = FakeDB(products)
+    catalog = CatalogGeneration(db)
+
+    async def scenario():
+        recomputed = await catalog.recompute()
+        # Swapping a product's fingerprint and swapping it back restores the generation
+        await catalog.apply(products[1], product(2, "b2"))
+        changed = await catalog.current()
+        await catalog.apply_many([(product(2, "b2"), products[1])])
+        return recomputed, changed, await catalog.current()
+
+    recomputed, changed, restored = asyncio.run(scenario())
+
+    expected = 0
+    for p in products:
+        expected ^= catalog_fingerprint(p['unopim_id'], p['checksum'], p['status'])
+    assert recomputed == expected == restored
+    assert changed == expected ^ catalog_fingerprint(2, "b", "active") ^ catalog_fingerprint(2, "b2", "active")
+
+
+def test_missing_state_document_is_recomputed_on_read():
+    db = FakeDB([product(1, "a")])
+    catalog = CatalogGeneration(db)
+
+    async def scenario():
+        # Deltas never create the document: it would miss every other product
+        await catalog.apply(None, product(2, "b"))
+        assert CATALOG_STATE_ID not in db.catalog_state.documents
+        return await catalog.current()
+
+    generation = asyncio.run(scenario())
+
+    assert generation == catalog_fingerprint(1, "a", "active")
+    assert db.catalog_state.documents[CATALOG_STATE_ID]['generation'] == generation
+
+
+def test_snapshot_round_trips_through_compressed_storage():
+    db = FakeDB([product(1, "a")])
+    builds = []
+
+    async def builder():
+        builds.append(1)
+        return graph("RS2000")
+
+    async def scenario():
+        first = await GraphSnapshotCache(db, CatalogGeneration(db)).get_snapshot(builder)
+        # A fresh process loads the stored snapshot instead of rebuilding
+        second = await GraphSnapshotCache(db, CatalogGeneration(db)).get_snapshot(builder)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert len(builds) == 1
+    stored = db.graph_snapshots.documents["complete"]
+    assert zlib.decompress(stored['payload']) == first.payload
+    assert stored['clusters'] == graph("RS2000")['clusters']
+    assert second.payload == first.payload
+    assert second.etag == first.etag
+    assert second.graph == graph("RS2000")
+
+
+def test_new_generation_rebuilds_and_latest_is_served_from_memory():
+    db = FakeDB([product(1, "a")])
+    cache = GraphSnapshotCache(db, CatalogGeneration(db))
+    labels = iter(["before", "after"])
+
+    async def builder():
+        return graph(next(labels))
+
+    async def scenario():
+        before = await cache.get_graph(builder)
+        db.hemera_products.documents[1] = product(1, "a2")
+        await cache.catalog.recompute()
+        after = await cache.get_graph(builder)
+
+        reads = db.graph_snapshots.reads
+        latest = await cache.latest()
+        assert db.graph_snapshots.reads == reads
+
+        cache.invalidate()
+        reloaded = await cache.latest()
+        assert db.graph_snapshots.reads == reads + 1
+        return before, after, latest, reloaded
+
+    before, after, latest, reloaded = asyncio.run(scenario())
+
+    assert before['nodes'][0]['label'] == "before"
+    assert after['nodes'][0]['label'] == "after"
+    generation = catalog_fingerprint(1, "a2", "active")
+    assert latest == (generation, after)
+    assert reloaded == (generation, after)
+
+
+def test_equal_graphs_serialize_to_equal_bytes():
+    reordered = {"edges": [], "clusters": graph("x")['clusters'], "nodes": graph("x")['nodes']}
+    assert GraphSnapshot.from_graph(1, graph("x")).etag == GraphSnapshot.from_graph(1, reordered).etag
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from services.graph_clustering import build_csr, group_centroids, label_propagation
+
+
+def clique_edges(members):
+    return [(a, b) for i, a in enumerate(members) for b in members[i + 1:]]
+
+
+def test_csr_lists_both_directions_without_self_loops():
+    indptr, indices = build_csr(4, np.array([[0, 1], [1, 2], [2, 2], [0, 1]]))
+
+    neighbours = [sorted(indices[indptr[i]:indptr[i + 1]].tolist()) for i in range(4)]
+    # Parallel edges are kept as weights, the isolated node has none
+    assert neighbours == [[1, 1], [0, 0, 2], [1], []]
+
+
+def test_label_propagation_separates_loosely_joined_cliques():
+    first, second = [0, 1, 2, 3, 4], [5, 6, 7, 8, 9]
+    edges = np.array(clique_edges(first) + clique_edges(second) + [(4, 5)])
+    indptr, indices = build_csr(11, edges)
+
+    labels = label_propagation(indptr, indices)
+
+    assert len(set(labels[first].tolist())) == 1
+    assert len(set(labels[second].tolist())) == 1
+    assert labels[0] != labels[5]
+    # Compact labels, the isolated node keeping a community of its own
+    assert sorted(set(labels.tolist())) == [0, 1, 2]
+    assert (label_propagation(indptr, indices) == labels).all()
+
+
+def test_group_centroids_average_member_positions():
+    positions = np.array([[0.0, 0.0, 0.0], [2.0, 4.0, 6.0], [10.0, 10.0, 10.0]])
+
+    centroids = group_centroids(positions, np.array([0, 0, 1]), 2)
+
+    assert centroids == pytest.approx(np.array([[1.0, 2.0, 3.0], [10.0, 10.0, 10.0]]))
@@ -0,0 +1,65 @@
+import pytest
+
+from services.graph_codec import GRAPH_BINARY_MAGIC, decode_graph, encode_graph
+
+
+def sample_graph():
+    return {
+        "nodes": [
+            {"id": "1", "label": "RS2000", "type": "medidor", "x": 1.5, "y": -2.0, "z": 0.25,
+             "size": 2.0, "color": "#ff0000", "metadata": {"sku": "RS2000"}},
+            {"id": "2", "label": "MDC-X", "type": "mdc", "x": 0.0, "y": 3.0, "z": -1.0,
+             "size": 1.0, "color": "#00ff00"},
+            {"id": "protocolo:abnt", "label": "ABNT", "type": "protocolo", "x": -4.0, "y": 0.5, "z": 2.0,
+             "size": 0.5, "color": "#0000ff", "is_virtual": True}
+        ],
+        "edges": [
+            {"source": "1", "target": "2", "relationship_type": "compativel_mdc", "strength": 0.8},
+            {"source": "1", "target": "protocolo:abnt", "relationship_type": "protocolo", "strength": 1.0},
+            # Dangling edges are dropped from the transport
+            {"source": "2", "target": "missing", "relationship_type": "mdcs", "strength": 1.0}
+        ],
+        "stats": {"total_nodes": 3, "total_edges": 3, "total_clusters": 1},
+        "layout": {"algorithm": "force"},
+        "clusters": [{"id": "medidor", "size": 1, "nodes": ["1"]}]
+    }
+
+
+def test_round_trip_keeps_nodes_edges_and_meta():
+    graph = sample_graph()
+    payload = encode_graph(graph)
+    assert payload[:4] == GRAPH_BINARY_MAGIC
+    assert len(payload) % 4 == 0
+
+    decoded = decode_graph(payload)
+
+    assert [node['id'] for node in decoded['nodes']] == ["1", "2", "protocolo:abnt"]
+    for original, node in zip(graph['nodes'], decoded['nodes']):
+        assert node['label'] == original['label']
+        assert node['type'] == original['type']
+        assert node['color'] == original['color']
+        assert (node['x'], node['y'], node['z'], node['size']) == pytest.approx(
+            (original['x'], original['y'], original['z'], original['size'])
+        )
+        assert node['is_virtual'] == original.get('is_virtual', False)
+        assert 'metadata' not in node
+
+    assert [(e['source'], e['target'], e['relationship_type']) for e in decoded['edges']] == [
+        ("1", "2", "compativel_mdc"),
+        ("1", "protocolo:abnt", "protocolo")
+    ]
+    assert [e['strength'] for e in decoded['edges']] == pytest.approx([0.8, 1.0])
+    # Stats count the encoded edges, without the dangling one
+    assert decoded['stats'] == {"total_nodes": 3, "total_edges": 2, "total_clusters": 1}
+    assert decoded['layout'] == graph['layout']
+    assert decoded['clusters'] == [{"id": "medidor", "size": 1}]
+
+
+def test_round_trip_of_empty_graph():
+    decoded = decode_graph(encode_graph({"nodes": [], "edges": []}))
+    assert decoded['nodes'] == [] and decoded['edges'] == []
+
+
+def test_rejects_foreign_payload():
+    with pytest.raises(ValueError):
+        decode_graph(b"XXXX" + encode_graph(sample_graph())[4:])
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from services import graph_layout
+from services.graph_layout import ForceLayout
+
+
+def naive_forces(layout, positions, edges):
+    """The per-pair loop the vectorized layout replaces"""
+    forces = np.zeros_like(positions)
+    for i in range(len(positions)):
+        for j in range(len(positions)):
+            if i != j:
+                delta = positions[j] - positions[i]
+                dist = np.linalg.norm(delta) + 0.01
+                forces[i] -= delta / dist * layout.repulsion / dist ** 2
+    for source, target in edges:
+        pull = layout.attraction * (positions[target] - positions[source])
+        forces[source] += pull
+        forces[target] -= pull
+    return forces
+
+
+def random_positions(n, seed=7):
+    return np.random.default_rng(seed).uniform(-10, 10, size=(n, 3))
+
+
+def test_vectorized_forces_match_the_pairwise_loop(monkeypatch):
+    # Small blocks so the repulsion is split across several row blocks
+    monkeypatch.setattr(graph_layout, "REPULSION_BLOCK_ELEMENTS", 30)
+    layout = ForceLayout(strategy="exact")
+    positions = random_positions(12)
+    edges = np.array([[0, 1], [1, 2], [3, 0], [5, 11], [0, 1]])
+
+    forces = layout.repulsion_forces(positions) + layout.attraction_forces(positions, edges)
+
+    assert forces == pytest.approx(naive_forces(layout, positions, edges))
+
+
+def test_apply_writes_rounded_positions_and_skips_dangling_edges():
+    layout = ForceLayout(iterations=20, seed=3)
+    nodes = [{"id": str(i)} for i in range(5)]
+    edges = [
+        {"source": "0", "target": "1"},
+        {"source": "1", "target": "2"},
+        {"source": "4", "target": "missing"}
+    ]
+
+    assert layout.build_edge_index({n['id']: i for i, n in enumerate(nodes)}, edges).tolist() == [[0, 1], [1, 2]]
+    layout.apply(nodes, edges)
+
+    for node in nodes:
+        for axis in ("x", "y", "z"):
+            assert isinstance(node[axis], float)
+            assert np.isfinite(node[axis])
+            assert node[axis] == round(node[axis], graph_layout.POSITION_DECIMALS)
+
+
+def test_octree_puts_every_point_in_its_own_leaf():
+    positions = random_positions(300)
+    tree = graph_layout.Octree(positions)
+
+    assert tree.mass[0] == 300
+    assert tree.center_of_mass[0] == pytest.approx(positions.mean(axis=0))
+    assert tree.is_leaf[tree.leaf_of].all()
+    assert np.bincount(tree.leaf_of).max() == 1
+
+
+def test_barnes_hut_approximates_exact_repulsion():
+    positions = random_positions(400)
+    exact = ForceLayout(strategy="exact").repulsion_forces(positions)
+
+    # With theta near zero every cell is opened down to single points
+    opened = ForceLayout(strategy="barnes_hut", theta=1e-9).barnes_hut_repulsion_forces(positions)
+    assert opened == pytest.approx(exact)
+
+    approximate = ForceLayout(strategy="barnes_hut", theta=0.8).barnes_hut_repulsion_forces(positions)
+    assert np.linalg.norm(approximate - exact) / np.linalg.norm(exact) < 0.05
+
+
+def test_auto_strategy_switches_at_the_threshold():
+    layout = ForceLayout(strategy="auto", barnes_hut_threshold=100)
+    assert layout.resolve_strategy(100) == "exact"
+    assert layout.resolve_strategy(101) == "barnes_hut"
+    with pytest.raises(ValueError):
+        ForceLayout(strategy="fast")
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+from services.product_diff import ProductDiff, diff_product
+
+
+def stored_product():
+    return {
+        "sku": "RS2000",
+        "title": "Medidor RS2000",
+        "attributes": {"voltagem": "220", "cor": "azul", "peso": 1.5},
+        "relationships": {"mdcs": ["mdc_a"]},
+        "updated_at": datetime(2025, 11, 5, 23, 18, 58),
+        "synced_at": "2025-11-05T23:19:00"
+    }
+
+
+def test_nested_fields_are_diffed_key_by_key():
+    current = dict(
+        stored_product(),
+        attributes={"voltagem": "110", "peso": 1.5, "garantia": "2 anos"},
+        relationships={"mdcs": ["mdc_a", "mdc_b"]},
+        synced_at="2025-11-06T10:00:00"
+    )
+
+    diff = ProductDiff(stored_product(), current)
+
+    assert diff.set == {
+        "attributes.voltagem": "110",
+        "attributes.garantia": "2 anos",
+        "relationships.mdcs": ["mdc_a", "mdc_b"],
+        "synced_at": "2025-11-06T10:00:00"
+    }
+    assert diff.unset == ["attributes.cor"]
+    # synced_at is always written but never reported
+    assert diff.changed_fields == [
+        "attributes.cor", "attributes.garantia", "attributes.voltagem", "relationships.mdcs"
+    ]
+    assert diff.columns(current) == {
+        "attributes": current['attributes'],
+        "relationships": current['relationships'],
+        "synced_at": current['synced_at']
+    }
+
+
+def test_equal_values_in_another_form_are_unchanged():
+    # The same instant as an aware datetime, and dict keys in another order
+    current = dict(
+        stored_product(),
+        attributes={"peso": 1.5, "cor": "azul", "voltagem": "220"},
+        updated_at=datetime(2025, 11, 5, 20, 18, 58, tzinfo=timezone(timedelta(hours=-3)))
+    )
+
+    diff = ProductDiff(stored_product(), current)
+
+    assert diff.changed_fields == []
+    assert list(diff.set) == ["synced_at"]
+
+
+def test_fields_that_cannot_be_paths_are_replaced_whole():
+    stored = dict(stored_product(), attributes={"a.b": 1})
+    current = dict(stored_product(), attributes={"a.b": 2}, title="RS2000 v2")
+
+    diff = ProductDiff(stored, current)
+
+    assert diff.set["attributes"] == {"a.b": 2}
+    assert diff.set["title"] == "RS2000 v2"
+    assert diff_product(None, current) is None
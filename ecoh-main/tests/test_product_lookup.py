@@ -0,0 +1,87 @@
+import asyncio
+
+from services import ttl_cache
+from services.ttl_cache import TTLCache
+from services.unopim_connector import UopimConnector
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttl_cache.time, "monotonic", clock)
+    cache = TTLCache(maxsize=2, ttl=10)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+    clock.now += 10
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+    disabled = TTLCache(maxsize=2, ttl=0)
+    disabled.set("a", 1)
+    assert disabled.get("a") is None
+
+
+def counting_connector():
+    connector = UopimConnector()
+    batches = []
+    load_products = connector._load_products
+
+    async def recording(product_ids):
+        batches.append(list(product_ids))
+        return await load_products(product_ids)
+
+    connector._load_products = recording
+    return connector, batches
+
+
+def test_concurrent_lookups_share_one_batched_fetch():
+    connector, batches = counting_connector()
+
+    async def scenario():
+        burst = await asyncio.gather(*(connector.fetch_product_by_id(i) for i in [3, 1, 3, 99, 2]))
+        cached = await connector.fetch_product_by_id(1)
+        connector.forget_product(1)
+        refetched = await connector.fetch_product_by_id(1)
+        return burst, cached, refetched
+
+    burst, cached, refetched = asyncio.run(scenario())
+
+    assert [p and p['id'] for p in burst] == [3, 1, 3, None, 2]
+    assert burst[0] is burst[2]
+    assert cached is burst[1]
+    assert refetched['id'] == 1
+    # One fetch for the burst, none for the cached hit, one after forgetting
+    assert batches == [[3, 1, 99, 2], [1]]
+
+
+def test_failed_batch_reaches_every_waiting_caller():
+    connector = UopimConnector()
+
+    async def failing(product_ids):
+        raise ConnectionError("unopim unavailable")
+
+    connector._load_products = failing
+
+    async def scenario():
+        return await asyncio.gather(
+            connector.fetch_product_by_id(1), connector.fetch_product_by_id(2), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert connector._pending_ids == {}
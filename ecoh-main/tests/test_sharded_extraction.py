@@ -0,0 +1,79 @@
+import asyncio
+import random
+
+import pytest
+
+import seed_unopim
+from services import unopim_connector
+from services.unopim_connector import UopimConnector
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / "unopim.sqlite3")
+    seed_unopim.seed_sqlite(path, 60, random.Random(5))
+    return path
+
+
+def connector_for(path, **options):
+    return UopimConnector({"driver": "sqlite", "path": path, "stream_window": 7, **options})
+
+
+async def collect(pages):
+    products = []
+    async for page in pages:
+        products.extend(page)
+    return products
+
+
+def run(connector, read):
+    async def scenario():
+        await connector.connect()
+        try:
+            return await read(connector)
+        finally:
+            await connector.close()
+    return asyncio.run(scenario())
+
+
+def test_shards_return_the_same_products_as_the_keyset_stream(catalog):
+    streamed = run(connector_for(catalog), lambda c: collect(c.iter_products(batch_size=5)))
+    connector = connector_for(catalog, extract_shards=4)
+    sharded = run(connector, lambda c: collect(c.iter_products_sharded(batch_size=5)))
+
+    assert len(streamed) == 60
+    assert sorted(p['id'] for p in sharded) == sorted(p['id'] for p in streamed)
+    assert {p['sku']: p['values'] for p in sharded} == {p['sku']: p['values'] for p in streamed}
+    assert all(p['checksum'] for p in sharded)
+    progress = connector.extraction_progress()
+    assert len(progress) == 4
+    assert sum(shard['products'] for shard in progress) == 60
+    assert all(shard['done'] for shard in progress)
+
+
+def test_failed_shard_resumes_after_its_last_id(catalog, monkeypatch):
+    monkeypatch.setattr(unopim_connector, "SHARD_RETRY_DELAY", 0)
+    connector = connector_for(catalog, extract_shards=3)
+    failures = []
+
+    async def read(c):
+        stream = c.source.stream
+
+        async def flaky(query, params, batch_size):
+            reads = 0
+            async for rows in stream(query, params, batch_size):
+                yield rows
+                reads += 1
+                # One window of a later shard fails once, after its first page was read
+                if not failures and params[0] > 0 and reads == 1:
+                    failures.append(params[0])
+                    raise ConnectionError("lost connection")
+
+        c.source.stream = flaky
+        return await collect(c.iter_products_sharded(batch_size=3))
+
+    products = run(connector, read)
+
+    assert len(failures) == 1
+    assert sorted(p['id'] for p in products) == list(range(1, 61))
+    assert sum(shard['failures'] for shard in connector.extraction_progress()) == 1
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from services.spatial_index import KDTree, SpatialIndex, box_planes, normalize_planes
+
+
+def brute_force(positions, planes):
+    return np.flatnonzero(np.all(positions @ planes[:, :3].T + planes[:, 3] >= 0, axis=1))
+
+
+def test_kd_tree_matches_a_brute_force_scan():
+    positions = np.random.default_rng(11).uniform(-50, 50, size=(2000, 3))
+    tree = KDTree(positions, leaf_size=8)
+    # A box, a slanted half-space and a region containing everything
+    regions = [
+        box_planes((-10, -20, -5), (25, 10, 30)),
+        normalize_planes([1.0, 1.0, 0.0, -15.0]),
+        box_planes((-100, -100, -100), (100, 100, 100)),
+        box_planes((60, 60, 60), (70, 70, 70))
+    ]
+
+    for planes in regions:
+        assert tree.query(planes).tolist() == brute_force(positions, planes).tolist()
+
+
+def test_normalize_planes_rejects_incomplete_groups():
+    assert normalize_planes([1, 0, 0, 0, 0, 1, 0, 2]).shape == (2, 4)
+    with pytest.raises(ValueError):
+        normalize_planes([1, 0, 0])
+
+
+def node(node_id, x, size=1.0):
+    return {"id": node_id, "x": x, "y": 0.0, "z": 0.0, "size": size}
+
+
+def test_viewport_caps_by_degree_and_keeps_edges_between_visible_nodes():
+    graph = {
+        "nodes": [node("a", 0.0), node("b", 1.0), node("c", 2.0, size=3.0), node("d", 3.0), node("far", 50.0)],
+        "edges": [
+            {"source": "a", "target": "b"},
+            {"source": "a", "target": "d"},
+            {"source": "a", "target": "far"},
+            {"source": "b", "target": "d"},
+            {"source": "c", "target": "missing"}
+        ]
+    }
+    index = SpatialIndex(graph)
+    view = box_planes((-1, -1, -1), (5, 1, 1))
+
+    nodes, edges, matched = index.query(view)
+    assert nodes.tolist() == [0, 1, 2, 3]
+    assert edges.tolist() == [0, 1, 3]
+    assert matched == 4
+
+    # a has degree 3, b and d 2; the larger c wins no slot over them
+    nodes, edges, matched = index.query(view, limit=2)
+    assert nodes.tolist() == [0, 1]
+    assert edges.tolist() == [0]
+    assert matched == 4
+
+    nodes, _, matched = index.query(view, min_size=2.0)
+    assert nodes.tolist() == [2]
+    assert matched == 1
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from services.sync_engine import SyncEngine
+from services.sync_metrics import SyncMetrics
+from services.sync_pipeline import Chunk, SyncPipeline, SyncRun
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FakeCatalog:
+    def __init__(self):
+        self.recomputed = 0
+
+    async def apply_many(self, changes):
+        list(changes)
+
+    async def recompute(self):
+        self.recomputed += 1
+
+
+class FakeCategories:
+    async def apply_many(self, changes):
+        list(changes)
+
+
+class FakeEngine:
+    """The parts of SyncEngine the pipeline uses, over an in-memory store"""
+
+    _calculate_checksum = SyncEngine._calculate_checksum
+    _record_failure = SyncEngine._record_failure
+
+    def __init__(self):
+        self.metrics = SyncMetrics()
+        self.catalog = FakeCatalog()
+        self.categories = FakeCategories()
+        self.store = {}
+        self.interrupt_at = None
+
+    async def prefetch_checksums(self):
+        return {unopim_id: (p['checksum'], p['status']) for unopim_id, p in self.store.items()}
+
+    async def detect_schema_changes(self, product):
+        return {}
+
+    async def _transform_product(self, product, checksum):
+        return {"unopim_id": product['id'], "sku": product['sku'], "checksum": checksum, "status": "active"}
+
+    async def _find_stored_products(self, unopim_ids):
+        return {unopim_id: dict(self.store[unopim_id]) for unopim_id in unopim_ids if unopim_id in self.store}
+
+    async def _bulk_write(self, writes):
+        # Let other chunks finish first so commits arrive out of order
+        await asyncio.sleep(0.001 * (len(self.store) % 3))
+        if any(product['unopim_id'] == self.interrupt_at for product, _ in writes):
+            raise Interrupted()
+        for product, _ in writes:
+            self.store[product['unopim_id']] = product
+        return {}
+
+
+def keyset_products(count):
+    """Products in the connector's (updated_at, id) order"""
+    return [
+        {"id": i, "sku": f"SKU-{i}", "updated_at": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}Z",
+         "values": {"common": {"n": i}, "categories": []}}
+        for i in range(count)
+    ]
+
+
+def test_committed_prefix_waits_for_earlier_chunks():
+    run = SyncRun({}, SyncMetrics().run())
+    chunks = [Chunk(seq, [], ("2025-01-01", seq)) for seq in range(3)]
+    for chunk in chunks:
+        chunk.results['synced'] = 1
+    run.fetched = 3
+
+    assert not run.finish(chunks[1])
+    assert run.checkpoint() == {"cursor": None, "results": run.results}
+    assert run.finish(chunks[0])
+    assert run.checkpoint()['cursor'] == {"updated_at": "2025-01-01", "id": 1}
+    assert run.checkpoint()['results']['synced'] == 2
+
+
+def test_interrupted_run_resumes_from_checkpoint():
+    products = keyset_products(30)
+    engine = FakeEngine()
+    pipeline = SyncPipeline(engine, write_workers=3)
+    checkpoints = []
+
+    async def save_checkpoint(state):
+        checkpoints.append({"cursor": state['cursor'], "results": dict(state['results'])})
+
+    engine.interrupt_at = 17
+    with pytest.raises(Interrupted):
+        asyncio.run(pipeline.run(products, 5, on_checkpoint=save_checkpoint))
+
+    assert checkpoints
+    checkpoint = checkpoints[-1]
+    ids = [saved['cursor']['id'] for saved in checkpoints]
+    assert ids == sorted(ids)
+    # Only chunks before the interrupted one (ids 15-19) can be committed
+    assert checkpoint['cursor']['id'] < 15
+    assert checkpoint['results']['synced'] == checkpoint['cursor']['id'] + 1
+
+    engine.interrupt_at = None
+    cursor = (checkpoint['cursor']['updated_at'], checkpoint['cursor']['id'])
+    remaining = [p for p in products if (p['updated_at'], p['id']) > cursor]
+    results = asyncio.run(pipeline.run(remaining, 5, resume=checkpoint, on_checkpoint=save_checkpoint))
+
+    # Products written after the checkpoint are found unchanged, never counted twice
+    assert results['synced'] + results['unchanged'] == 30
+    assert results['errors'] == 0
+    assert results['watermark'] == {"updated_at": products[-1]['updated_at'], "id": 29}
+    assert sorted(engine.store) == list(range(30))
+    assert checkpoints[-1]['cursor']['id'] == 29
+    # Chunks written after the checkpoint may lack their generation delta
+    assert engine.catalog.recomputed == 1
+
+    unchanged = asyncio.run(pipeline.run(products, 5))
+    assert (unchanged['synced'], unchanged['unchanged']) == (0, 30)
@@ -0,0 +1,75 @@
+import asyncio
+
+from services.transform_plan import TransformPlanner
+
+
+class Schema:
+    """Schema registry with a fixed set of ACF fields"""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.version = 0
+        self.loads = 0
+
+    async def load(self):
+        self.loads += 1
+        return self.fields
+
+    def invalidate(self):
+        self.version += 1
+
+
+def planner(schema):
+    return TransformPlanner(
+        schema,
+        code_rule=lambda code: code.startswith("compativel_"),
+        value_rule=lambda value: isinstance(value, list)
+    )
+
+
+def test_classify_prefers_metadata_then_registry_then_rules():
+    schema = Schema({
+        "mdcs": {"code": "mdcs", "is_relationship": False},
+        "protocolo": {"code": "protocolo", "is_relationship": True},
+        "voltagem": {"code": "voltagem", "is_relationship": None}
+    })
+    transform = planner(schema)
+    transform.set_attributes([
+        {"code": "mdcs", "is_relationship": True},
+        {"code": "cor", "is_relationship": None}
+    ])
+
+    plan = asyncio.run(transform.plan(1))
+
+    # Unopim metadata wins over the registry
+    assert transform.classify(plan, "mdcs", "x") is True
+    assert transform.classify(plan, "protocolo", "x") is True
+    # Neither source decides: code rule, then value rule
+    assert transform.classify(plan, "compativel_mdc", "x") is True
+    assert transform.classify(plan, "voltagem", ["110", "220"]) is True
+    assert transform.classify(plan, "cor", "azul") is False
+    assert plan == {"mdcs": True, "protocolo": True, "compativel_mdc": True, "voltagem": True, "cor": False}
+
+
+def test_plans_are_per_family_and_reset_with_the_registry():
+    schema = Schema({})
+    transform = planner(schema)
+
+    async def scenario():
+        first = await transform.plan(1)
+        transform.classify(first, "mdcs", ["a"])
+        same = await transform.plan(1)
+        other = await transform.plan(2)
+        schema.invalidate()
+        reset = await transform.plan(1)
+        return first, same, other, reset
+
+    first, same, other, reset = asyncio.run(scenario())
+
+    assert same is first and same == {"mdcs": True}
+    assert other == {}
+    assert reset == {}
+    assert schema.loads == 2
+
+    transform.set_attributes([{"code": "mdcs", "is_relationship": False}])
+    assert asyncio.run(transform.plan(1)) == {}
@@ -11,12 +11,34 @@ from contextlib import asynccontextmanager
 
 logger = logging.getLogger(__name__)
 
+# Columns and indexes added after their table was first created: CREATE TABLE
+# IF NOT EXISTS leaves an existing table as it is, so init_schema adds the
+# missing ones as (table, "column" | "index", name, ALTER TABLE clause)
+SCHEMA_MIGRATIONS = [
+    ("sync_logs", "column", "watermark_updated_at", "ADD COLUMN watermark_updated_at VARCHAR(40)"),
+    ("sync_logs", "column", "watermark_id", "ADD COLUMN watermark_id INT"),
+    ("sync_logs", "column", "checkpoint", "ADD COLUMN checkpoint JSON"),
+    ("sync_logs", "column", "metrics", "ADD COLUMN metrics JSON"),
+    ("sync_logs", "column", "claimed_by", "ADD COLUMN claimed_by VARCHAR(255)"),
+    ("sync_logs", "column", "heartbeat_at", "ADD COLUMN heartbeat_at DATETIME"),
+    ("sync_logs", "index", "idx_watermark", "ADD INDEX idx_watermark (status, watermark_updated_at, watermark_id)")
+]
+
+# Indexes the server may not support; init_schema warns and carries on without them.
+# Multi-valued indexes (category subtree filters with JSON_OVERLAPS) need MySQL >= 8.0.17
+# and do not exist in MariaDB
+OPTIONAL_SCHEMA_MIGRATIONS = [
+    ("hemera_products", "index", "idx_categories", "ADD INDEX idx_categories ((CAST(categories AS CHAR(100) ARRAY)))")
+]
+
 
 class MySQLDatabase:
     """Async MySQL database connection manager"""
     
     def __init__(self):
         self.pool: Optional[aiomysql.Pool] = None
+        # Set by init_schema once idx_categories exists
+        self.has_category_index = False
         self.config = {
             'host': os.environ.get('MYSQL_HOST', 'localhost'),
             'port': int(os.environ.get('MYSQL_PORT', 3306)),
@@ -43,31 +65,72 @@ class MySQLDatabase:
             raise
     
     async def init_schema(self):
-        """Initialize database schema if not exists"""
+        """
+        Initialize database schema if not exists
+        
+        Missing tables are created from schema.sql, then SCHEMA_MIGRATIONS
+        brings existing tables up to date. A failing statement is logged
+        and raised, so startup never continues on a partial schema; only
+        OPTIONAL_SCHEMA_MIGRATIONS may fail, with a warning.
+        """
         schema_file = os.path.join(os.path.dirname(__file__), 'schema.sql')
         
         if not os.path.exists(schema_file):
             logger.warning("Schema file not found, skipping initialization")
             return
         
+        with open(schema_file, 'r') as f:
+            schema_sql = f.read()
+        
+        # Split by ; and execute each statement
+        statements = [s.strip() for s in schema_sql.split(';') if s.strip()]
+        
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                for statement in statements:
+                    await self._execute_schema_statement(cursor, statement)
+                
+                for table, kind, name, clause in SCHEMA_MIGRATIONS:
+                    if not await self._schema_object_exists(cursor, table, kind, name):
+                        await self._execute_schema_statement(cursor, f"ALTER TABLE {table} {clause}")
+                        logger.info(f"Migrated {table}: added {kind} {name}")
+                
+                for table, kind, name, clause in OPTIONAL_SCHEMA_MIGRATIONS:
+                    if await self._schema_object_exists(cursor, table, kind, name):
+                        continue
+                    try:
+                        await cursor.execute(f"ALTER TABLE {table} {clause}")
+                        logger.info(f"Migrated {table}: added {kind} {name}")
+                    except Exception as e:
+                        logger.warning(f"Skipping {kind} {name} on {table}, not supported by this server: {str(e)}")
+                
+                self.has_category_index = await self._schema_object_exists(
+                    cursor, "hemera_products", "index", "idx_categories"
+                )
+        
+        logger.info("Database schema initialized successfully")
+    
+    async def _execute_schema_statement(self, cursor, statement: str):
         try:
-            with open(schema_file, 'r') as f:
-                schema_sql = f.read()
-            
-            # Split by ; and execute each statement
-            statements = [s.strip() for s in schema_sql.split(';') if s.strip()]
-            
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    for statement in statements:
-                        if statement:
-                            await cursor.execute(statement)
-            
-            logger.info("Database schema initialized successfully")
-            
+            await cursor.execute(statement)
         except Exception as e:
-            logger.error(f"Error initializing schema: {str(e)}")
-            # Don't raise - tables might already exist
+            # First line is enough to tell which statement failed
+            logger.error(f"Schema statement failed ({statement.splitlines()[0]} ...): {str(e)}")
+            raise
+    
+    async def _schema_object_exists(self, cursor, table: str, kind: str, name: str) -> bool:
+        if kind == "column":
+            query = """
+                SELECT 1 FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+            """
+        else:
+            query = """
+                SELECT 1 FROM information_schema.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+            """
+        await cursor.execute(query, (table, name))
+        return await cursor.fetchone() is not None
     
     async def close(self):
         """Close connection pool"""
@@ -153,16 +216,112 @@ class MySQLDatabase:
                 return cursor.rowcount > 0
     
     async def upsert_product(self, product: Dict) -> bool:
-        """Insert or update product"""
-        existing = await self.find_product_by_id(product['unopim_id'])
+        """Insert or update product in a single statement"""
+        row = self._serialize_json_fields(product.copy())
+        columns = list(row.keys())
         
-        if existing:
-            # Remove unchangeable fields
-            updates = {k: v for k, v in product.items() if k not in ['id', 'unopim_id']}
-            return await self.update_product(product['unopim_id'], updates)
-        else:
-            await self.insert_product(product)
-            return True
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(self._product_upsert_query(columns), list(row.values()))
+                return True
+    
+    async def bulk_upsert_products(self, products: List[Dict]) -> Dict[int, str]:
+        """
+        Insert or update many products with a multi-row
+        INSERT ... ON DUPLICATE KEY UPDATE sent through executemany
+        
+        A rejected statement is rolled back as a whole, so the batch is then
+        retried row by row to isolate the failing products. Returns
+        {index: error message} for the products that could not be written.
+        """
+        if not products:
+            return {}
+        
+        rows = [self._serialize_json_fields(product.copy()) for product in products]
+        columns = list(rows[0].keys())
+        query = self._product_upsert_query(columns)
+        params = [[row.get(c) for c in columns] for row in rows]
+        
+        try:
+            async with self.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(query, params)
+            return {}
+        except Exception as e:
+            logger.warning(f"Bulk upsert of {len(rows)} products failed, retrying row by row: {str(e)}")
+        
+        errors = {}
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                for index, row in enumerate(params):
+                    try:
+                        await cursor.execute(query, row)
+                    except Exception as e:
+                        errors[index] = str(e)
+        return errors
+    
+    async def find_products_by_ids(self, unopim_ids: List[int]) -> List[Dict]:
+        """Find full product rows for the given unopim_ids in one query"""
+        if not unopim_ids:
+            return []
+        
+        placeholders = ', '.join(['%s'] * len(unopim_ids))
+        query = f"SELECT * FROM hemera_products WHERE unopim_id IN ({placeholders})"
+        
+        async with self.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, list(unopim_ids))
+                rows = await cursor.fetchall()
+        
+        for row in rows:
+            self._parse_json_fields(row)
+        return rows
+    
+    async def bulk_update_products(self, updates: List[tuple]) -> Dict[int, str]:
+        """
+        Update only the given columns of many products
+        
+        updates are (unopim_id, {column: value}) pairs. Rows touching the
+        same columns share one UPDATE sent through executemany; a rejected
+        group is retried row by row. Returns {index: error message}.
+        """
+        groups: Dict[tuple, List[int]] = {}
+        for index, (_, columns) in enumerate(updates):
+            groups.setdefault(tuple(columns), []).append(index)
+        
+        errors = {}
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                for columns, indexes in groups.items():
+                    set_clause = ', '.join(f"{c} = %s" for c in columns)
+                    query = f"UPDATE hemera_products SET {set_clause} WHERE unopim_id = %s"
+                    params = []
+                    for index in indexes:
+                        unopim_id, values = updates[index]
+                        row = self._serialize_json_fields(dict(values))
+                        params.append([row[c] for c in columns] + [unopim_id])
+                    
+                    try:
+                        await cursor.executemany(query, params)
+                        continue
+                    except Exception as e:
+                        logger.warning(f"Bulk update of {len(params)} products failed, retrying row by row: {str(e)}")
+                    
+                    for index, row in zip(indexes, params):
+                        try:
+                            await cursor.execute(query, row)
+                        except Exception as e:
+                            errors[index] = str(e)
+        return errors
+    
+    def _product_upsert_query(self, columns: List[str]) -> str:
+        # Unchangeable fields are only written on insert
+        updates = ', '.join(f"{c} = VALUES({c})" for c in columns if c not in ['id', 'unopim_id'])
+        return (
+            f"INSERT INTO hemera_products ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
     
     async def delete_products(self, filters: Dict) -> int:
         """Delete products matching filters"""
@@ -206,9 +365,7 @@ class MySQLDatabase:
                 
                 return results
     
-    async def upsert_acf_field(self, field: Dict) -> bool:
-        """Insert or update ACF field definition"""
-        query = """
+    ACF_UPSERT_QUERY = """
             INSERT INTO acf_schema (code, label, type, is_relationship, is_required, is_filterable, position, options, detected_at)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
             ON DUPLICATE KEY UPDATE
@@ -220,10 +377,28 @@ class MySQLDatabase:
                 position = VALUES(position),
                 options = VALUES(options)
         """
+    
+    async def upsert_acf_field(self, field: Dict) -> bool:
+        """Insert or update ACF field definition"""
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(self.ACF_UPSERT_QUERY, self._acf_field_row(field))
+                return True
+    
+    async def upsert_acf_fields(self, fields: List[Dict]) -> int:
+        """Insert or update many ACF field definitions in one multi-row statement"""
+        if not fields:
+            return 0
         
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(self.ACF_UPSERT_QUERY, [self._acf_field_row(f) for f in fields])
+                return len(fields)
+    
+    def _acf_field_row(self, field: Dict) -> tuple:
         options_json = json.dumps(field.get('options', [])) if field.get('options') else None
         
-        values = (
+        return (
             field['code'],
             field.get('label', field['code']),
             field['type'],
@@ -234,11 +409,6 @@ class MySQLDatabase:
             options_json,
             field.get('detected_at')
         )
-        
-        async with self.acquire() as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute(query, values)
-                return True
     
     # Status checks operations
     async def insert_status_check(self, status: Dict) -> bool:
@@ -288,8 +458,8 @@ class MySQLDatabase:
     async def insert_sync_log(self, log: Dict) -> int:
         """Insert sync log"""
         query = """
-            INSERT INTO sync_logs (product_id, action, status, message, duration_ms, timestamp)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            INSERT INTO sync_logs (product_id, action, status, message, duration_ms, timestamp, claimed_by, heartbeat_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
         
         values = (
@@ -298,7 +468,9 @@ class MySQLDatabase:
             log['status'],
             log.get('message'),
             log.get('duration_ms'),
-            log['timestamp']
+            log['timestamp'],
+            log.get('claimed_by'),
+            log.get('heartbeat_at')
         )
         
         async with self.acquire() as conn:
@@ -306,6 +478,279 @@ class MySQLDatabase:
                 await cursor.execute(query, values)
                 return cursor.lastrowid
     
+    async def complete_sync_log(self, log_id: int, status: str, message: str, duration_ms: Optional[int],
+                                watermark: Optional[Dict] = None, metrics: Optional[Dict] = None) -> bool:
+        """Finish a sync log; the watermark is stored and the checkpoint cleared in the same statement"""
+        query = """
+            UPDATE sync_logs
+            SET status = %s, message = %s, duration_ms = %s,
+                watermark_updated_at = %s, watermark_id = %s, checkpoint = NULL, metrics = %s
+            WHERE id = %s
+        """
+        watermark = watermark or {}
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (
+                    status, message, duration_ms,
+                    watermark.get('updated_at'), watermark.get('id'),
+                    json.dumps(metrics) if metrics else None,
+                    log_id
+                ))
+                return cursor.rowcount > 0
+    
+    async def save_sync_checkpoint(self, log_id: int, checkpoint: Optional[Dict]) -> bool:
+        """Refresh the heartbeat of a running sync, storing its cursor and counters if given"""
+        query = """
+            UPDATE sync_logs SET checkpoint = COALESCE(%s, checkpoint), heartbeat_at = UTC_TIMESTAMP()
+            WHERE id = %s
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (json.dumps(checkpoint, default=str) if checkpoint else None, log_id))
+                return cursor.rowcount > 0
+    
+    async def find_running_sync_logs(self, lease_seconds: float) -> List[Dict]:
+        """Full and incremental syncs marked running without a heartbeat within the lease, newest first"""
+        query = """
+            SELECT id, action, checkpoint, timestamp FROM sync_logs
+            WHERE status = 'running' AND product_id IS NULL
+              AND (heartbeat_at IS NULL OR heartbeat_at < UTC_TIMESTAMP() - INTERVAL %s SECOND)
+            ORDER BY id DESC
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, (lease_seconds,))
+                logs = await cursor.fetchall()
+        
+        for log in logs:
+            if isinstance(log['checkpoint'], str):
+                log['checkpoint'] = json.loads(log['checkpoint'])
+        return logs
+    
+    async def claim_sync_log(self, log_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Take over a running sync whose heartbeat expired; False if another worker got it first"""
+        query = """
+            UPDATE sync_logs SET claimed_by = %s, heartbeat_at = UTC_TIMESTAMP()
+            WHERE id = %s AND status = 'running'
+              AND (heartbeat_at IS NULL OR heartbeat_at < UTC_TIMESTAMP() - INTERVAL %s SECOND)
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (worker_id, log_id, lease_seconds))
+                return cursor.rowcount > 0
+    
+    async def find_sync_watermark(self) -> Optional[Dict]:
+        """Highest watermark recorded by a completed sync"""
+        query = """
+            SELECT watermark_updated_at, watermark_id FROM sync_logs
+            WHERE status = 'completed' AND watermark_id IS NOT NULL
+            ORDER BY watermark_updated_at DESC, watermark_id DESC
+            LIMIT 1
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query)
+                row = await cursor.fetchone()
+                if not row:
+                    return None
+                return {"updated_at": row[0], "id": row[1]}
+    
+    async def find_cdc_position(self, name: str) -> Optional[int]:
+        """Last applied position of a Unopim change outbox"""
+        query = "SELECT position FROM cdc_state WHERE name = %s"
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (name,))
+                row = await cursor.fetchone()
+                return row[0] if row else None
+    
+    async def save_cdc_position(self, name: str, position: int):
+        query = """
+            INSERT INTO cdc_state (name, position, updated_at)
+            VALUES (%s, %s, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE position = VALUES(position), updated_at = VALUES(updated_at)
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (name, position))
+    
+    # Category index operations
+    async def count_products_by_categories(self) -> List[tuple]:
+        """Products grouped by their categories array, as (codes, product count)"""
+        query = """
+            SELECT CAST(categories AS CHAR) AS categories, COUNT(*) AS total
+            FROM hemera_products
+            WHERE categories IS NOT NULL
+            GROUP BY CAST(categories AS CHAR)
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query)
+                rows = await cursor.fetchall()
+                return [(json.loads(row[0]), row[1]) for row in rows if row[0]]
+    
+    async def find_category_index(self) -> List[Dict]:
+        """Find every category index node"""
+        query = """
+            SELECT code, name, parent_code AS parent, path, depth,
+                   product_count AS count, total_count
+            FROM category_index
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query)
+                return await cursor.fetchall()
+    
+    async def replace_category_index(self, nodes: List[Dict]):
+        """Replace the category index with nodes in one transaction"""
+        query = """
+            INSERT INTO category_index
+                (code, name, parent_code, path, depth, product_count, total_count, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, UTC_TIMESTAMP())
+        """
+        params = [
+            (node['code'], node['name'], node['parent'], node['path'], node['depth'],
+             node['count'], node['total_count'])
+            for node in nodes
+        ]
+        
+        async with self.acquire() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute("DELETE FROM category_index")
+                    if params:
+                        await cursor.executemany(query, params)
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+    
+    async def adjust_category_index(self, nodes: List[Dict]):
+        """Add the count and total_count of nodes to the stored ones, inserting unknown codes"""
+        query = """
+            INSERT INTO category_index
+                (code, name, parent_code, path, depth, product_count, total_count, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE
+                product_count = product_count + VALUES(product_count),
+                total_count = total_count + VALUES(total_count),
+                updated_at = VALUES(updated_at)
+        """
+        params = [
+            (node['code'], node['name'], node['parent'], node['path'], node['depth'],
+             node['count'], node['total_count'])
+            for node in nodes
+        ]
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(query, params)
+    
+    # Catalog generation operations
+    async def find_product_fingerprints(self) -> List[Dict]:
+        """Find (unopim_id, checksum, status) for every product"""
+        query = "SELECT unopim_id, checksum, status FROM hemera_products"
+        
+        async with self.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query)
+                return await cursor.fetchall()
+    
+    async def find_active_product_graphs(self) -> List[Dict]:
+        """Find graph node and edges of every active product"""
+        query = "SELECT graph_node, graph_edges FROM hemera_products WHERE status = 'active'"
+        
+        async with self.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query)
+                results = await cursor.fetchall()
+                
+                for row in results:
+                    self._parse_json_fields(row)
+                
+                return results
+    
+    async def get_catalog_generation(self, name: str = 'catalog') -> Optional[int]:
+        """Get stored catalog generation"""
+        query = "SELECT generation FROM catalog_state WHERE name = %s"
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (name,))
+                row = await cursor.fetchone()
+                return int(row[0]) if row else None
+    
+    async def set_catalog_generation(self, generation: int, name: str = 'catalog') -> bool:
+        """Insert or replace catalog generation"""
+        query = """
+            INSERT INTO catalog_state (name, generation, updated_at)
+            VALUES (%s, %s, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE
+                generation = VALUES(generation),
+                updated_at = VALUES(updated_at)
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (name, generation))
+                return True
+    
+    async def xor_catalog_generation(self, delta: int, name: str = 'catalog') -> bool:
+        """Atomically XOR a fingerprint delta into the catalog generation"""
+        query = """
+            UPDATE catalog_state
+            SET generation = generation ^ %s, updated_at = UTC_TIMESTAMP()
+            WHERE name = %s
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (delta, name))
+                return cursor.rowcount > 0
+    
+    # Graph snapshot operations
+    async def find_graph_snapshot(self, name: str, generation: Optional[int] = None,
+                                  columns: str = "payload") -> Optional[Dict]:
+        """Find graph snapshot, optionally only if it matches a generation"""
+        query = f"SELECT {columns} FROM graph_snapshots WHERE name = %s"
+        params = [name]
+        
+        if generation is not None:
+            query += " AND generation = %s"
+            params.append(generation)
+        
+        async with self.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, params)
+                return await cursor.fetchone()
+    
+    async def save_graph_snapshot(self, name: str, generation: int, payload: bytes, clusters: str) -> bool:
+        """Insert or replace graph snapshot"""
+        query = """
+            INSERT INTO graph_snapshots (name, generation, payload, clusters, created_at)
+            VALUES (%s, %s, %s, %s, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE
+                generation = VALUES(generation),
+                payload = VALUES(payload),
+                clusters = VALUES(clusters),
+                created_at = VALUES(created_at)
+        """
+        
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (name, generation, payload, clusters))
+                return True
+    
     # Helper methods
     def _parse_json_fields(self, row: Dict):
         """Parse JSON string fields back to Python objects"""
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["metrics"])
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def setup_routes(sync_metrics):
+    """Setup routes with dependencies"""
+    
+    @router.get("/metrics", response_class=PlainTextResponse)
+    async def get_metrics():
+        """
+        Sync and webhook metrics for Prometheus
+        
+        Stage timings per batch (fetch, checksum, schema, transform, write),
+        products by outcome, run durations and throughput, webhook events.
+        """
+        try:
+            return PlainTextResponse(sync_metrics.render(), media_type=CONTENT_TYPE)
+        except Exception as e:
+            logger.error(f"Error rendering metrics: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return router
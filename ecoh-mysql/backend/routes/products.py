@@ -16,7 +16,7 @@ def setup_routes(db, sync_engine, graph_builder):
     @router.get("", response_model=WPRestResponse)
     async def get_products(
         status: Optional[str] = Query(None, description="Filter by status"),
-        category: Optional[str] = Query(None, description="Filter by category"),
+        category: Optional[str] = Query(None, description="Filter by category and its subcategories"),
         search: Optional[str] = Query(None, description="Search in SKU or title"),
         page: int = Query(1, ge=1),
         per_page: int = Query(20, ge=1, le=100)
@@ -32,8 +32,16 @@ def setup_routes(db, sync_engine, graph_builder):
                 params.append(status)
             
             if category:
-                where_clauses.append("JSON_CONTAINS(categories, %s)")
-                params.append(f'"{category}"')
+                subtree = await sync_engine.categories.subtree(category)
+                if db.has_category_index:
+                    # One condition over the category's subtree, served by the multi-valued index
+                    where_clauses.append("JSON_OVERLAPS(categories, CAST(%s AS JSON))")
+                    params.append(json.dumps(subtree))
+                else:
+                    # Servers without multi-valued indexes (MySQL < 8.0.17, MariaDB)
+                    contains = " OR ".join(["JSON_CONTAINS(categories, JSON_QUOTE(%s))"] * len(subtree))
+                    where_clauses.append(f"({contains})")
+                    params.extend(subtree)
             
             if search:
                 where_clauses.append("(sku LIKE %s OR title LIKE %s)")
@@ -133,38 +141,27 @@ def setup_routes(db, sync_engine, graph_builder):
     
     @router.get("/categories/list", response_model=WPRestResponse)
     async def get_categories():
-        """Get all categories"""
+        """
+        Get the category tree
+        
+        Served from the category index: categories come parents first, with
+        their materialized path, the products listing them (count) and the
+        distinct products in their whole subtree (total_count).
+        """
         try:
-            # Query to get unique categories with counts
-            query = """
-                SELECT 
-                    JSON_UNQUOTE(JSON_EXTRACT(categories, CONCAT('$[', numbers.n, ']'))) as category,
-                    COUNT(*) as count
-                FROM hemera_products
-                CROSS JOIN (
-                    SELECT 0 as n UNION ALL SELECT 1 UNION ALL SELECT 2 
-                    UNION ALL SELECT 3 UNION ALL SELECT 4 UNION ALL SELECT 5
-                ) numbers
-                WHERE JSON_UNQUOTE(JSON_EXTRACT(categories, CONCAT('$[', numbers.n, ']'))) IS NOT NULL
-                GROUP BY category
-            """
-            
-            categories = []
-            async with db.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute(query)
-                    rows = await cursor.fetchall()
-                    
-                    for row in rows:
-                        categories.append({
-                            "slug": row[0],
-                            "name": row[0].replace('_', ' ').title(),
-                            "count": row[1]
-                        })
+            categories = await sync_engine.categories.tree()
             
             return WPRestResponse(
                 success=True,
-                data=categories
+                data=[{
+                    "slug": cat['code'],
+                    "name": cat['name'],
+                    "parent": cat['parent'],
+                    "path": cat['path'],
+                    "depth": cat['depth'],
+                    "count": cat['count'],
+                    "total_count": cat['total_count']
+                } for cat in categories]
             )
         except Exception as e:
             logger.error(f"Error fetching categories: {str(e)}")
@@ -1,6 +1,10 @@
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import asyncio
 import logging
+import os
+import socket
+import time
 from datetime import datetime, timezone
 
 from models.unopim_models import SyncEvent
@@ -10,7 +14,16 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
-def setup_routes(db, sync_engine, graph_builder, unopim_connector):
+SYNC_MODES = ("full", "incremental")
+
+# Recorded as claimed_by on the sync logs this worker runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Manual, scheduled and change-feed syncs run one at a time, and webhook
+# product writes never interleave with them
+_sync_lock = asyncio.Lock()
+
+def setup_routes(db, sync_engine, graph_builder, unopim_connector, graph_updates):
     """Setup routes with dependencies"""
     
     @router.post("/unopim", response_model=WPRestResponse)
@@ -34,7 +47,8 @@ def setup_routes(db, sync_engine, graph_builder, unopim_connector):
                 db,
                 sync_engine,
                 graph_builder,
-                unopim_connector
+                unopim_connector,
+                graph_updates
             )
             
             return WPRestResponse(
@@ -46,22 +60,33 @@ def setup_routes(db, sync_engine, graph_builder, unopim_connector):
             raise HTTPException(status_code=500, detail=str(e))
     
     @router.post("/trigger-sync", response_model=WPRestResponse)
-    async def trigger_manual_sync(background_tasks: BackgroundTasks):
-        """Manually trigger full sync from Unopim"""
+    async def trigger_manual_sync(background_tasks: BackgroundTasks, mode: str = "full"):
+        """
+        Manually trigger a sync from Unopim
+        
+        mode=full re-reads the whole catalog; mode=incremental only reads
+        products modified after the watermark of the last successful sync.
+        """
         try:
-            logger.info("Manual sync triggered")
+            if mode not in SYNC_MODES:
+                raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SYNC_MODES)}")
+            
+            logger.info(f"Manual {mode} sync triggered")
             
             background_tasks.add_task(
-                perform_full_sync,
+                perform_sync,
                 db,
                 sync_engine,
-                unopim_connector
+                unopim_connector,
+                mode == "incremental"
             )
             
             return WPRestResponse(
                 success=True,
-                message="Full sync initiated"
+                message=f"{mode.capitalize()} sync initiated"
             )
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error triggering sync: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
@@ -106,7 +131,8 @@ def setup_routes(db, sync_engine, graph_builder, unopim_connector):
                     "stats": {
                         "total_products": total_products,
                         "active_products": active_products
-                    }
+                    },
+                    "extraction": unopim_connector.extraction_progress()
                 }
             )
         except Exception as e:
@@ -115,30 +141,79 @@ def setup_routes(db, sync_engine, graph_builder, unopim_connector):
     
     return router
 
+def publish_graph_delta(graph_updates, update_type: str, sku: str, delta: Optional[Dict[str, Any]]):
+    """
+    Push a node/edge delta to WebSocket viewers without waiting on them
+    
+    When the cached graph could not be patched (no delta), viewers are told
+    to refetch /graph/complete instead.
+    """
+    if delta is None:
+        graph_updates.publish_graph_update("graph_invalidated", {"sku": sku})
+        return
+    
+    if any(delta.values()):
+        graph_updates.publish_graph_update(update_type, {"sku": sku, **delta})
+
 async def process_webhook_event(
     event: SyncEvent,
     db,
     sync_engine,
     graph_builder,
-    unopim_connector
+    unopim_connector,
+    graph_updates
 ):
     """Process webhook event in background"""
+    started = time.perf_counter()
     try:
         if event.entity_type == "product":
+            # The product changed in Unopim: drop it from the lookup cache
+            unopim_connector.forget_product(event.entity_id)
             if event.event_type in ["create", "update"]:
-                # Fetch product data from Unopim
+                # Fetch product data from Unopim unless the event carries it
                 product_data = event.data
+                if not product_data.get('values'):
+                    product_data = await unopim_connector.fetch_product_by_id(event.entity_id)
+                    if product_data is None:
+                        raise ValueError(f"Product {event.entity_id} not found in Unopim")
                 
-                # Sync product
-                result = await sync_engine.sync_product(product_data)
+                # Register new attribute codes in the shared schema registry
+                await sync_engine.detect_schema_changes(product_data)
                 
-                logger.info(f"Product {product_data.get('sku')} synced")
+                # Sync product; never interleaved with a pipeline run, whose
+                # prefetched checksums would otherwise go stale
+                async with _sync_lock:
+                    base_generation = await graph_builder.current_generation()
+                    result = await sync_engine.sync_product(product_data)
+                    await sync_engine.schema.flush()
+                    
+                    # Patch the cached graph around the changed product only
+                    delta = await graph_builder.apply_product_update(result, base_generation)
+                publish_graph_delta(graph_updates, "product_updated", result['sku'], delta)
+                logger.info(f"Product {product_data.get('sku')} synced, changed: {result.get('changed_fields')}")
                 
             elif event.event_type == "delete":
                 # Mark as discontinued
-                await sync_engine.handle_discontinued_product(event.entity_id)
+                async with _sync_lock:
+                    base_generation = await graph_builder.current_generation()
+                    result = await sync_engine.handle_discontinued_product(event.entity_id)
+                    delta = await graph_builder.apply_product_update(result, base_generation) if result else None
+                if result:
+                    publish_graph_delta(graph_updates, "product_discontinued", result['sku'], delta)
                 logger.info(f"Product {event.entity_id} marked discontinued")
         
+        elif event.entity_type == "attribute":
+            # Attribute definitions changed in Unopim: reload them on next use
+            sync_engine.schema.invalidate()
+            await load_attribute_metadata(sync_engine, unopim_connector)
+            logger.info(f"Attribute {event.entity_id} changed, schema registry invalidated")
+        
+        elif event.entity_type == "category":
+            # The category tree changed in Unopim: rebuild paths and counts
+            await refresh_category_index(sync_engine, unopim_connector)
+        
+        sync_engine.metrics.record_webhook(event.entity_type, "success", time.perf_counter() - started)
+        
         # Log event to MySQL
         await db.insert_webhook_event({
             "event_type": event.event_type,
@@ -151,6 +226,7 @@ async def process_webhook_event(
         
     except Exception as e:
         logger.error(f"Error processing webhook event: {str(e)}")
+        sync_engine.metrics.record_webhook(event.entity_type, "error", time.perf_counter() - started)
         # Log error
         await db.insert_webhook_event({
             "event_type": event.event_type,
@@ -161,53 +237,190 @@ async def process_webhook_event(
             "processed": False
         })
 
-async def perform_full_sync(db, sync_engine, unopim_connector):
-    """Perform full sync from Unopim"""
-    start_time = datetime.now(timezone.utc)
+async def load_attribute_metadata(sync_engine, unopim_connector):
+    """Feed Unopim attribute definitions to the engine's transform plans"""
     try:
-        logger.info("Starting full sync")
-        
-        # Log sync start
-        sync_log_id = await db.insert_sync_log({
-            "product_id": None,
-            "action": "full_sync",
-            "status": "running",
-            "message": "Starting full sync",
-            "duration_ms": None,
-            "timestamp": start_time
-        })
-        
-        # Fetch all products from Unopim
-        products = await unopim_connector.fetch_products()
-        
-        # Sync all products
-        results = await sync_engine.sync_all_products(products)
+        sync_engine.transform_plans.set_attributes(await unopim_connector.fetch_attributes())
+    except Exception as e:
+        # Plans fall back to the schema registry and heuristics
+        logger.error(f"Error loading attribute metadata: {str(e)}")
+
+async def refresh_category_index(sync_engine, unopim_connector, missing_only: bool = False):
+    """
+    Rebuild the category index from the Unopim tree and recount its products
+    
+    With missing_only (startup), an index already stored is kept as is.
+    """
+    try:
+        if missing_only and await sync_engine.categories.load():
+            return
+        await sync_engine.categories.refresh(await unopim_connector.fetch_categories())
+    except Exception as e:
+        # Filters and listings keep the previous index until the next refresh
+        logger.error(f"Error refreshing category index: {str(e)}")
+
+async def apply_product_changes(db, sync_engine, unopim_connector, upserted: List[int], deleted: List[int]):
+    """
+    Apply a batch of Unopim outbox changes (see ChangeFeed)
+    
+    Changed products are fetched with one keyed lookup and synced as one
+    batch; products deleted in Unopim, or gone by the time they are
+    fetched, are marked discontinued. Category counts follow the writes.
+    Runs under the sync lock so it never interleaves with a full or
+    incremental sync.
+    
+    Raises when any product failed to sync, so the feed keeps its
+    position and reads the whole batch again; products already written
+    are then found unchanged.
+    """
+    async with _sync_lock:
+        for product_id in upserted + deleted:
+            unopim_connector.forget_product(product_id)
+        products = await unopim_connector.fetch_products_by_ids(upserted)
+        gone = [product_id for product_id in upserted if product_id not in products]
         
-        # Calculate duration
-        end_time = datetime.now(timezone.utc)
-        duration_ms = int((end_time - start_time).total_seconds() * 1000)
+        failed = []
+        if products:
+            results = await sync_engine.sync_all_products(list(products.values()))
+            breakdown = results.pop('metrics', None)
+            failed = results['failed']
+            sync_engine.metrics.record_run("cdc", "failed" if failed else "completed", breakdown)
         
-        # Update sync log
-        query = "UPDATE sync_logs SET status = %s, message = %s, duration_ms = %s WHERE id = %s"
-        async with db.acquire() as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute(query, (
-                    "completed",
-                    f"Synced {results['synced']} products",
-                    duration_ms,
-                    sync_log_id
-                ))
+        for product_id in deleted + gone:
+            await sync_engine.handle_discontinued_product(product_id)
         
-        logger.info(f"Full sync completed in {duration_ms}ms: {results}")
+        if failed:
+            raise RuntimeError(f"{len(failed)} changed products failed to sync: {failed}")
         
-    except Exception as e:
-        logger.error(f"Error during full sync: {str(e)}")
-        # Log error
-        await db.insert_sync_log({
-            "product_id": None,
-            "action": "full_sync",
-            "status": "failed",
-            "message": str(e),
-            "duration_ms": None,
-            "timestamp": datetime.now(timezone.utc)
-        })
+        logger.info(f"Applied Unopim changes: {len(products)} synced, {len(deleted) + len(gone)} discontinued")
+
+async def resume_interrupted_sync(db, sync_engine, unopim_connector, lease_seconds: float = 600):
+    """
+    Continue a sync left "running" by a restart or crash
+    
+    Running syncs refresh heartbeat_at on every checkpoint; a log whose
+    heartbeat is older than lease_seconds belongs to a worker that is gone.
+    Every worker calls this on startup, so the most recent such log is
+    claimed atomically and only the worker that wins the claim resumes it
+    from its last checkpoint (or from its start if none was saved); older
+    ones are marked interrupted.
+    """
+    running = await db.find_running_sync_logs(lease_seconds)
+    if not running:
+        return
+    
+    latest, stale = running[0], running[1:]
+    if not await db.claim_sync_log(latest['id'], WORKER_ID, lease_seconds):
+        logger.info(f"Interrupted sync {latest['id']} already claimed by another worker")
+        return
+    
+    for log in stale:
+        await db.complete_sync_log(log['id'], "interrupted", "Interrupted by a restart", None)
+    
+    logger.info(f"Resuming interrupted sync {latest['id']} started at {latest['timestamp']}")
+    await perform_sync(db, sync_engine, unopim_connector, latest['action'] == "incremental_sync", resume_log=latest)
+
+async def perform_sync(db, sync_engine, unopim_connector, incremental: bool = False,
+                       resume_log: Optional[Dict[str, Any]] = None):
+    """
+    Perform a full or incremental sync from Unopim
+    
+    Every run that finishes without product errors stores the highest
+    (updated_at, id) it read as its watermark, in the same statement that
+    marks the log completed. Incremental runs re-read from a safety margin
+    before the highest stored watermark (see UopimConnector.watermark_since),
+    so rows committed late or within the watermark's second are not
+    skipped; stored checksums make those re-reads cheap. Runs with errors
+    keep the previous watermark so failed products are read again.
+    
+    While running, the log holds a checkpoint (keyset cursor and counters
+    of the committed batches) and the heartbeat of the worker running it.
+    Passing that log as resume_log continues the run after the cursor
+    instead of starting over.
+    
+    With more than one extraction shard configured, products are read by
+    concurrent id ranges (iter_products_sharded). Those pages are not in
+    keyset order, so such runs keep only the heartbeat: an interrupted run
+    is restarted from where it began.
+    
+    Completed logs also keep the per-stage timings of the run in 'metrics'.
+    Full runs rebuild the category index once they complete; incremental
+    runs adjust its counts as products are written.
+    """
+    mode = "incremental" if incremental else "full"
+    action = f"{mode}_sync"
+    sync_log_id = resume_log['id'] if resume_log else None
+    async with _sync_lock:
+        start_time = datetime.now(timezone.utc)
+        try:
+            watermark = await db.find_sync_watermark() if incremental else None
+            checkpoint = resume_log.get('checkpoint') if resume_log else None
+            if sync_log_id is None:
+                logger.info(f"Starting {mode} sync" + (f" after {watermark}" if watermark else ""))
+                
+                # Log sync start
+                sync_log_id = await db.insert_sync_log({
+                    "product_id": None,
+                    "action": action,
+                    "status": "running",
+                    "message": f"Starting {mode} sync",
+                    "duration_ms": None,
+                    "timestamp": start_time,
+                    "claimed_by": WORKER_ID,
+                    "heartbeat_at": start_time
+                })
+            
+            # Stream products from Unopim page by page into the sync pipeline
+            cursor = (checkpoint or {}).get('cursor')
+            after = (cursor['updated_at'], cursor['id']) if cursor else None
+            since = unopim_connector.watermark_since(watermark) if watermark and not cursor else None
+            sharded = unopim_connector.extract_shards > 1 and not checkpoint
+            
+            async def save_checkpoint(state: Dict[str, Any]):
+                await db.save_sync_checkpoint(sync_log_id, None if sharded else state)
+            
+            if sharded:
+                products = unopim_connector.iter_products_sharded(sync_engine.batch_size, since=since, after=after)
+            else:
+                products = unopim_connector.iter_products(sync_engine.batch_size, since=since, after=after)
+            results = await sync_engine.sync_all_products(
+                products,
+                resume=checkpoint,
+                on_checkpoint=save_checkpoint
+            )
+            
+            # Calculate duration
+            end_time = datetime.now(timezone.utc)
+            duration_ms = int((end_time - start_time).total_seconds() * 1000)
+            breakdown = results.pop('metrics', None)
+            sync_engine.metrics.record_run(mode, "completed", breakdown)
+            if not incremental:
+                await refresh_category_index(sync_engine, unopim_connector)
+            
+            # Update sync log
+            await db.complete_sync_log(
+                sync_log_id,
+                "completed",
+                f"Synced {results['synced']} products",
+                duration_ms,
+                watermark=None if results['errors'] else results.get('watermark'),
+                metrics=breakdown
+            )
+            
+            logger.info(f"{mode.capitalize()} sync completed in {duration_ms}ms: {results}")
+            
+        except Exception as e:
+            logger.error(f"Error during {mode} sync: {str(e)}")
+            sync_engine.metrics.record_run(mode, "failed")
+            # Mark the run failed; log a new entry only if it never started
+            if sync_log_id is not None:
+                await db.complete_sync_log(sync_log_id, "failed", str(e), None)
+            else:
+                await db.insert_sync_log({
+                    "product_id": None,
+                    "action": action,
+                    "status": "failed",
+                    "message": str(e),
+                    "duration_ms": None,
+                    "timestamp": datetime.now(timezone.utc)
+                })
@@ -1,15 +1,11 @@
 -- CAS Tecnologia Ecosystem - MySQL 8.0 Schema
 -- Migration from MongoDB to MySQL
 
--- Drop existing tables if they exist
-DROP TABLE IF EXISTS webhook_events;
-DROP TABLE IF EXISTS sync_logs;
-DROP TABLE IF EXISTS status_checks;
-DROP TABLE IF EXISTS acf_schema;
-DROP TABLE IF EXISTS hemera_products;
+-- Tables are only created when missing, so products and interrupted
+-- sync checkpoints survive restarts
 
 -- Main products table
-CREATE TABLE hemera_products (
+CREATE TABLE IF NOT EXISTS hemera_products (
     id INT AUTO_INCREMENT PRIMARY KEY,
     unopim_id INT NOT NULL UNIQUE,
     sku VARCHAR(100) NOT NULL UNIQUE,
@@ -41,10 +37,11 @@ CREATE TABLE hemera_products (
     INDEX idx_unopim_id (unopim_id),
     INDEX idx_checksum (checksum),
     INDEX idx_updated_at (updated_at)
+    -- idx_categories (multi-valued, MySQL >= 8.0.17) is added by init_schema when supported
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ACF Schema definitions
-CREATE TABLE acf_schema (
+CREATE TABLE IF NOT EXISTS acf_schema (
     id INT AUTO_INCREMENT PRIMARY KEY,
     code VARCHAR(100) NOT NULL UNIQUE,
     label VARCHAR(255),
@@ -62,7 +59,7 @@ CREATE TABLE acf_schema (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Webhook events
-CREATE TABLE webhook_events (
+CREATE TABLE IF NOT EXISTS webhook_events (
     id INT AUTO_INCREMENT PRIMARY KEY,
     event_type VARCHAR(50) NOT NULL,
     entity_type VARCHAR(50) NOT NULL,
@@ -79,7 +76,7 @@ CREATE TABLE webhook_events (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Sync logs
-CREATE TABLE sync_logs (
+CREATE TABLE IF NOT EXISTS sync_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
     product_id INT,
     action VARCHAR(50) NOT NULL,
@@ -87,18 +84,68 @@ CREATE TABLE sync_logs (
     message TEXT,
     duration_ms INT,
     timestamp DATETIME NOT NULL,
+    -- Incremental sync watermark: highest (updated_at, id) read by a successful run
+    watermark_updated_at VARCHAR(40),
+    watermark_id INT,
+    -- Last committed batch cursor and counters of a running sync
+    checkpoint JSON,
+    -- Per-stage timings and throughput of a completed sync
+    metrics JSON,
+    -- Worker running the sync and its last checkpoint; stale heartbeats are resumed
+    claimed_by VARCHAR(255),
+    heartbeat_at DATETIME,
     
     FOREIGN KEY (product_id) REFERENCES hemera_products(id) ON DELETE SET NULL,
     INDEX idx_product_id (product_id),
     INDEX idx_timestamp (timestamp),
-    INDEX idx_status (status)
+    INDEX idx_status (status),
+    INDEX idx_watermark (status, watermark_updated_at, watermark_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Status checks
-CREATE TABLE status_checks (
+CREATE TABLE IF NOT EXISTS status_checks (
     id VARCHAR(36) PRIMARY KEY,
     client_name VARCHAR(255) NOT NULL,
     timestamp DATETIME NOT NULL,
     
     INDEX idx_timestamp (timestamp)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Catalog generation (XOR of product checksum fingerprints)
+CREATE TABLE IF NOT EXISTS catalog_state (
+    name VARCHAR(50) PRIMARY KEY,
+    generation BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Last applied position of the Unopim change outbox
+CREATE TABLE IF NOT EXISTS cdc_state (
+    name VARCHAR(50) PRIMARY KEY,
+    position BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Unopim category tree with materialized paths and product counts
+CREATE TABLE IF NOT EXISTS category_index (
+    code VARCHAR(100) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    parent_code VARCHAR(100),
+    -- Codes from the root, e.g. software/mdc
+    path VARCHAR(1000) NOT NULL,
+    depth INT NOT NULL DEFAULT 0,
+    -- Products listing the category / distinct products in its subtree
+    product_count INT NOT NULL DEFAULT 0,
+    total_count INT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL,
+    
+    INDEX idx_path (path(255))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Laid-out graph snapshots keyed by catalog generation
+CREATE TABLE IF NOT EXISTS graph_snapshots (
+    name VARCHAR(50) PRIMARY KEY,
+    generation BIGINT UNSIGNED NOT NULL,
+    payload LONGBLOB NOT NULL,
+    clusters LONGTEXT,
+    created_at DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
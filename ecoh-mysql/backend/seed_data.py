@@ -38,6 +38,9 @@ async def seed_database():
                 await cursor.execute("DELETE FROM webhook_events")
                 await cursor.execute("DELETE FROM sync_logs")
                 await cursor.execute("DELETE FROM status_checks")
+                await cursor.execute("DELETE FROM catalog_state")
+                await cursor.execute("DELETE FROM graph_snapshots")
+                await cursor.execute("DELETE FROM category_index")
         
         logger.info("Database cleared")
         
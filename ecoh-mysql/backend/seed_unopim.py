@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Seed a Unopim-shaped database for the connector's database mode
+
+Generates the products, attributes and categories tables the connector
+reads, with N products derived from the mock catalog, into a SQLite file
+or a MySQL database (UNOPIM_DB_* variables). Triggers on products fill
+the product_changes outbox tailed by the change feed. Point UNOPIM_DB_TYPE and
+UNOPIM_DB_PATH / UNOPIM_DB_NAME at it to sync and measure against it.
+
+    python seed_unopim.py --driver sqlite --path unopim.sqlite3 --products 50000
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from dotenv import load_dotenv
+import logging
+
+from services.unopim_connector import UopimConnector, db_config_from_env
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv(Path(__file__).parent / '.env')
+
+SCHEMA = {
+    "sqlite": [
+        "DROP TABLE IF EXISTS products",
+        "DROP TABLE IF EXISTS attributes",
+        "DROP TABLE IF EXISTS categories",
+        """CREATE TABLE products (
+            id INTEGER PRIMARY KEY,
+            sku TEXT NOT NULL UNIQUE,
+            type TEXT NOT NULL,
+            parent_id INTEGER,
+            attribute_family_id INTEGER,
+            `values` TEXT,
+            additional TEXT,
+            status INTEGER NOT NULL DEFAULT 1,
+            avg_completeness_score INTEGER,
+            created_at TEXT,
+            updated_at TEXT
+        )""",
+        "CREATE INDEX idx_products_keyset ON products (updated_at, id)",
+        """CREATE TABLE attributes (
+            id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL UNIQUE,
+            type TEXT NOT NULL,
+            is_required INTEGER NOT NULL DEFAULT 0,
+            is_unique INTEGER NOT NULL DEFAULT 0,
+            is_filterable INTEGER NOT NULL DEFAULT 0,
+            position INTEGER
+        )""",
+        """CREATE TABLE categories (
+            id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL UNIQUE,
+            parent_id INTEGER,
+            additional_data TEXT
+        )""",
+        "DROP TABLE IF EXISTS product_changes",
+        """CREATE TABLE product_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )"""
+    ],
+    "mysql": [
+        "DROP TABLE IF EXISTS products",
+        "DROP TABLE IF EXISTS attributes",
+        "DROP TABLE IF EXISTS categories",
+        """CREATE TABLE products (
+            id INT PRIMARY KEY,
+            sku VARCHAR(255) NOT NULL UNIQUE,
+            type VARCHAR(50) NOT NULL,
+            parent_id INT,
+            attribute_family_id INT,
+            `values` JSON,
+            additional JSON,
+            status TINYINT NOT NULL DEFAULT 1,
+            avg_completeness_score INT,
+            created_at TIMESTAMP NULL,
+            updated_at TIMESTAMP NULL,
+            INDEX idx_products_keyset (updated_at, id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        """CREATE TABLE attributes (
+            id INT PRIMARY KEY,
+            code VARCHAR(191) NOT NULL UNIQUE,
+            type VARCHAR(50) NOT NULL,
+            is_required TINYINT NOT NULL DEFAULT 0,
+            is_unique TINYINT NOT NULL DEFAULT 0,
+            is_filterable TINYINT NOT NULL DEFAULT 0,
+            position INT
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        """CREATE TABLE categories (
+            id INT PRIMARY KEY,
+            code VARCHAR(191) NOT NULL UNIQUE,
+            parent_id INT,
+            additional_data JSON
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        "DROP TABLE IF EXISTS product_changes",
+        """CREATE TABLE product_changes (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            product_id INT NOT NULL,
+            operation VARCHAR(10) NOT NULL,
+            changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+    ]
+}
+
+# Change outbox tailed by the connector; created after seeding so the
+# generated products are not reported as changes
+TRIGGERS = {
+    "sqlite": [
+        """CREATE TRIGGER products_changes_insert AFTER INSERT ON products
+           BEGIN INSERT INTO product_changes (product_id, operation) VALUES (NEW.id, 'upsert'); END""",
+        """CREATE TRIGGER products_changes_update AFTER UPDATE ON products
+           BEGIN INSERT INTO product_changes (product_id, operation) VALUES (NEW.id, 'upsert'); END""",
+        """CREATE TRIGGER products_changes_delete AFTER DELETE ON products
+           BEGIN INSERT INTO product_changes (product_id, operation) VALUES (OLD.id, 'delete'); END"""
+    ],
+    "mysql": [
+        """CREATE TRIGGER products_changes_insert AFTER INSERT ON products FOR EACH ROW
+           INSERT INTO product_changes (product_id, operation) VALUES (NEW.id, 'upsert')""",
+        """CREATE TRIGGER products_changes_update AFTER UPDATE ON products FOR EACH ROW
+           INSERT INTO product_changes (product_id, operation) VALUES (NEW.id, 'upsert')""",
+        """CREATE TRIGGER products_changes_delete AFTER DELETE ON products FOR EACH ROW
+           INSERT INTO product_changes (product_id, operation) VALUES (OLD.id, 'delete')"""
+    ]
+}
+
+PRODUCT_INSERT = """
+    INSERT INTO products (id, sku, type, parent_id, attribute_family_id, `values`, additional,
+                          status, avg_completeness_score, created_at, updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+ATTRIBUTE_INSERT = """
+    INSERT INTO attributes (id, code, type, is_required, is_unique, is_filterable, position)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+CATEGORY_INSERT = "INSERT INTO categories (id, code, parent_id, additional_data) VALUES (%s, %s, %s, %s)"
+
+
+def generate_products(count: int, rng: random.Random):
+    """Rows shaped like Unopim products, varied from the mock catalog"""
+    templates = UopimConnector()._get_mock_products()
+    start = datetime(2025, 1, 1)
+    for product_id in range(1, count + 1):
+        template = templates[product_id % len(templates)]
+        common = dict(template['values']['common'])
+        sku = f"{template['sku']}-{product_id:07d}"
+        common['sku'] = sku
+        for code, value in common.items():
+            # Drop part of multi-valued attributes so relationships differ
+            if isinstance(value, str) and ',' in value:
+                options = value.split(',')
+                common[code] = ','.join(rng.sample(options, rng.randint(1, len(options))))
+        values = {
+            "common": common,
+            "categories": template['values']['categories'],
+            # Read by Unopim but not by the sync engine, pruned by the connector
+            "locale_specific": {"pt_BR": {"descricao": f"Produto {sku} " + "x" * rng.randint(50, 400)}},
+            "channel_specific": {"default": {"preco": round(rng.uniform(10, 5000), 2)}}
+        }
+        created_at = start + timedelta(seconds=rng.randint(0, 180 * 86400))
+        updated_at = created_at + timedelta(seconds=rng.randint(0, 60 * 86400))
+        yield (
+            product_id, sku, template['type'], None, template['attribute_family_id'],
+            json.dumps(values), json.dumps({"origem": "seed"}),
+            1 if rng.random() < 0.95 else 0, rng.randint(40, 100),
+            created_at.strftime('%Y-%m-%d %H:%M:%S'), updated_at.strftime('%Y-%m-%d %H:%M:%S')
+        )
+
+
+def reference_rows():
+    mock = UopimConnector()
+    attributes = [
+        (position, attribute['code'], attribute['type'], int(attribute['is_required']), 0, 1, position)
+        for position, attribute in enumerate(mock._get_mock_attributes(), start=1)
+    ]
+    categories = [
+        (category['id'], category['code'], category['parent_id'],
+         json.dumps({"locale_specific": {"pt_BR": {"name": category['name']}}}))
+        for category in mock._get_mock_categories()
+    ]
+    return attributes, categories
+
+
+def batched(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_sqlite(path: str, count: int, rng: random.Random):
+    conn = sqlite3.connect(path)
+    try:
+        for statement in SCHEMA['sqlite']:
+            conn.execute(statement)
+        attributes, categories = reference_rows()
+        conn.executemany(ATTRIBUTE_INSERT.replace('%s', '?'), attributes)
+        conn.executemany(CATEGORY_INSERT.replace('%s', '?'), categories)
+        for batch in batched(generate_products(count, rng), 5000):
+            conn.executemany(PRODUCT_INSERT.replace('%s', '?'), batch)
+        for statement in TRIGGERS['sqlite']:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def seed_mysql(config: dict, count: int, rng: random.Random):
+    import aiomysql
+    conn = await aiomysql.connect(
+        host=config['host'], port=config['port'], user=config['user'],
+        password=config['password'], db=config['database'], charset='utf8mb4', autocommit=True
+    )
+    try:
+        async with conn.cursor() as cursor:
+            for statement in SCHEMA['mysql']:
+                await cursor.execute(statement)
+            attributes, categories = reference_rows()
+            await cursor.executemany(ATTRIBUTE_INSERT, attributes)
+            await cursor.executemany(CATEGORY_INSERT, categories)
+            for batch in batched(generate_products(count, rng), 2000):
+                await cursor.executemany(PRODUCT_INSERT, batch)
+            for statement in TRIGGERS['mysql']:
+                await cursor.execute(statement)
+    finally:
+        conn.close()
+
+
+async def seed_unopim():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--driver', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--path', default='unopim.sqlite3', help="SQLite file")
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    if args.driver == 'sqlite':
+        seed_sqlite(args.path, args.products, rng)
+        target = args.path
+    else:
+        config = db_config_from_env() or {}
+        config = {
+            "host": config.get('host', 'localhost'), "port": config.get('port', 3306),
+            "user": config.get('user', 'root'), "password": config.get('password', ''),
+            "database": config.get('database', 'unopim')
+        }
+        await seed_mysql(config, args.products, rng)
+        target = f"{config['host']}/{config['database']}"
+
+    logger.info(f"Seeded {args.products} Unopim products into {args.driver} database {target}")
+
+if __name__ == "__main__":
+    asyncio.run(seed_unopim())
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, APIRouter
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+import asyncio
 import os
 import logging
 from pathlib import Path
@@ -13,12 +14,17 @@ from datetime import datetime, timezone
 from database import db
 
 # Import services
-from services.unopim_connector import UopimConnector
+from services.unopim_connector import UopimConnector, db_config_from_env
 from services.sync_engine import SyncEngine
+from services.schema_registry import SchemaRegistry
 from services.graph_builder import GraphBuilder
+from services.realtime import GraphUpdateHub
+from services.sync_scheduler import SyncScheduler
+from services.sync_metrics import SyncMetrics
+from services.change_feed import ChangeFeed
 
 # Import routes
-from routes import products, graph, webhooks, topicos
+from routes import products, graph, webhooks, topicos, metrics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -27,6 +33,10 @@ load_dotenv(ROOT_DIR / '.env')
 unopim_connector = None
 sync_engine = None
 graph_builder = None
+graph_updates = None
+sync_scheduler = None
+change_feed = None
+sync_resume_task = None
 
 # Create the main app
 app = FastAPI(
@@ -61,6 +71,7 @@ async def root():
             "products": "/api/products",
             "graph": "/api/graph",
             "webhooks": "/api/webhooks",
+            "metrics": "/api/metrics",
             "topicos": "/api/topicos"
         }
     }
@@ -93,7 +104,7 @@ async def get_status_checks():
 @app.on_event("startup")
 async def startup_event():
     """Initialize database and services on startup"""
-    global unopim_connector, sync_engine, graph_builder
+    global unopim_connector, sync_engine, graph_builder, graph_updates, sync_scheduler, change_feed, sync_resume_task
     
     logger = logging.getLogger(__name__)
     logger.info("Starting application...")
@@ -103,23 +114,77 @@ async def startup_event():
     logger.info("MySQL connection established")
     
     # Initialize services
-    unopim_connector = UopimConnector()
+    # Unopim database when UNOPIM_DB_TYPE is set, mock data otherwise
+    unopim_connector = UopimConnector(db_config_from_env())
     await unopim_connector.connect()
     
-    sync_engine = SyncEngine(db)
-    graph_builder = GraphBuilder(db)
+    schema_registry = SchemaRegistry(db)
+    sync_metrics = SyncMetrics()
+    sync_engine = SyncEngine(
+        db,
+        batch_size=int(os.environ.get('SYNC_BATCH_SIZE', 500)),
+        schema_registry=schema_registry,
+        checksum_workers=int(os.environ.get('SYNC_CHECKSUM_WORKERS', 2)),
+        transform_workers=int(os.environ.get('SYNC_TRANSFORM_WORKERS', 2)),
+        write_workers=int(os.environ.get('SYNC_WRITE_WORKERS', 2)),
+        db_concurrency=int(os.environ.get('SYNC_DB_CONCURRENCY', 4)),
+        metrics=sync_metrics
+    )
+    await webhooks.load_attribute_metadata(sync_engine, unopim_connector)
+    # Build the category index on first start; syncs keep it current
+    await webhooks.refresh_category_index(sync_engine, unopim_connector, missing_only=True)
+    layout_seed = os.environ.get('GRAPH_LAYOUT_SEED', '0')
+    graph_builder = GraphBuilder(
+        db,
+        layout_strategy=os.environ.get('GRAPH_LAYOUT_STRATEGY', 'auto'),
+        theta=float(os.environ.get('GRAPH_LAYOUT_THETA', 0.8)),
+        barnes_hut_threshold=int(os.environ.get('GRAPH_BARNES_HUT_THRESHOLD', 1500)),
+        layout_seed=int(layout_seed) if layout_seed else None
+    )
+    graph_updates = GraphUpdateHub(
+        queue_size=int(os.environ.get('GRAPH_WS_QUEUE_SIZE', 64)),
+        send_timeout=float(os.environ.get('GRAPH_WS_SEND_TIMEOUT', 5.0))
+    )
+    # Periodic reconciliation; an interval of 0 disables it
+    sync_schedule_mode = os.environ.get('SYNC_SCHEDULE_MODE', 'incremental')
+    sync_scheduler = SyncScheduler(
+        lambda: webhooks.perform_sync(db, sync_engine, unopim_connector, incremental=sync_schedule_mode == 'incremental'),
+        interval=float(os.environ.get('SYNC_SCHEDULE_INTERVAL', 0))
+    )
+    # Tails the Unopim change outbox; an interval of 0 disables it
+    change_feed = ChangeFeed(
+        unopim_connector,
+        lambda upserted, deleted: webhooks.apply_product_changes(db, sync_engine, unopim_connector, upserted, deleted),
+        load_position=lambda: db.find_cdc_position("products"),
+        save_position=lambda position: db.save_cdc_position("products", position),
+        batch_size=int(os.environ.get('UNOPIM_CDC_BATCH_SIZE', 500)),
+        poll_interval=float(os.environ.get('UNOPIM_CDC_INTERVAL', 0))
+    )
     
     # Setup feature routes with dependencies
     products_router = products.setup_routes(db, sync_engine, graph_builder)
-    graph_router = graph.setup_routes(db, sync_engine, graph_builder)
-    webhooks_router = webhooks.setup_routes(db, sync_engine, graph_builder, unopim_connector)
+    graph_router = graph.setup_routes(db, sync_engine, graph_builder, graph_updates)
+    webhooks_router = webhooks.setup_routes(db, sync_engine, graph_builder, unopim_connector, graph_updates)
     topicos_router = topicos.setup_routes(db, sync_engine, graph_builder)
+    metrics_router = metrics.setup_routes(sync_metrics)
     
     # Include all routers
     api_router.include_router(products_router)
     api_router.include_router(graph_router)
     api_router.include_router(webhooks_router)
     api_router.include_router(topicos_router)
+    api_router.include_router(metrics_router)
+    
+    # A sync interrupted by a restart continues from its last checkpoint
+    sync_resume_task = asyncio.create_task(
+        webhooks.resume_interrupted_sync(
+            db, sync_engine, unopim_connector,
+            # A running sync whose heartbeat is older than this is resumed by another worker
+            lease_seconds=float(os.environ.get('SYNC_LEASE_SECONDS', 600))
+        )
+    )
+    sync_scheduler.start()
+    change_feed.start()
     
     logger.info("All services initialized successfully")
 
@@ -127,6 +192,14 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    if sync_scheduler:
+        await sync_scheduler.stop()
+    if change_feed:
+        await change_feed.stop()
+    if graph_updates:
+        await graph_updates.close()
+    if unopim_connector:
+        await unopim_connector.close()
     await db.close()
 
 
@@ -0,0 +1,180 @@
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Iterable, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+CATALOG_STATE_NAME = "catalog"
+
+
+def catalog_fingerprint(unopim_id: Any, checksum: Optional[str], status: Optional[str]) -> int:
+    """64-bit unsigned fingerprint of one product's synced state"""
+    token = f"{unopim_id}:{checksum}:{status}"
+    digest = hashlib.md5(token.encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class CatalogGeneration:
+    """
+    Catalog generation derived from product checksums
+
+    The generation is the XOR of every product's (unopim_id, checksum, status)
+    fingerprint, so identical catalog states always share a generation no
+    matter how they were reached. SyncEngine applies the delta with an atomic
+    UPDATE ... SET generation = generation ^ delta; readers fetch a single row.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def current(self) -> int:
+        """Return the current generation, recomputing it if it was never stored"""
+        generation = await self.db.get_catalog_generation(CATALOG_STATE_NAME)
+        if generation is not None:
+            return generation
+        return await self.recompute()
+
+    async def recompute(self) -> int:
+        """Rebuild the generation from a projected scan of product checksums"""
+        generation = 0
+        for product in await self.db.find_product_fingerprints():
+            generation ^= catalog_fingerprint(
+                product.get('unopim_id'), product.get('checksum'), product.get('status')
+            )
+
+        await self.db.set_catalog_generation(generation, CATALOG_STATE_NAME)
+        logger.info(f"Catalog generation recomputed: {generation}")
+        return generation
+
+    async def apply(self, previous: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]):
+        """Swap a product's old fingerprint for its new one"""
+        await self.apply_many([(previous, current)])
+
+    async def apply_many(self, changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+        """Apply the (previous, current) swaps of a whole batch in a single update"""
+        delta = 0
+        for previous, current in changes:
+            for product in (previous, current):
+                if product:
+                    delta ^= catalog_fingerprint(
+                        product.get('unopim_id'), product.get('checksum'), product.get('status')
+                    )
+        if delta == 0:
+            return
+
+        # A missing state row is rebuilt from a full scan on read
+        await self.db.xor_catalog_generation(delta, CATALOG_STATE_NAME)
+
+
+def canonical_json(data: Any) -> bytes:
+    """Compact, key-sorted JSON so equal graphs serialize to equal bytes"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), default=str).encode()
+
+
+class GraphSnapshot:
+    """A laid-out graph together with its canonical serialization and ETag"""
+
+    def __init__(self, generation: int, payload: bytes):
+        self.generation = generation
+        self.payload = payload
+        self.etag = f'"{hashlib.md5(payload).hexdigest()}"'
+        self.graph: Dict[str, Any] = json.loads(payload)
+
+    @classmethod
+    def from_graph(cls, generation: int, graph: Dict[str, Any]) -> 'GraphSnapshot':
+        return cls(generation, canonical_json(graph))
+
+
+class GraphSnapshotCache:
+    """
+    Two-level (memory + database) cache of the laid-out graph
+
+    Snapshots are keyed by the catalog generation, so a read only costs one
+    small lookup until a sync changes product data. Clusters are stored next
+    to the compressed payload and can be served without loading the graph.
+    The canonical JSON payload is kept in memory so identical snapshots are
+    served as identical bytes with a content ETag.
+    """
+
+    def __init__(self, db, catalog: CatalogGeneration, name: str = "complete"):
+        self.db = db
+        self.catalog = catalog
+        self.name = name
+        self._snapshot: Optional[GraphSnapshot] = None
+        self._lock = asyncio.Lock()
+
+    async def get_snapshot(self, builder: Callable[[], Awaitable[Dict[str, Any]]]) -> GraphSnapshot:
+        """Return the snapshot for the current generation, building it on a miss"""
+        generation = await self.catalog.current()
+        if self._snapshot is not None and self._snapshot.generation == generation:
+            return self._snapshot
+
+        async with self._lock:
+            if self._snapshot is not None and self._snapshot.generation == generation:
+                return self._snapshot
+
+            snapshot = await self._load(generation)
+            if snapshot is None:
+                logger.info(f"Graph snapshot miss for generation {generation}, rebuilding")
+                snapshot = GraphSnapshot.from_graph(generation, await builder())
+                await self._save(snapshot)
+
+            self._snapshot = snapshot
+            return snapshot
+
+    async def get_graph(self, builder: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Return the graph for the current generation, building it on a miss"""
+        snapshot = await self.get_snapshot(builder)
+        return snapshot.graph
+
+    async def get_clusters(self, builder: Callable[[], Awaitable[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Return clusters for the current generation without loading the full payload"""
+        generation = await self.catalog.current()
+        if self._snapshot is not None and self._snapshot.generation == generation:
+            return self._snapshot.graph['clusters']
+
+        clusters = await self._load_clusters(generation)
+        if clusters is not None:
+            return clusters
+
+        graph = await self.get_graph(builder)
+        return graph['clusters']
+
+    async def latest(self) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        """Return the most recent snapshot and its generation, whatever the current one is"""
+        snapshot = self._snapshot or await self._load()
+        if snapshot is None:
+            return None, None
+        return snapshot.generation, snapshot.graph
+
+    async def store(self, generation: int, graph: Dict[str, Any]):
+        """Install a graph produced outside the cache (e.g. an incremental update)"""
+        snapshot = GraphSnapshot.from_graph(generation, graph)
+        async with self._lock:
+            self._snapshot = snapshot
+        await self._save(snapshot)
+
+    def invalidate(self):
+        """Drop the in-memory snapshot"""
+        self._snapshot = None
+
+    async def _load(self, generation: Optional[int] = None) -> Optional[GraphSnapshot]:
+        snapshot = await self.db.find_graph_snapshot(self.name, generation, columns="generation, payload")
+        if not snapshot:
+            return None
+        return GraphSnapshot(int(snapshot['generation']), zlib.decompress(snapshot['payload']))
+
+    async def _load_clusters(self, generation: int) -> Optional[List[Dict[str, Any]]]:
+        snapshot = await self.db.find_graph_snapshot(self.name, generation, columns="clusters")
+        if not snapshot or not snapshot['clusters']:
+            return None
+        return json.loads(snapshot['clusters'])
+
+    async def _save(self, snapshot: GraphSnapshot):
+        clusters = canonical_json(snapshot.graph['clusters']).decode()
+        await self.db.save_graph_snapshot(
+            self.name, snapshot.generation, zlib.compress(snapshot.payload), clusters
+        )
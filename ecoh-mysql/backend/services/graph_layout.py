@@ -0,0 +1,348 @@
+from typing import Dict, Any, List, Optional
+import hashlib
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the number of float64 elements materialized per repulsion
+# block (rows x nodes x 3). Keeps peak memory around 32MB for any catalog size.
+REPULSION_BLOCK_ELEMENTS = 4_000_000
+
+LAYOUT_STRATEGIES = ("exact", "barnes_hut", "auto")
+
+# Bump when the simulation changes in a way that moves nodes for the same input
+LAYOUT_ALGORITHM_VERSION = 1
+
+# Coordinates are rounded when written back so identical runs serialize identically
+POSITION_DECIMALS = 4
+
+# Octant offsets indexed by the 3-bit code (x > cx) | (y > cy) << 1 | (z > cz) << 2
+OCTANT_OFFSETS = np.array(
+    [[(code >> axis) & 1 for axis in range(3)] for code in range(8)],
+    dtype=np.float64
+) * 2.0 - 1.0
+
+
+class Octree:
+    """
+    Flat-array octree over a point cloud for Barnes-Hut approximation
+
+    Built level by level with vectorized partitioning: every cell stores its
+    center, half-width, point count (mass), center of mass and the indices
+    of its eight children (-1 when absent). Each point ends in exactly one
+    leaf, recorded in ``leaf_of``.
+    """
+
+    def __init__(self, positions: np.ndarray, max_depth: int = 24):
+        n = len(positions)
+        lo = positions.min(axis=0)
+        hi = positions.max(axis=0)
+        half = float(max((hi - lo).max() / 2.0, 1e-9)) * 1.0001
+
+        centers = [((lo + hi) / 2.0)[np.newaxis, :]]
+        halves = [np.array([half])]
+        children = [np.full((1, 8), -1, dtype=np.int64)]
+        cell_count = 1
+
+        # (point, cell) membership for every level, used for mass aggregation
+        member_points = [np.arange(n)]
+        member_cells = [np.zeros(n, dtype=np.int64)]
+
+        leaf_of = np.zeros(n, dtype=np.int64)
+        active = np.arange(n)
+
+        for _ in range(max_depth):
+            counts = np.bincount(leaf_of[active], minlength=cell_count)
+            active = active[counts[leaf_of[active]] > 1]
+            if len(active) == 0:
+                break
+
+            all_centers = np.concatenate(centers)
+            all_halves = np.concatenate(halves)
+            parent = leaf_of[active]
+            above = positions[active] > all_centers[parent]
+            above = above.astype(np.int64)
+            octant = above[:, 0] | (above[:, 1] << 1) | (above[:, 2] << 2)
+
+            keys, inverse = np.unique(parent * 8 + octant, return_inverse=True)
+            new_ids = cell_count + np.arange(len(keys))
+            key_parent = keys // 8
+            key_octant = keys % 8
+            child_half = all_halves[key_parent] / 2.0
+
+            centers.append(all_centers[key_parent] + OCTANT_OFFSETS[key_octant] * child_half[:, np.newaxis])
+            halves.append(child_half)
+            children.append(np.full((len(keys), 8), -1, dtype=np.int64))
+            all_children = np.concatenate(children)
+            all_children[key_parent, key_octant] = new_ids
+            children = [all_children]
+            cell_count += len(keys)
+
+            leaf_of[active] = new_ids[inverse.ravel()]
+            member_points.append(active)
+            member_cells.append(leaf_of[active].copy())
+
+        self.center = np.concatenate(centers)
+        self.half = np.concatenate(halves)
+        self.children = np.concatenate(children)
+        self.leaf_of = leaf_of
+
+        points = np.concatenate(member_points)
+        cells = np.concatenate(member_cells)
+        self.mass = np.bincount(cells, minlength=cell_count).astype(np.float64)
+        self.center_of_mass = np.stack([
+            np.bincount(cells, weights=positions[points, axis], minlength=cell_count)
+            for axis in range(3)
+        ], axis=1) / np.maximum(self.mass, 1.0)[:, np.newaxis]
+        self.is_leaf = (self.children < 0).all(axis=1)
+
+    @property
+    def cell_count(self) -> int:
+        return len(self.half)
+
+
+class ForceLayout:
+    """
+    Force-directed 3D layout over contiguous NumPy arrays
+
+    Positions, forces and edge endpoints are kept as (n, 3) / (m,) arrays and
+    every iteration is computed with batched array operations. Node dicts are
+    only read once to build the arrays and written back once at the end.
+    """
+
+    def __init__(
+        self,
+        repulsion: float = 15.0,
+        attraction: float = 0.1,
+        damping: float = 0.85,
+        iterations: int = 100,
+        strategy: str = "auto",
+        theta: float = 0.8,
+        barnes_hut_threshold: int = 1500,
+        seed: Optional[int] = None
+    ):
+        """
+        With a seed the layout is deterministic: initial positions are derived
+        from a hash of (seed, node id), so identical inputs give identical
+        coordinates across processes and rebuilds. Without one they are random.
+        """
+        if strategy not in LAYOUT_STRATEGIES:
+            raise ValueError(f"Unknown layout strategy: {strategy}")
+
+        self.repulsion = repulsion
+        self.attraction = attraction
+        self.damping = damping
+        self.iterations = iterations
+        self.strategy = strategy
+        self.theta = theta
+        self.barnes_hut_threshold = barnes_hut_threshold
+        self.seed = seed
+
+    @property
+    def version(self) -> str:
+        """Identifier of the layout algorithm and parameters"""
+        params = json.dumps({
+            "algorithm": LAYOUT_ALGORITHM_VERSION,
+            "repulsion": self.repulsion,
+            "attraction": self.attraction,
+            "damping": self.damping,
+            "iterations": self.iterations,
+            "strategy": self.strategy,
+            "theta": self.theta,
+            "barnes_hut_threshold": self.barnes_hut_threshold,
+            "seed": self.seed
+        }, sort_keys=True)
+        return f"fl{LAYOUT_ALGORITHM_VERSION}-{hashlib.md5(params.encode()).hexdigest()[:10]}"
+
+    def describe(self, node_count: int) -> Dict[str, Any]:
+        """Layout metadata returned with the graph"""
+        return {
+            "version": self.version,
+            "seed": self.seed,
+            "strategy": self.resolve_strategy(node_count),
+            "deterministic": self.seed is not None
+        }
+
+    def resolve_strategy(self, node_count: int) -> str:
+        """Pick the repulsion strategy for a graph of the given size"""
+        if self.strategy != "auto":
+            return self.strategy
+        return "barnes_hut" if node_count > self.barnes_hut_threshold else "exact"
+
+    def apply(self, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]],
+              iterations: Optional[int] = None):
+        """Lay out node dicts in-place (x, y, z keys)"""
+        if not nodes:
+            return
+
+        node_indices = {node['id']: i for i, node in enumerate(nodes)}
+        edge_index = self.build_edge_index(node_indices, edges)
+        positions = self.initial_positions([node['id'] for node in nodes])
+
+        positions = self.run(positions, edge_index, iterations)
+        self.write_positions(nodes, positions)
+
+    def initial_positions(self, node_ids: List[str]) -> np.ndarray:
+        """Seed positions in the [-10, 10] cube, hashed per node id when seeded"""
+        if self.seed is None:
+            return np.random.uniform(-10, 10, size=(len(node_ids), 3))
+        return np.array([self._hashed_unit(node_id) for node_id in node_ids]).reshape(-1, 3) * 20.0 - 10.0
+
+    def jitter(self, node_id: str, spread: float) -> np.ndarray:
+        """Offset in [-spread, spread]^3, stable per node id when seeded"""
+        if self.seed is None:
+            return np.random.uniform(-spread, spread, size=3)
+        return (self._hashed_unit(f"jitter:{node_id}") * 2.0 - 1.0) * spread
+
+    def _hashed_unit(self, key: str) -> np.ndarray:
+        """Three values in [0, 1) derived from (seed, key)"""
+        digest = hashlib.blake2b(f"{self.seed}:{key}".encode(), digest_size=12).digest()
+        return np.frombuffer(digest, dtype='>u4').astype(np.float64) / 2.0 ** 32
+
+    def build_edge_index(self, node_indices: Dict[str, int], edges: List[Dict[str, Any]]) -> np.ndarray:
+        """Convert edge dicts to an (m, 2) array of node indices, skipping dangling edges"""
+        pairs = [
+            (node_indices[edge['source']], node_indices[edge['target']])
+            for edge in edges
+            if edge['source'] in node_indices and edge['target'] in node_indices
+        ]
+        if not pairs:
+            return np.empty((0, 2), dtype=np.int64)
+        return np.asarray(pairs, dtype=np.int64)
+
+    def run(self, positions: np.ndarray, edge_index: np.ndarray,
+            iterations: Optional[int] = None) -> np.ndarray:
+        """Run the force simulation and return the final (n, 3) positions"""
+        positions = np.array(positions, dtype=np.float64)
+        iterations = self.iterations if iterations is None else iterations
+
+        if self.resolve_strategy(len(positions)) == "barnes_hut":
+            repulsion_forces = self.barnes_hut_repulsion_forces
+        else:
+            repulsion_forces = self.repulsion_forces
+
+        for _ in range(iterations):
+            forces = repulsion_forces(positions)
+            forces += self.attraction_forces(positions, edge_index)
+            positions += forces * self.damping
+
+        return positions
+
+    def repulsion_forces(self, positions: np.ndarray) -> np.ndarray:
+        """Exact all-pairs repulsion, evaluated in row blocks to bound memory"""
+        n = len(positions)
+        forces = np.zeros_like(positions)
+        block = max(1, REPULSION_BLOCK_ELEMENTS // max(1, n * 3))
+
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            delta = positions[np.newaxis, :, :] - positions[start:stop, np.newaxis, :]
+            dist = np.sqrt(np.einsum('ijk,ijk->ij', delta, delta)) + 0.01
+            # (delta / dist) * repulsion / dist^2; the self pair has delta == 0
+            coef = self.repulsion / (dist * dist * dist)
+            forces[start:stop] -= np.einsum('ijk,ij->ik', delta, coef)
+
+        return forces
+
+    def relax(self, positions: np.ndarray, edge_index: np.ndarray, movable: np.ndarray,
+              iterations: int = 25) -> np.ndarray:
+        """
+        Local relaxation around a set of movable nodes
+
+        Only rows listed in ``movable`` are updated. Forces are computed inside
+        the region made of the movable nodes and their direct neighbours, so the
+        cost depends on the size of that neighbourhood, not on the whole graph.
+        """
+        positions = np.array(positions, dtype=np.float64)
+        movable = np.unique(np.asarray(movable, dtype=np.int64))
+        if len(movable) == 0:
+            return positions
+
+        if len(edge_index):
+            touching = np.isin(edge_index[:, 0], movable) | np.isin(edge_index[:, 1], movable)
+            local_edges = edge_index[touching]
+        else:
+            local_edges = edge_index
+        region = np.union1d(movable, local_edges.ravel())
+
+        sub_positions = positions[region]
+        sub_edges = np.searchsorted(region, local_edges)
+        is_movable = np.isin(region, movable)
+
+        for _ in range(iterations):
+            forces = self.repulsion_forces(sub_positions)
+            forces += self.attraction_forces(sub_positions, sub_edges)
+            sub_positions[is_movable] += forces[is_movable] * self.damping
+
+        positions[region] = sub_positions
+        return positions
+
+    def barnes_hut_repulsion_forces(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Barnes-Hut approximated repulsion, O(n log n) per iteration
+
+        A cell is treated as a single body at its center of mass when
+        (cell width / distance) < theta. The traversal is level-synchronous:
+        all (point, cell) pairs of a depth are tested in one batch and only
+        rejected pairs are expanded into their children.
+        """
+        n = len(positions)
+        forces = np.zeros_like(positions)
+        if n < 2:
+            return forces
+
+        tree = Octree(positions)
+        points = np.arange(n)
+        cells = np.zeros(n, dtype=np.int64)
+
+        while len(points):
+            delta = tree.center_of_mass[cells] - positions[points]
+            dist = np.sqrt(np.einsum('ij,ij->i', delta, delta)) + 0.01
+            leaf = tree.is_leaf[cells]
+            accept = leaf | ((2.0 * tree.half[cells]) / dist < self.theta)
+
+            # A point's own leaf holds only itself (or exact duplicates)
+            body = accept & ~(leaf & (tree.leaf_of[points] == cells))
+            if body.any():
+                coef = self.repulsion * tree.mass[cells[body]] / (dist[body] ** 3)
+                push = delta[body] * coef[:, np.newaxis]
+                for axis in range(3):
+                    forces[:, axis] -= np.bincount(points[body], weights=push[:, axis], minlength=n)
+
+            expand = ~accept
+            kids = tree.children[cells[expand]]
+            present = kids >= 0
+            points = np.repeat(points[expand], present.sum(axis=1))
+            cells = kids[present]
+
+        return forces
+
+    def attraction_forces(self, positions: np.ndarray, edge_index: np.ndarray) -> np.ndarray:
+        """Spring attraction along edges, scattered back onto both endpoints"""
+        forces = np.zeros_like(positions)
+        if len(edge_index) == 0:
+            return forces
+
+        source = edge_index[:, 0]
+        target = edge_index[:, 1]
+        delta = positions[target] - positions[source]
+        # (delta / dist) * (attraction * dist) reduces to attraction * delta
+        pull = self.attraction * delta
+
+        n = len(positions)
+        for axis in range(3):
+            forces[:, axis] += np.bincount(source, weights=pull[:, axis], minlength=n)
+            forces[:, axis] -= np.bincount(target, weights=pull[:, axis], minlength=n)
+
+        return forces
+
+    @staticmethod
+    def write_positions(nodes: List[Dict[str, Any]], positions: np.ndarray):
+        """Write the final coordinates back into the node dicts"""
+        for node, (x, y, z) in zip(nodes, positions.round(POSITION_DECIMALS).tolist()):
+            node['x'] = x
+            node['y'] = y
+            node['z'] = z
@@ -0,0 +1,42 @@
+from typing import Awaitable, Callable, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SyncScheduler:
+    """
+    Runs a sync job at a fixed interval in the background
+
+    The next run is scheduled only after the previous one finished, so runs
+    never overlap. A failing run is logged and does not stop the schedule.
+    """
+
+    def __init__(self, job: Callable[[], Awaitable[None]], interval: float):
+        self.job = job
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Scheduled sync every {self.interval}s")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.job()
+            except Exception as e:
+                logger.error(f"Scheduled sync failed: {str(e)}")
@@ -0,0 +1,45 @@
+from typing import Any, Hashable, Optional
+from collections import OrderedDict
+import time
+
+
+class TTLCache:
+    """
+    Small LRU cache whose entries expire after ttl seconds
+
+    get() refreshes the recency of a live entry and drops an expired one;
+    set() evicts the least recently used entry beyond maxsize.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,119 @@
+from typing import Dict, Any, List, Optional, AsyncIterator, Sequence
+from datetime import datetime
+import asyncio
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Naive UTC datetime from a connector timestamp ("2025-11-05T23:18:58Z")"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace('Z', '').replace('T', ' '))
+
+
+class MySQLSource:
+    """
+    Pooled access to the Unopim MySQL database
+
+    Queries use %s placeholders. stream() reads the whole result on a
+    buffered cursor and releases the connection before yielding, so a slow
+    consumer never keeps a query open on the server (where an unread
+    server-side cursor runs into net_write_timeout). Callers bound the
+    result with a LIMIT and page through keyset windows.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.pool = None
+
+    async def connect(self):
+        # Only needed in database mode
+        import aiomysql
+        self._aiomysql = aiomysql
+        self.pool = await aiomysql.create_pool(
+            host=self.config.get('host', 'localhost'),
+            port=int(self.config.get('port', 3306)),
+            user=self.config.get('user', 'root'),
+            password=self.config.get('password', ''),
+            db=self.config.get('database', 'unopim'),
+            charset='utf8mb4',
+            autocommit=True,
+            minsize=1,
+            maxsize=int(self.config.get('pool_size', 5))
+        )
+        logger.info(f"Connected to Unopim MySQL database: {self.config.get('database', 'unopim')}")
+
+    async def close(self):
+        if self.pool:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    def time_param(self, value: Any) -> Optional[datetime]:
+        return parse_timestamp(value)
+
+    async def fetch_all(self, query: str, params: Sequence = ()) -> List[Dict[str, Any]]:
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(self._aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, params)
+                return list(await cursor.fetchall())
+
+    async def stream(self, query: str, params: Sequence, batch_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        rows = await self.fetch_all(query, params)
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+
+
+class SQLiteSource:
+    """
+    SQLite stand-in for the Unopim database (local tests and benchmarks)
+
+    Same interface as MySQLSource; %s placeholders are rewritten and every
+    call runs in a worker thread. SQLite steps its cursors lazily, so
+    stream() reads rows as batches are consumed.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.path = config.get('path', 'unopim.sqlite3')
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        logger.info(f"Connected to Unopim SQLite database: {self.path}")
+
+    async def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def time_param(self, value: Any) -> Optional[str]:
+        timestamp = parse_timestamp(value)
+        return timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+
+    async def _run(self, function, *args):
+        # One call at a time on the shared connection
+        async with self._lock:
+            return await asyncio.to_thread(function, *args)
+
+    async def fetch_all(self, query: str, params: Sequence = ()) -> List[Dict[str, Any]]:
+        cursor = await self._run(self.conn.execute, query.replace('%s', '?'), tuple(params))
+        return [dict(row) for row in await self._run(cursor.fetchall)]
+
+    async def stream(self, query: str, params: Sequence, batch_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        cursor = await self._run(self.conn.execute, query.replace('%s', '?'), tuple(params))
+        try:
+            while True:
+                rows = await self._run(cursor.fetchmany, batch_size)
+                if not rows:
+                    return
+                yield [dict(row) for row in rows]
+        finally:
+            cursor.close()
+
+
+SOURCES = {"mysql": MySQLSource, "sqlite": SQLiteSource}
@@ -2,6 +2,7 @@ import React, { useRef, useEffect, useState, Suspense } from 'react';
 import { Canvas, useFrame, useThree } from '@react-three/fiber';
 import * as THREE from 'three';
 import axios from 'axios';
+import { decodeGraph, GRAPH_BINARY_MEDIA_TYPE } from '../utils/graphCodec';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -68,8 +69,13 @@ function Node({ node, isSelected, onSelect, onHover }) {
 function Edge({ edge, nodes }) {
   const lineRef = useRef();
   
-  const sourceNode = nodes.find(n => n.id === edge.source);
-  const targetNode = nodes.find(n => n.id === edge.target);
+  // Binary payloads carry node indices; fall back to an id lookup otherwise
+  const sourceNode = edge.sourceIndex !== undefined
+    ? nodes[edge.sourceIndex]
+    : nodes.find(n => n.id === edge.source);
+  const targetNode = edge.targetIndex !== undefined
+    ? nodes[edge.targetIndex]
+    : nodes.find(n => n.id === edge.target);
   
   if (!sourceNode || !targetNode) return null;
   
@@ -223,9 +229,19 @@ export default function EcosystemGraph() {
   const loadGraphData = async () => {
     try {
       setLoading(true);
-      const response = await axios.get(`${API}/graph/complete`);
-      if (response.data.success) {
-        setGraphData(response.data.data);
+      // Compact binary transport: typed buffers, no per-node metadata
+      const response = await axios.get(`${API}/graph/complete`, {
+        responseType: 'arraybuffer',
+        headers: { Accept: `${GRAPH_BINARY_MEDIA_TYPE}, application/json;q=0.5` }
+      });
+      const contentType = response.headers['content-type'] || '';
+      if (contentType.includes(GRAPH_BINARY_MEDIA_TYPE)) {
+        setGraphData(decodeGraph(response.data));
+      } else {
+        const body = JSON.parse(new TextDecoder('utf-8').decode(response.data));
+        if (body.success) {
+          setGraphData(body.data);
+        }
       }
     } catch (err) {
       console.error('Error loading graph:', err);
@@ -235,8 +251,27 @@ export default function EcosystemGraph() {
     }
   };
   
-  const handleNodeSelect = (node) => {
+  const handleNodeSelect = async (node) => {
     setSelectedNode(node);
+    if (!node || node.metadata) return;
+    
+    // Metadata is not part of the binary graph; fetch it on demand
+    try {
+      const response = await axios.get(`${API}/graph/node/${encodeURIComponent(node.id)}`);
+      if (response.data.success) {
+        const details = response.data.data;
+        const relationships = details.relationships || {};
+        node.metadata = details.attributes
+          ? {
+              ...details.attributes,
+              relationship_count: Object.values(relationships).reduce((total, items) => total + items.length, 0)
+            }
+          : {};
+        setSelectedNode(current => (current?.id === node.id ? { ...node } : current));
+      }
+    } catch (err) {
+      console.error('Error loading node details:', err);
+    }
   };
   
   const handleNodeHover = (node) => {
@@ -0,0 +1,112 @@
+/**
+ * Decodificador do transporte binário do grafo (/api/graph/complete)
+ *
+ * Espelha backend/services/graph_codec.py: cabeçalho, tabela de strings,
+ * tabela de códigos, meta JSON e buffers tipados (little-endian, seções
+ * alinhadas em 4 bytes). Metadados dos nós não são enviados; busque-os em
+ * /api/graph/node/{id}.
+ */
+
+export const GRAPH_BINARY_MEDIA_TYPE = 'application/vnd.ecoh.graph+binary';
+
+const MAGIC = 'ECG1';
+const VERSION = 1;
+const HEADER_BYTES = 28;
+const NODE_VIRTUAL = 0x01;
+
+const pad = (length) => (4 - (length % 4)) % 4;
+
+const utf8 = new TextDecoder('utf-8');
+
+/**
+ * Lê uma tabela de strings (offsets uint32[count + 1] + blob UTF-8)
+ * @returns {[string[], number]} Strings e offset da próxima seção
+ */
+const readStringTable = (buffer, offset, count) => {
+  const offsets = new Uint32Array(buffer, offset, count + 1);
+  const start = offset + offsets.byteLength;
+  const blob = new Uint8Array(buffer, start, offsets[count]);
+  const strings = new Array(count);
+  for (let i = 0; i < count; i++) {
+    strings[i] = utf8.decode(blob.subarray(offsets[i], offsets[i + 1]));
+  }
+  const end = start + offsets[count];
+  return [strings, end + pad(end)];
+};
+
+/**
+ * Decodifica o payload binário do grafo
+ * @param {ArrayBuffer} buffer - Corpo da resposta
+ * @returns {object} { nodes, edges, clusters, stats, layout, positions }
+ */
+export const decodeGraph = (buffer) => {
+  const view = new DataView(buffer);
+  const magic = utf8.decode(new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC || view.getUint16(4, true) !== VERSION) {
+    throw new Error('Formato binário do grafo não suportado');
+  }
+
+  const nodeCount = view.getUint32(8, true);
+  const edgeCount = view.getUint32(12, true);
+  const stringCount = view.getUint32(16, true);
+  const codeCount = view.getUint32(20, true);
+  const metaBytes = view.getUint32(24, true);
+
+  let offset = HEADER_BYTES;
+  let strings;
+  let codes;
+  [strings, offset] = readStringTable(buffer, offset, stringCount);
+  [codes, offset] = readStringTable(buffer, offset, codeCount);
+  const meta = JSON.parse(utf8.decode(new Uint8Array(buffer, offset, metaBytes)));
+  offset += metaBytes + pad(metaBytes);
+
+  // Seções alinhadas: views tipadas sem cópia
+  const take = (Type, count) => {
+    const array = new Type(buffer, offset, count);
+    offset += array.byteLength;
+    return array;
+  };
+
+  const ids = take(Uint32Array, nodeCount);
+  const labels = take(Uint32Array, nodeCount);
+  const positions = take(Float32Array, nodeCount * 3);
+  const sizes = take(Float32Array, nodeCount);
+  const types = take(Uint16Array, nodeCount);
+  const colors = take(Uint16Array, nodeCount);
+  const flags = take(Uint8Array, nodeCount);
+  offset += pad(nodeCount * 5);
+  const sources = take(Uint32Array, edgeCount);
+  const targets = take(Uint32Array, edgeCount);
+  const strengths = take(Float32Array, edgeCount);
+  const relationships = take(Uint16Array, edgeCount);
+
+  const nodes = new Array(nodeCount);
+  for (let i = 0; i < nodeCount; i++) {
+    nodes[i] = {
+      id: strings[ids[i]],
+      label: strings[labels[i]],
+      type: codes[types[i]],
+      x: positions[i * 3],
+      y: positions[i * 3 + 1],
+      z: positions[i * 3 + 2],
+      size: sizes[i],
+      color: codes[colors[i]],
+      is_virtual: (flags[i] & NODE_VIRTUAL) !== 0,
+      index: i
+    };
+  }
+
+  const edges = new Array(edgeCount);
+  for (let i = 0; i < edgeCount; i++) {
+    edges[i] = {
+      source: nodes[sources[i]].id,
+      target: nodes[targets[i]].id,
+      sourceIndex: sources[i],
+      targetIndex: targets[i],
+      relationship_type: codes[relationships[i]],
+      strength: strengths[i]
+    };
+  }
+
+  return { ...meta, nodes, edges, positions };
+};